@@ -1,3 +1,4 @@
+from mediafile import MediaFile
 from typing import Optional, List
 from patangoma.base import BaseModel
 from patangoma.track import TrackInfo
@@ -6,8 +7,11 @@ from patangoma.track import TrackInfo
 class AlbumInfo(BaseModel):
     """Class to hold information about an album."""
 
-    def __init__(self, file_path, tracks: List[TrackInfo]):
-        super().__init__(file_path)
+    def __init__(self,
+                 file_path,
+                 tracks: List[TrackInfo],
+                 metadata: Optional[MediaFile] = None):
+        super().__init__(file_path, metadata)
         self.tracks = tracks
         self.load_metadata()
 
@@ -39,11 +43,12 @@ class AlbumInfo(BaseModel):
             print(f"Track {i}: {track.title}")
 
     def get_params(self):
-        metadata: dict = self.as_dict()
+        excluded = ("art", "title", "artist", "lyrics", "images")
+        metadata = self.view(field for field in MediaFile.fields()
+                             if field not in excluded)
 
         params = {}
         for key, value in metadata.items():
-            if value is not None and key not in ("art", "title", "artist",
-                                                 "lyrics", "images"):
+            if value is not None:
                 params[key] = value
         return params
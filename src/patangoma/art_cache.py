@@ -0,0 +1,311 @@
+"""An on-disk cache of album art, revalidated with conditional requests.
+
+Images are stored once per content hash under the PataNgoma store, and
+an index maps each URL to its image and HTTP validators. Within its
+freshness lifetime a cached URL costs no request at all; after that it
+is revalidated with If-None-Match / If-Modified-Since, and a 304 costs no
+download. Concurrent fetches of one URL share a single request. The
+cache is bounded in entries and bytes; the least recently read images
+are dropped first.
+"""
+
+import email.utils
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from patangoma.cache import EVICT_EVERY, TOUCH_INTERVAL
+from patangoma.session import get_session
+from patangoma.storage import storage
+from typing import Dict, Iterable, Optional
+
+art_dir = os.path.join(storage(), "art")
+
+# Freshness of an image whose response set no max-age; cover URLs embed
+# the image's hash, so they rarely change
+DEFAULT_MAX_AGE = 30 * 24 * 3600  # seconds
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class ArtCache:
+    """
+    Album art by URL, stored content-addressed in `path`.
+
+    Once more than `max_entries` URLs or `max_bytes` of images are stored,
+    the least recently read URLs are dropped, and with them the images no
+    other URL shares. An image replaced at its URL is dropped the same
+    way. The index is a sqlite database in WAL mode, so several processes
+    can share the cache; each thread gets its own connection.
+    """
+
+    def __init__(self,
+                 path: str = art_dir,
+                 max_age: float = DEFAULT_MAX_AGE,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.downloads = 0
+        self.revalidations = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._local = threading.local()
+        os.makedirs(os.path.join(path, "blobs"), exist_ok=True)
+        self._create_table()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """This thread's connection to the index."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, "index.db"),
+                                   timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_table(self):
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS art (
+                    url TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fresh_until REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            ''')
+            self._upgrade_table()
+            self.conn.execute(
+                'CREATE INDEX IF NOT EXISTS art_accessed ON art (accessed)')
+            self.conn.execute(
+                'CREATE INDEX IF NOT EXISTS art_digest ON art (digest)')
+
+    def _upgrade_table(self):
+        """Add the columns of the size bound to an index from before it.
+
+        Existing entries get the size of their stored image and count as
+        read now; entries whose image is gone are dropped.
+        """
+        cursor = self.conn.execute('PRAGMA table_info(art)')
+        existing = {row[1] for row in cursor.fetchall()}
+        if {"size", "accessed"} <= existing:
+            return
+        self.conn.execute(
+            'ALTER TABLE art ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+        self.conn.execute(
+            'ALTER TABLE art ADD COLUMN accessed REAL NOT NULL DEFAULT 0')
+        now = time.time()
+        for url, digest in self.conn.execute(
+                'SELECT url, digest FROM art').fetchall():
+            try:
+                size = os.path.getsize(self._blob(digest))
+            except OSError:
+                self.conn.execute('DELETE FROM art WHERE url = ?', (url, ))
+                continue
+            self.conn.execute(
+                'UPDATE art SET size = ?, accessed = ? WHERE url = ?',
+                (size, now, url))
+
+    def _blob(self, digest: str) -> str:
+        return os.path.join(self.path, "blobs", digest[:2], digest)
+
+    def _read(self, digest: str) -> Optional[bytes]:
+        try:
+            with open(self._blob(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, content: bytes) -> str:
+        """Store an image under its hash, once; return the hash."""
+        digest = hashlib.sha256(content).hexdigest()
+        file = self._blob(digest)
+        if not os.path.exists(file):
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file))
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp, file)
+        return digest
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Return the image at `url`, from the cache if it is still valid.
+
+        Callers asking for a URL already being fetched wait for that
+        request instead of sending their own. Raises on a failed request,
+        unless a stale copy is cached, which is then returned.
+        """
+        with self._lock:
+            future = self._inflight.get(url)
+            leader = future is None
+            if leader:
+                future = self._inflight[url] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            content = self._fetch(url)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(content)
+            return content
+        finally:
+            with self._lock:
+                del self._inflight[url]
+
+    def _fetch(self, url: str) -> bytes:
+        now = time.time()
+        row = self.conn.execute(
+            'SELECT digest, etag, last_modified, fresh_until, accessed '
+            'FROM art WHERE url = ?', (url, )).fetchone()
+        cached = self._read(row[0]) if row else None
+        if cached is not None and row[3] > now:
+            if now - row[4] >= TOUCH_INTERVAL:
+                with self.conn:
+                    self.conn.execute(
+                        'UPDATE art SET accessed = ? WHERE url = ?',
+                        (now, url))
+            return cached
+
+        headers = {}
+        if cached is not None:
+            if row[1]:
+                headers["If-None-Match"] = row[1]
+            if row[2]:
+                headers["If-Modified-Since"] = row[2]
+        try:
+            response = get_session().get(url, headers=headers)
+            if response.status_code != 304 or cached is None:
+                response.raise_for_status()
+        except Exception:
+            if cached is not None:
+                return cached
+            raise
+
+        if response.status_code == 304:
+            self.revalidations += 1
+            digest, content = row[0], cached
+            etag = response.headers.get("ETag", row[1])
+            last_modified = response.headers.get("Last-Modified", row[2])
+        else:
+            self.downloads += 1
+            content = response.content
+            digest = self._write(content)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO art '
+                '(url, digest, etag, last_modified, fresh_until, size, '
+                'accessed) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, digest, etag, last_modified,
+                 now + self._lifetime(response.headers), len(content), now))
+        if row and row[0] != digest:
+            self._drop_unused([row[0]])
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+        return content
+
+    def evict(self) -> int:
+        """Enforce the entry and byte bounds, least recently read first.
+
+        Returns the number of URLs removed.
+        """
+        rows = self.conn.execute(
+            'SELECT url, digest, size FROM art ORDER BY accessed DESC')
+        kept, total = 0, 0
+        digests = set()
+        dropped = []
+        for url, digest, size in rows.fetchall():
+            added = 0 if digest in digests else size
+            if kept >= self.max_entries or total + added > self.max_bytes:
+                dropped.append((url, digest))
+                continue
+            kept += 1
+            total += added
+            digests.add(digest)
+
+        with self.conn:
+            self.conn.executemany('DELETE FROM art WHERE url = ?',
+                                  [(url, ) for url, _ in dropped])
+        self._drop_unused({digest for _, digest in dropped})
+        return len(dropped)
+
+    def _drop_unused(self, digests: Iterable[str]):
+        """Delete the stored images that no URL refers to any more."""
+        for digest in digests:
+            used = self.conn.execute('SELECT 1 FROM art WHERE digest = ?',
+                                     (digest, )).fetchone()
+            if used is None:
+                try:
+                    os.unlink(self._blob(digest))
+                except FileNotFoundError:
+                    pass
+
+    def _lifetime(self, headers) -> float:
+        """How long a response stays fresh, from its caching headers."""
+        cache_control = headers.get("Cache-Control", "")
+        if "no-cache" in cache_control or "no-store" in cache_control:
+            return 0.0
+        match = _MAX_AGE.search(cache_control)
+        if match:
+            return float(match.group(1))
+        expires = headers.get("Expires")
+        if expires:
+            try:
+                date = email.utils.parsedate_to_datetime(expires)
+                return max(0.0, date.timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+        return self.max_age
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM art').fetchone()[0]
+
+
+_art_cache: Optional[ArtCache] = None
+_art_cache_lock = threading.Lock()
+
+
+def get_art_cache() -> ArtCache:
+    """Return the process-wide art cache, opening it on first use."""
+    global _art_cache
+    with _art_cache_lock:
+        if _art_cache is None:
+            _art_cache = ArtCache()
+        return _art_cache
+
+
+def configure_art_cache(**options) -> ArtCache:
+    """Replace the shared art cache, e.g. with an empty one for a benchmark.
+
+    Takes the options of ArtCache.
+    """
+    global _art_cache
+    with _art_cache_lock:
+        _art_cache = ArtCache(**options)
+        return _art_cache
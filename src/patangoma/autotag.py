@@ -0,0 +1,465 @@
+import itertools
+import logging
+import os
+from mediafile import MediaFile
+from patangoma.album import AlbumInfo
+from patangoma.data_store import DataStore
+from patangoma.discogs import DiscogsAPI
+from patangoma.filetypes import is_audio_file
+from patangoma.matching import (
+    assign_tracks,
+    match_score,
+    normalize,
+    release_score,
+)
+from patangoma.query import Query
+from patangoma.resolver import IDResolver
+from patangoma.sp import spotify_search, spotify_track_updates
+from patangoma.storage import storage
+from patangoma.track import TrackInfo
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+review_file = os.path.join(storage(), "review_queue.yaml")
+
+SOURCES = ("musicbrainz", "deezer", "spotify", "discogs")
+
+# Sources that can resolve whole releases, and those that can only do that
+ALBUM_SOURCES = ("musicbrainz", "discogs")
+ALBUM_ONLY_SOURCES = ("discogs", )
+
+# Number of Discogs search results whose full release is fetched to
+# compare tracklists
+DISCOGS_SHORTLIST = 4
+
+# How each source credits compilations, searched for albums without an
+# album artist whose tracks have several artists
+VARIOUS_ARTISTS = {"musicbrainz": "Various Artists", "discogs": "Various"}
+
+# Number of review entries buffered before they are written to disk
+REVIEW_BATCH = 100
+
+# Number of files loaded ahead so their ID lookups can be batched
+PREFETCH_BATCH = 500
+
+Candidate = Tuple[int, Dict[str, Any]]
+Result = Tuple[str, str, Optional[int]]
+
+
+class AutoTagger:
+    """
+    Tags files without prompting, using the best candidate from a provider.
+
+    A file is tagged when its top candidate scores at least `min_score`
+    (0-100). MusicBrainz reports its own search score; Deezer and Spotify
+    candidates are scored by title and artist similarity. Files that fall
+    short are added to a review queue for a later interactive pass. Files
+    carrying a provider ID or an ISRC are looked up directly instead.
+
+    In album mode (MusicBrainz or Discogs), files in one directory sharing
+    an album and album artist (or just an album, for files without an
+    album artist) are tagged together: the release is resolved
+    once, and its tracklist is matched against the files by position,
+    duration and title. Discogs has no track search, so it only works in
+    album mode.
+    """
+
+    def __init__(self,
+                 source: str = "musicbrainz",
+                 min_score: int = 90,
+                 review: Optional[DataStore] = None,
+                 dry_run: bool = False,
+                 atomic: bool = False,
+                 album: bool = False):
+        if source not in SOURCES:
+            raise ValueError(f"Unsupported source: {source}")
+        if album and source not in ALBUM_SOURCES:
+            raise ValueError(
+                "Album mode is only supported for MusicBrainz and Discogs")
+        if source in ALBUM_ONLY_SOURCES and not album:
+            raise ValueError(f"{source} is only supported in album mode")
+        self.source = source
+        self.min_score = min_score
+        self.review = review or DataStore(review_file)
+        self.dry_run = dry_run
+        self.atomic = atomic
+        self.album = album
+        self.query = Query()
+        self.resolver = IDResolver(self.query)
+        self.discogs = DiscogsAPI() if source == "discogs" else None
+        self.pending_review: List[Dict[str, Any]] = []
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def candidates(self, title: str, artist: str) -> List[Candidate]:
+        """Return (score, candidate) pairs from the source, best first."""
+        scored: List[Candidate] = []
+
+        if self.source == "musicbrainz":
+            for rec in self.query.fetch_musicbrainz_data(title, artist):
+                scored.append((int(rec.get("score") or 0), rec))
+        elif self.source == "deezer":
+            for rec in self.query.fetch_deezer_data(title, artist, None):
+                score = match_score(title, artist, rec.get("title"),
+                                    rec.get("artist", {}).get("name"))
+                scored.append((score, rec))
+        else:
+            items, _ = spotify_search(title, artist, verbose=False)
+            for rec in items:
+                credit = ", ".join(a.get("name", "") for a in rec["artists"])
+                score = match_score(title, artist, rec.get("name"), credit)
+                scored.append((score, rec))
+
+        return sorted(scored, key=lambda pair: pair[0], reverse=True)
+
+    def updates_for(self, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a candidate from the source into tag updates."""
+        if self.source == "musicbrainz":
+            return {
+                key: value
+                for key, value in candidate.items() if key != "score"
+            }
+        if self.source == "deezer":
+            return self.query.dz_api.fetch_details(candidate)
+        return spotify_track_updates(candidate)
+
+    def load(self, path: str) -> Optional[TrackInfo]:
+        """Read a file's tags, or return None if it cannot be read."""
+        if not is_audio_file(path):
+            return None
+        try:
+            return TrackInfo(path, MediaFile(path))
+        except Exception as e:
+            self.logger.error(f"Error loading metadata from {path}: {e}")
+            return None
+
+    def tag(self, path: str) -> Tuple[str, Optional[int]]:
+        """
+        Tag a single file.
+
+        Returns the outcome, one of "tagged", "queued" or "failed", and
+        the score of the best candidate if there was one.
+        """
+        track = self.load(path)
+        if track is None:
+            return "failed", None
+        return self.tag_track(track)
+
+    def tag_track(self, track: TrackInfo) -> Tuple[str, Optional[int]]:
+        """Tag a loaded file by its IDs, or from its title and artist."""
+        path = track.file
+        updates = self.resolver.resolve(track, self.source)
+        if updates:
+            return self._apply(track, updates, 100)
+
+        title, artist = track.title, track.artist
+        if self.source in ALBUM_ONLY_SOURCES:
+            self._queue(path, title, artist, "missing album or artist tag")
+            return "queued", None
+        if not (title and artist):
+            self._queue(path, title, artist, "missing title or artist tag")
+            return "queued", None
+
+        self.query.track_info = track
+        try:
+            scored = self.candidates(title, artist)
+        except Exception as e:
+            self.logger.error(f"Error searching {self.source} for {path}: {e}")
+            return "failed", None
+
+        if not scored:
+            self._queue(path, title, artist, "no match")
+            return "queued", None
+
+        best_score, best = scored[0]
+        if best_score < self.min_score:
+            self._queue(path, title, artist, "score below threshold", scored)
+            return "queued", best_score
+
+        return self._apply(track, self.updates_for(best), best_score)
+
+    def tag_album(self, tracks: List[TrackInfo]) -> Iterator[Result]:
+        """Tag the files of one album from a single release lookup."""
+        if len(tracks) == 1 and self.source not in ALBUM_ONLY_SOURCES:
+            yield (tracks[0].file, *self.tag_track(tracks[0]))
+            return
+
+        album = AlbumInfo(tracks[0].file, tracks, tracks[0].metadata)
+        try:
+            release, score = self.resolve_release(album)
+        except Exception as e:
+            self.logger.error(
+                f"Error searching releases for {album.album}: {e}")
+            for track in tracks:
+                yield track.file, "failed", None
+            return
+
+        if not release or score < self.min_score:
+            reason = "release score below threshold" if release else \
+                "no matching release"
+            for track in tracks:
+                self._queue(track.file, track.title, track.artist, reason)
+                yield track.file, "queued", score if release else None
+            return
+
+        if self.discogs:
+            entries = self.discogs.release_tracks(release)
+        else:
+            entries = self.query.mb_api.release_tracks(release)
+        items = [{
+            "title": track.title,
+            "track": track.track,
+            "disc": track.metadata.disc,
+            "length": track.metadata.length,
+        } for track in tracks]
+        assigned = {i: (j, score) for i, j, score in
+                    assign_tracks(items, entries)}
+
+        for i, track in enumerate(tracks):
+            path = track.file
+            if i not in assigned:
+                self._queue(path, track.title, track.artist,
+                            "no track left on release")
+                yield path, "queued", None
+                continue
+
+            j, score = assigned[i]
+            if score < self.min_score:
+                self._queue(path, track.title, track.artist,
+                            "track score below threshold",
+                            [(score, entries[j])])
+                yield path, "queued", score
+                continue
+
+            yield (path, *self._apply(track, entries[j], score))
+
+    def resolve_release(
+            self, album: AlbumInfo) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Find the release for an album and fetch its tracklist.
+
+        An album already tagged with a MusicBrainz album ID costs one
+        request, any other two. Returns the release and its score.
+        """
+        if self.discogs:
+            return self._resolve_discogs_release(album)
+        mb_api = self.query.mb_api
+        if album.album_id:
+            release = mb_api.get_release(album.album_id)
+            if release:
+                return release, 100
+
+        artist = self._release_artist(album)
+        best, best_score = None, 0
+        for candidate in mb_api.search_release(album.album, artist,
+                                               len(album.tracks)):
+            score = release_score(album.album, artist, len(album.tracks),
+                                  candidate.get("title"),
+                                  candidate.get("artist-credit-phrase"),
+                                  self._track_count(candidate))
+            if score > best_score:
+                best, best_score = candidate, score
+
+        if best is None or best_score < self.min_score:
+            return best, best_score
+        return mb_api.get_release(best["id"]), best_score
+
+    def _resolve_discogs_release(
+            self, album: AlbumInfo) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Find the Discogs release for an album.
+
+        Search results are ranked by title and artist, then the releases
+        of the best few are fetched concurrently and ranked again with
+        their track counts.
+        """
+        discogs = self.discogs
+        artist = self._release_artist(album)
+        ranked = []
+        for result in discogs.search_release(album.album, artist):
+            candidate_artist, candidate_title = discogs.split_title(result)
+            score = release_score(album.album, artist, len(album.tracks),
+                                  candidate_title, candidate_artist, None)
+            ranked.append((score, result))
+        ranked.sort(key=lambda pair: pair[0], reverse=True)
+        if not ranked or ranked[0][0] < self.min_score:
+            return (ranked[0][1], ranked[0][0]) if ranked else (None, 0)
+
+        shortlist = [result["id"] for _, result in ranked[:DISCOGS_SHORTLIST]]
+        best, best_score = None, 0
+        for release in discogs.get_releases(shortlist):
+            if not release:
+                continue
+            score = release_score(album.album, artist, len(album.tracks),
+                                  release.get("title"),
+                                  discogs.artist_name(release.get("artists")),
+                                  len(discogs.release_tracks(release)))
+            if score > best_score:
+                best, best_score = release, score
+        return best, best_score
+
+    def _release_artist(self, album: AlbumInfo) -> Optional[str]:
+        """The artist to search an album's release by.
+
+        Without an album artist this is the tracks' artist, or the source's
+        name for various artists when the tracks have several.
+        """
+        if album.artist:
+            return album.artist
+        artists = {normalize(track.artist) for track in album.tracks}
+        if len(artists) > 1:
+            return VARIOUS_ARTISTS[self.source]
+        return album.tracks[0].artist
+
+    def run(self, paths: Iterable[str]):
+        """Tag every file in `paths`, yielding (path, outcome, score)."""
+        if self.album:
+            results = self._run_albums(paths)
+        else:
+            results = self._run_tracks(paths)
+        try:
+            for path, outcome, score in results:
+                yield path, outcome, score
+                if len(self.pending_review) >= REVIEW_BATCH:
+                    self.flush_review()
+        finally:
+            self.flush_review()
+
+    def _run_tracks(self, paths: Iterable[str]) -> Iterator[Result]:
+        """Tag files one by one.
+
+        Only Spotify has a bulk lookup, so for Spotify files are loaded
+        PREFETCH_BATCH at a time and their ID lookups prefetched; other
+        sources stream each file straight through.
+        """
+        if self.source != "spotify":
+            for path in paths:
+                track = self.load(path)
+                if track is None:
+                    yield path, "failed", None
+                else:
+                    yield (path, *self.tag_track(track))
+            return
+
+        batch: List[str] = []
+        for path in itertools.chain(paths, [None]):
+            if path is not None:
+                batch.append(path)
+                if len(batch) < PREFETCH_BATCH:
+                    continue
+
+            tracks = {}
+            for batch_path in batch:
+                track = self.load(batch_path)
+                if track is not None:
+                    tracks[batch_path] = track
+            self.resolver.prefetch(list(tracks.values()), self.source)
+
+            for batch_path in batch:
+                if batch_path not in tracks:
+                    yield batch_path, "failed", None
+                else:
+                    yield (batch_path, *self.tag_track(tracks[batch_path]))
+            batch = []
+
+    def _run_albums(self, paths: Iterable[str]) -> Iterator[Result]:
+        """Group files by directory, album artist and album, and tag them.
+
+        Files without an album artist are grouped by directory and album
+        alone, so a compilation is not split into one group per track
+        artist. Files of one directory arrive together, so groups are
+        tagged as soon as the walk leaves their directory.
+        """
+        directory = None
+        groups: Dict[Tuple[Optional[str], str], List[TrackInfo]] = {}
+        for path in paths:
+            if os.path.dirname(path) != directory:
+                for tracks in groups.values():
+                    yield from self.tag_album(tracks)
+                directory, groups = os.path.dirname(path), {}
+
+            track = self.load(path)
+            if track is None:
+                yield path, "failed", None
+                continue
+
+            if not (track.album and (track.albumartist or track.artist)):
+                yield (path, *self.tag_track(track))
+                continue
+            albumartist = normalize(track.albumartist) \
+                if track.albumartist else None
+            key = (albumartist, normalize(track.album))
+            groups.setdefault(key, []).append(track)
+
+        for tracks in groups.values():
+            yield from self.tag_album(tracks)
+
+    def _apply(self, track: TrackInfo, updates: Dict[str, Any],
+               score: int) -> Tuple[str, Optional[int]]:
+        """Write `updates` to a file, unless this is a dry run."""
+        try:
+            track.batch_update_metadata(updates)
+            if not self.dry_run and not track.save(self.atomic):
+                return "failed", score
+        except Exception as e:
+            self.logger.error(f"Error tagging {track.file}: {e}")
+            return "failed", score
+        return "tagged", score
+
+    @staticmethod
+    def _track_count(release: Dict[str, Any]) -> Optional[int]:
+        """The number of tracks of a release search result."""
+        count = release.get("medium-track-count")
+        if count is None:
+            count = sum(int(medium.get("track-count") or 0)
+                        for medium in release.get("medium-list", []))
+        return int(count) or None
+
+    def flush_review(self):
+        """Write the queued files to the review queue."""
+        if self.pending_review:
+            self.review.extend_metadata("review", self.pending_review)
+            self.pending_review = []
+
+    def _queue(self,
+               path: str,
+               title: Optional[str],
+               artist: Optional[str],
+               reason: str,
+               scored: Optional[List[Candidate]] = None):
+        """Record a file that needs a human decision."""
+        entry: Dict[str, Any] = {
+            "path": path,
+            "title": title,
+            "artist": artist,
+            "source": self.source,
+            "reason": reason,
+        }
+        if scored:
+            entry["candidates"] = [
+                dict(self._summary(candidate), score=score)
+                for score, candidate in scored[:3]
+            ]
+        self.pending_review.append(entry)
+
+    def _summary(self, candidate: Dict[str, Any]) -> Dict[str, Any]:
+        """Reduce a candidate to the fields shown during review."""
+        if self.source == "musicbrainz":
+            return {
+                "title": candidate.get("title"),
+                "artist": candidate.get("artist"),
+                "album": candidate.get("album"),
+            }
+        if self.source == "deezer":
+            return {
+                "id": candidate.get("id"),
+                "title": candidate.get("title"),
+                "artist": candidate.get("artist", {}).get("name"),
+                "album": candidate.get("album", {}).get("title"),
+            }
+        return {
+            "id": candidate.get("id"),
+            "title": candidate.get("name"),
+            "artist": ", ".join(a.get("name", "")
+                                for a in candidate.get("artists", [])),
+            "album": candidate.get("album", {}).get("name"),
+        }
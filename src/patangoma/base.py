@@ -1,6 +1,132 @@
+from collections.abc import Mapping
 from difflib import get_close_matches
 from imgcat import imgcat
 from mediafile import MediaFile
+from typing import Any, Iterable, Iterator, Optional
+import os
+import shutil
+import tempfile
+import threading
+
+# Tags holding image data, which MediaFile decodes on every access
+BINARY_FIELDS = ("art", "images")
+
+# Buffer size used when copying audio files
+COPY_BUFSIZE = 1024 * 1024
+
+# MediaFile types whose Mutagen save() accepts a padding strategy
+PADDED_TYPES = ("mp3", "flac", "aac", "alac", "ogg", "opus", "aiff", "wav",
+                "dsf", "asf")
+
+
+class SaveStats:
+    """ Thread-safe counters of how tag saves reached the disk.
+
+    A save is "in-place" when the new tags fit in the existing padding and
+    only the tag header is rewritten, a "rewrite" when the audio data had
+    to be moved. `avoided` counts in-place saves that Mutagen's default
+    padding strategy would have turned into rewrites.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.in_place = 0
+            self.rewrites = 0
+            self.avoided = 0
+
+    def record(self, mode: Optional[str], avoided: bool = False):
+        with self._lock:
+            if mode == "in-place":
+                self.in_place += 1
+            elif mode == "rewrite":
+                self.rewrites += 1
+            if avoided:
+                self.avoided += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "in_place": self.in_place,
+                "rewrites": self.rewrites,
+                "avoided": self.avoided,
+            }
+
+
+save_stats = SaveStats()
+
+
+def _copy_owner(src: str, dst: str):
+    """Give `dst` the owner and group of `src`, where permitted."""
+    if not hasattr(os, "chown"):
+        return
+    stat = os.stat(src)
+    try:
+        os.chown(dst, stat.st_uid, stat.st_gid)
+    except PermissionError:
+        pass
+
+
+class BlobHandle:
+    """ A binary tag that is only decoded from the file when loaded. """
+
+    def __init__(self, metadata: MediaFile, field: str):
+        self.metadata = metadata
+        self.field = field
+        self._loaded = False
+        self._value = None
+
+    def load(self) -> Any:
+        """Decode and return the tag's current value."""
+        if not self._loaded:
+            self._value = getattr(self.metadata, self.field)
+            self._loaded = True
+        return self._value
+
+    def __bool__(self):
+        return bool(self.load())
+
+    def __repr__(self):
+        if not self._loaded:
+            return f"<{self.field}: not loaded>"
+        return f"<{self.field}: {type(self._value).__name__}>"
+
+
+class TagView(Mapping):
+    """ A read-only mapping that reads tags from a MediaFile on access.
+
+    Only the requested `fields` are exposed (all tags by default), each is
+    read at most once, and binary tags are returned as `BlobHandle`s.
+    """
+
+    def __init__(self, metadata: MediaFile,
+                 fields: Optional[Iterable[str]] = None):
+        known = list(MediaFile.fields())
+        if fields is None:
+            self._fields = known
+        else:
+            self._fields = [field for field in fields if field in known]
+        self._metadata = metadata
+        self._values = {}
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._values:
+            if key not in self._fields:
+                raise KeyError(key)
+            if key in BINARY_FIELDS:
+                self._values[key] = BlobHandle(self._metadata, key)
+            else:
+                self._values[key] = getattr(self._metadata, key)
+        return self._values[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._fields)
+
+    def __len__(self) -> int:
+        return len(self._fields)
 
 
 class BaseModel:
@@ -8,23 +134,46 @@ class BaseModel:
     ART_METADATA = "art"
     IMAGES_METADATA = "images"
     LYRICS_METADATA = "lyrics"
+    # Bytes of padding reserved whenever a save has to rewrite the file
+    TAG_PADDING = 64 * 1024
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, metadata: Optional[MediaFile] = None):
+        """Load the tags of `file_path`, unless already parsed as `metadata`.
+        """
         self.file = file_path
+        # Values of the fields assigned since the last save, before the
+        # first assignment
+        self._original = {}
+        # How the last save was written: "in-place", "rewrite" or None
+        self.last_save: Optional[str] = None
+        if metadata is not None:
+            self.metadata = metadata
+            return
         try:
             self.metadata = MediaFile(file_path)
         except Exception as e:
             print(f"Error loading metadata from {file_path}: {str(e)}")
             exit(1)
 
-    def as_dict(self):
-        """Return metadata as a dictionary."""
+    def as_dict(self, fields: Optional[Iterable[str]] = None):
+        """Return metadata as a dictionary, limited to `fields` if given."""
         try:
-            return dict(self.metadata.as_dict())
+            if fields is None:
+                return dict(self.metadata.as_dict())
+            known = set(MediaFile.fields())
+            return {
+                field: getattr(self.metadata, field)
+                for field in fields if field in known
+            }
         except Exception as e:
             print(f"Error converting metadata to dictionary: {str(e)}")
             return {}
 
+    def view(self, fields: Optional[Iterable[str]] = None) -> TagView:
+        """Return a lazy view of the metadata, limited to `fields` if given.
+        """
+        return TagView(self.metadata, fields)
+
     # Metadata Display Methods
     def show_all_metadata(self):
         """Print all metadata for {self.metadata.filename}."""
@@ -78,37 +227,72 @@ class BaseModel:
     def _filter_existing_metadata(self):
         """Filter non-empty."""
         return {
-            key: value
-            for key, value in self.as_dict().items() if value
+            key: value.load() if isinstance(value, BlobHandle) else value
+            for key, value in self.view().items() if value
         }
 
     def _filter_missing_metadata(self):
         """Filter missing metadata."""
         return {
             key: None
-            for key, value in self.as_dict().items() if not value
+            for key, value in self.view().items() if not value
         }
 
     # Metadata Modification Methods
-    def has_changed(self, new_meta, old_meta) -> bool:
+    def has_changed(self, new_meta=None, old_meta=None) -> bool:
         """Return True if there are changes to the metadata ignoring 'images'
+
+        Without arguments, checks the fields assigned since the last save.
         """
+        if new_meta is None and old_meta is None:
+            return bool(self.changes())
         # Excluding "images" as obj address always changes on update
         changed = any(
             key != "images" and key in old_meta and old_meta[key] != value
             for key, value in new_meta.items())
         return changed
 
+    def changes(self):
+        """Return {field: (old, new)} for fields changed since the last save.
+        """
+        changes = {}
+        for field, old in self._original.items():
+            new = getattr(self.metadata, field)
+            if self._comparable(field, old) != self._comparable(field, new):
+                changes[field] = (old, new)
+        return changes
+
+    def _comparable(self, field, value):
+        """Images are compared by content, as each read builds new objects."""
+        if field == self.IMAGES_METADATA and value:
+            return [(image.data, image.type) for image in value]
+        return value
+
+    def _set_field(self, field, value):
+        """Assign a field, remembering its value before the first change."""
+        if field not in self._original:
+            self._original[field] = getattr(self.metadata, field)
+        if value is None:
+            delattr(self.metadata, field)
+        else:
+            setattr(self.metadata, field, value)
+
     def batch_update_metadata(self, updates):
         """Updates """
         if isinstance(updates, dict):
-            self.metadata.update(updates)
+            for field in self.metadata.sorted_fields():
+                if field in updates:
+                    self._set_field(field, updates[field])
         else:
             for update in updates:
-                key, value = update.split("=")
+                key, sep, value = update.partition("=")
+                if not sep:
+                    print(f"Invalid metadata update: {update} "
+                          "(expected field=value)")
+                    continue
                 try:
                     if hasattr(self.metadata, key):
-                        setattr(self.metadata, key, value)
+                        self._set_field(key, value)
                     else:
                         possible_matches = get_close_matches(key,
                                                              dir(self.metadata),
@@ -125,7 +309,7 @@ class BaseModel:
     def single_update_metadata(self, field, value):
         try:
             if hasattr(self.metadata, field):
-                setattr(self.metadata, field, value)
+                self._set_field(field, value)
             else:
                 possible_matches = get_close_matches(field,
                                                      dir(self.metadata),
@@ -146,11 +330,114 @@ class BaseModel:
         except Exception as e:
             print(f"An error occurred while deleting metadata: {str(e)}")
 
-    def save(self):
+    def save(self,
+             atomic: bool = False,
+             verify: bool = False,
+             padding: Optional[int] = None) -> bool:
+        """Write the tags back to the file, returning True on success.
+
+        Nothing is written if no field changed since the last save. With
+        `atomic`, the tags are written to a copy of the file which then
+        replaces the original, so an interrupted save never leaves a
+        half-written file behind; `verify` additionally checks that the
+        copy still parses before it replaces the original.
+
+        Existing tag padding is always kept, so tags that still fit are
+        updated in place. When they do not, or would leave no padding at
+        all, the file is rewritten with `padding` bytes (TAG_PADDING by
+        default) reserved for later edits.
+        Whether the save was in place is recorded in `last_save` and in
+        the module's `save_stats`.
+        """
+        self.last_save = None
+        if not self.changes():
+            self._original = {}
+            return True
+
+        kwargs = {}
+        outcome = {}
+        if self.metadata.type in PADDED_TYPES:
+            reserve = self.TAG_PADDING if padding is None else padding
+            kwargs["padding"] = self._padding_strategy(reserve, outcome)
         try:
-            self.metadata.save()
+            if atomic:
+                self._save_atomic(verify, **kwargs)
+            else:
+                self.metadata.save(**kwargs)
+            self._original = {}
         except Exception as e:
             print(f"An error occurred while saving metadata: {str(e)}")
+            return False
+
+        self.last_save = outcome.get("mode")
+        save_stats.record(self.last_save, outcome.get("avoided", False))
+        return True
+
+    @staticmethod
+    def _padding_strategy(reserve: int, outcome: dict):
+        """Build a Mutagen padding callback that never shrinks padding.
+
+        Tags that would fill the padding exactly are treated like tags
+        that do not fit, so the file gets its `reserve` now rather than a
+        rewrite on its next edit. The callback notes in `outcome` whether
+        the save fits in place.
+        """
+
+        def strategy(info):
+            if info.padding > 0:
+                outcome["mode"] = "in-place"
+                outcome["avoided"] = (info.get_default_padding() !=
+                                      info.padding)
+                return info.padding
+            outcome["mode"] = "rewrite"
+            return reserve
+
+        return strategy
+
+    def _save_atomic(self, verify: bool, **kwargs):
+        """Save via a synced temporary copy renamed over the original.
+
+        The copy takes the original's permission bits, timestamps, flags
+        and extended attributes, and its owner and group where the process
+        is allowed to set them; otherwise it is owned by the current user.
+        """
+        path = os.path.abspath(self.metadata.filename)
+        directory = os.path.dirname(path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory,
+                                        prefix=".",
+                                        suffix=".patangoma.tmp")
+        try:
+            with os.fdopen(fd, "wb") as dst, open(path, "rb") as src:
+                shutil.copyfileobj(src, dst, COPY_BUFSIZE)
+            shutil.copystat(path, tmp_path)
+            _copy_owner(path, tmp_path)
+
+            # Mirrors MediaFile.save(), aimed at the copy
+            if self.metadata.id3v23:
+                id3 = self.metadata.mgfile
+                if hasattr(id3, "tags"):
+                    id3 = id3.tags
+                id3.update_to_v23()
+                kwargs["v2_version"] = 3
+            self.metadata.mgfile.save(tmp_path, **kwargs)
+
+            with open(tmp_path, "rb") as f:
+                os.fsync(f.fileno())
+            if verify:
+                MediaFile(tmp_path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        # Persist the rename itself
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
 
     # Album Artwork Methods
     def resize_album_art(self, width, height):
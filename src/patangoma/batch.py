@@ -0,0 +1,105 @@
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from mediafile import MediaFile
+from patangoma.filetypes import is_audio_file
+from patangoma.track import TrackInfo
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Default number of files read or written concurrently by batch jobs
+DEFAULT_WORKERS = 8
+
+Changes = Dict[str, Tuple[Any, Any]]
+Updates = Union[Dict[str, Any], Iterable[str]]
+
+
+def update_fields(updates: Updates) -> List[str]:
+    """Return the tag names targeted by `updates`."""
+    if isinstance(updates, dict):
+        return list(updates)
+    return [update.partition("=")[0] for update in updates]
+
+
+def invalid_fields(updates: Updates) -> List[str]:
+    """
+    Return the tag names in `updates` that MediaFile does not know, and
+    any update that is not of the form field=value, as given.
+    """
+    known = set(MediaFile.fields())
+    if isinstance(updates, dict):
+        return [field for field in updates if field not in known]
+    invalid = []
+    for update in updates:
+        field, sep, _ = update.partition("=")
+        if not sep:
+            invalid.append(update)
+        elif field not in known:
+            invalid.append(field)
+    return invalid
+
+
+def _plan_update(path: str,
+                 updates: Updates) -> Optional[Tuple[TrackInfo, Changes]]:
+    """Apply `updates` to the tags of `path` in memory and diff them."""
+    if not is_audio_file(path):
+        return None
+    try:
+        track = TrackInfo(path, MediaFile(path))
+    except Exception as e:
+        logger.error(f"Error loading metadata from {path}: {str(e)}")
+        return None
+
+    track.batch_update_metadata(updates)
+    return track, track.changes()
+
+
+def plan_updates(paths: Iterable[str],
+                 updates: Updates,
+                 workers: int = DEFAULT_WORKERS
+                 ) -> List[Tuple[TrackInfo, Changes]]:
+    """
+    Compute the effect of `updates` on every file in `paths` without saving.
+
+    Files are loaded on a pool of `workers` threads. Only files that
+    would actually change are returned, each with its
+    {field: (old, new)} changes.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        planned = executor.map(lambda path: _plan_update(path, updates), paths)
+        return [plan for plan in planned if plan and plan[1]]
+
+
+def summarize_changes(
+        plan: Iterable[Tuple[TrackInfo, Changes]]) -> Dict[str, Counter]:
+    """
+    Count how many files undergo each (old, new) transition, per field.
+
+    Values are compared by their string form, so list-valued tags can be
+    counted too.
+    """
+    summary: Dict[str, Counter] = {}
+    for _, changes in plan:
+        for field, (old, new) in changes.items():
+            summary.setdefault(field, Counter())[(str(old), str(new))] += 1
+    return summary
+
+
+def save_tracks(tracks: Iterable[TrackInfo],
+                workers: int = DEFAULT_WORKERS,
+                atomic: bool = False,
+                verify: bool = False,
+                padding: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Write the tags of `tracks` concurrently on a pool of `workers` threads.
+
+    `atomic`, `verify` and `padding` are passed on to `BaseModel.save`.
+    Returns the number of files saved and the number that failed.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(
+            executor.map(lambda track: track.save(atomic, verify, padding),
+                         tracks))
+    saved = sum(1 for result in results if result)
+    return saved, len(results) - saved
@@ -0,0 +1,359 @@
+"""Throughput benchmarks for choosing per-job settings.
+
+Run with `python -m patangoma.benchmark --help`.
+"""
+
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from mediafile import MediaFile
+from patangoma.art_cache import configure_art_cache
+from patangoma.autotag import SOURCES, AutoTagger
+from patangoma.batch import DEFAULT_WORKERS, save_tracks
+from patangoma.cache import configure_response_cache
+from patangoma.data_store import DataStore
+from patangoma.discogs import DiscogsAPI
+from patangoma.dz import DeezerAPI, configure_executor
+from patangoma.endpoints import configure_endpoint
+from patangoma.fanout import PROVIDERS, parse_duration
+from patangoma.library import iter_audio_files
+from patangoma.mb import MusicBrainzAPI
+from patangoma.mockserver import Catalogue, MockProviderServer
+from patangoma.ratelimit import configure_limiter, parse_limit
+from patangoma.resilience import ProviderError
+from patangoma.session import configure_session
+from patangoma.sp import reset_spotify_client, spotify_search
+from patangoma.track import TrackInfo
+from patangoma.transport import configure_transport
+from typing import Any, Dict, List, Optional, Tuple
+import click
+
+# Memoized provider calls, cleared so every pipeline run starts cold
+MEMOIZED = (MusicBrainzAPI.search_track, MusicBrainzAPI.search_release,
+            MusicBrainzAPI.get_release, MusicBrainzAPI.get_recording,
+            MusicBrainzAPI.search_isrc, DeezerAPI.search_track,
+            DiscogsAPI.search_release, spotify_search)
+
+
+def bench_save(sample: str,
+               copies: int = 100,
+               workers: int = DEFAULT_WORKERS,
+               atomic: bool = False,
+               verify: bool = False,
+               directory: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Time saving a one-field tag change to `copies` copies of `sample`.
+
+    The copies live in a temporary directory created under `directory`,
+    which should be on the filesystem the real job writes to.
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as tmp_dir:
+        ext = os.path.splitext(sample)[1]
+        tracks = []
+        for i in range(copies):
+            path = os.path.join(tmp_dir, f"{i}{ext}")
+            shutil.copyfile(sample, path)
+            track = TrackInfo(path, MediaFile(path))
+            track.batch_update_metadata({"comments": f"benchmark {i}"})
+            tracks.append(track)
+
+        start = time.perf_counter()
+        saved, failed = save_tracks(tracks, workers, atomic, verify)
+        elapsed = time.perf_counter() - start
+
+    size = os.path.getsize(sample) * saved
+    return {
+        "saved": saved,
+        "failed": failed,
+        "elapsed": elapsed,
+        "rate": saved / elapsed if elapsed else 0.0,
+        "mb_per_s": size / elapsed / 1e6 if elapsed else 0.0,
+    }
+
+
+def bench_pipeline(directory: str,
+                   fixtures: str,
+                   source: str = "musicbrainz",
+                   record: bool = False,
+                   album: bool = False,
+                   limits: Optional[List[Tuple[str, float, float]]] = None,
+                   **options) -> Dict[str, Any]:
+    """
+    Time autotagging `directory` as a dry run over recorded responses.
+
+    With `record`, the run goes to the live providers and saves their
+    responses under `fixtures`; otherwise it replays them, taking the
+    latency, jitter, error_rate and seed options of Transport. `limits`
+    are (provider, rate, burst) rate limits to run under. The response
+    and art caches and memoized calls start empty, so every request is
+    made.
+    """
+    transport = configure_transport("record" if record else "replay",
+                                    fixtures, **({} if record else options))
+    for provider, rate, burst in limits or []:
+        configure_limiter(provider, rate, burst)
+    for memoized in MEMOIZED:
+        memoized.invalidate()  # pyright: ignore
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            configure_response_cache(path=os.path.join(tmp_dir, "cache.db"))
+            configure_art_cache(path=os.path.join(tmp_dir, "art"))
+            review = DataStore(os.path.join(tmp_dir, "review.json"))
+            tagger = AutoTagger(source, review=review, dry_run=True,
+                                album=album)
+            outcomes: Counter = Counter()
+            start = time.perf_counter()
+            for _, outcome, _ in tagger.run(iter_audio_files(directory)):
+                outcomes[outcome] += 1
+            elapsed = time.perf_counter() - start
+    finally:
+        configure_transport(None)
+        configure_response_cache()
+        configure_art_cache()
+
+    files = sum(outcomes.values())
+    return {
+        "files": files,
+        "outcomes": dict(outcomes),
+        "elapsed": elapsed,
+        "rate": files / elapsed if elapsed else 0.0,
+        "requests": transport.requests if transport else 0,
+        "injected": transport.injected if transport else 0,
+        "fixtures": len(transport.store) if transport else 0,
+    }
+
+
+def bench_load(provider: str,
+               url: str,
+               catalogue: Catalogue,
+               operations: int = 1000,
+               workers: int = DEFAULT_WORKERS) -> Dict[str, Any]:
+    """
+    Time `operations` searches against the provider API served at `url`.
+
+    Each operation searches for a catalogue track the way the taggers do:
+    a MusicBrainz recording search, a Deezer search plus the details of
+    its first result, or a Spotify search. Caches start empty, so every
+    operation reaches the server, within the client-side rate limits.
+    """
+    configure_endpoint(provider, url)
+    configure_session(pool_size=workers)
+    reset_spotify_client()
+    for memoized in MEMOIZED:
+        memoized.invalidate()  # pyright: ignore
+
+    def search(track: Dict[str, Any]) -> Tuple[str, float]:
+        title, artist = track["title"], track["artist"]["name"]
+        start = time.perf_counter()
+        try:
+            if provider == "musicbrainz":
+                found = mb_api.search_track(title, artist)
+            elif provider == "deezer":
+                found = dz_api.search_track(title, artist, None)
+                if found:
+                    dz_api.fetch_details(found[0])
+            else:
+                found, _ = spotify_search(title, artist, verbose=False)
+            outcome = "found" if found else "empty"
+        except ProviderError:
+            outcome = "failed"
+        return outcome, time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        configure_response_cache(path=os.path.join(tmp_dir, "cache.db"))
+        configure_art_cache(path=os.path.join(tmp_dir, "art"))
+        mb_api = MusicBrainzAPI()
+        configure_executor(workers)
+        dz_api = DeezerAPI()
+        tracks = [
+            catalogue.tracks[i % len(catalogue.tracks)]
+            for i in range(operations)
+        ]
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(search, tracks))
+            elapsed = time.perf_counter() - start
+        finally:
+            configure_executor()
+            configure_response_cache()
+            configure_art_cache()
+
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "operations": len(results),
+        "outcomes": dict(Counter(outcome for outcome, _ in results)),
+        "elapsed": elapsed,
+        "rate": len(results) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+    }
+
+
+def parse_rate_limit(ctx, param, values) -> List[Tuple[str, float, float]]:
+    """Parse PROVIDER=RATE[/BURST] options."""
+    limits = []
+    for value in values:
+        provider, _, limit = value.partition("=")
+        try:
+            limits.append((provider, *parse_limit(limit)))
+        except ValueError:
+            raise click.BadParameter(
+                f"{value} (expected PROVIDER=RATE[/BURST])")
+    return limits
+
+
+def parse_latency(ctx, param, value) -> float:
+    try:
+        return parse_duration(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@click.group()
+def bench():
+    """PataNgoma throughput benchmarks."""
+
+
+@bench.command()
+@click.argument('sample',
+                type=click.Path(exists=True, dir_okay=False,
+                                resolve_path=True))
+@click.option('--copies', '-n', type=click.IntRange(min=1), default=100,
+              show_default=True, help='Number of files written per mode')
+@click.option('--workers', '-w', type=click.IntRange(min=1),
+              default=DEFAULT_WORKERS, show_default=True,
+              help='Number of concurrent writers')
+@click.option('--dir', '-d', 'directory',
+              type=click.Path(exists=True, file_okay=False),
+              help='Directory to write the copies in [default: system temp]')
+def save(sample, copies, workers, directory):
+    """Compare in-place and atomic tag writes on copies of <sample>"""
+    modes = [("in-place", False, False), ("atomic", True, False),
+             ("atomic+verify", True, True)]
+    click.echo(f"{'mode':<15}{'files/s':>10}{'MB/s':>10}{'failed':>8}")
+    for name, atomic, verify in modes:
+        stats = bench_save(sample, copies, workers, atomic, verify, directory)
+        click.echo(f"{name:<15}{stats['rate']:>10.1f}"
+                   f"{stats['mb_per_s']:>10.1f}{stats['failed']:>8}")
+
+
+@bench.command()
+@click.argument('directory',
+                type=click.Path(exists=True, file_okay=False,
+                                resolve_path=True))
+@click.option('--fixtures', '-f', required=True,
+              type=click.Path(file_okay=False),
+              help='Directory of recorded provider responses')
+@click.option('--record', is_flag=True, default=False,
+              help='Query the live providers and record their responses')
+@click.option('--source', '-s', type=click.Choice(SOURCES),
+              default='musicbrainz', show_default=True,
+              help='Metadata source')
+@click.option('--album', is_flag=True, default=False,
+              help='Tag by album (MusicBrainz and Discogs only)')
+@click.option('--latency', default='0', callback=parse_latency,
+              show_default=True,
+              help='Simulated latency per response, e.g. 800ms or 2s')
+@click.option('--jitter', default='0', callback=parse_latency,
+              show_default=True,
+              help='Random extra latency of up to this much')
+@click.option('--error-rate', type=click.FloatRange(0, 1), default=0.0,
+              show_default=True,
+              help='Share of responses replaced by a transient failure')
+@click.option('--seed', type=int, default=0, show_default=True,
+              help='Seed for latency jitter and failures')
+@click.option('--rate-limit', 'limits', multiple=True,
+              callback=parse_rate_limit, metavar='PROVIDER=RATE[/BURST]',
+              help='Rate limit a provider, in requests per second')
+def pipeline(directory, fixtures, record, source, album, latency, jitter,
+             error_rate, seed, limits):
+    """Time a dry-run autotag of <directory> over recorded responses"""
+    stats = bench_pipeline(directory, fixtures, source, record, album,
+                           limits, latency=latency, jitter=jitter,
+                           error_rate=error_rate, seed=seed)
+    outcomes = "  ".join(f"{outcome}: {count}"
+                         for outcome, count in sorted(stats["outcomes"].items()))
+    click.echo(f"{stats['files']} files in {stats['elapsed']:.2f}s "
+               f"({stats['rate']:.1f} files/s)  {outcomes}")
+    click.echo(f"Requests: {stats['requests']}  Injected failures: "
+               f"{stats['injected']}  Fixtures: {stats['fixtures']}")
+
+
+@bench.command()
+@click.option('--provider', '-p', type=click.Choice(PROVIDERS + ("all", )),
+              default='all', show_default=True,
+              help='Provider code path to load')
+@click.option('--operations', '-n', type=click.IntRange(min=1),
+              default=1000, show_default=True,
+              help='Number of searches per provider and worker count')
+@click.option('--workers', '-w', type=click.IntRange(min=1), multiple=True,
+              help='Number of concurrent searches; repeat to compare '
+              f'[default: {DEFAULT_WORKERS}]')
+@click.option('--url', help='Base URL of a running mock server '
+              '[default: start one]')
+@click.option('--tracks', type=click.IntRange(min=1), default=10000,
+              show_default=True,
+              help='Catalogue size, as given to the mock server')
+@click.option('--seed', type=int, default=0, show_default=True,
+              help='Catalogue seed, as given to the mock server')
+@click.option('--latency', default='0', callback=parse_latency,
+              show_default=True,
+              help='Median latency of the started server, e.g. 80ms')
+@click.option('--spread', type=click.FloatRange(min=0), default=0.0,
+              show_default=True,
+              help='Log-normal spread of the started server\'s latency')
+@click.option('--server-limit', 'server_limits', multiple=True,
+              callback=parse_rate_limit, metavar='PROVIDER=RATE[/BURST]',
+              help='Quota the started server enforces on a provider')
+@click.option('--rate-limit', 'limits', multiple=True,
+              callback=parse_rate_limit, metavar='PROVIDER=RATE[/BURST]',
+              help='Client-side rate limit of a provider '
+              '[default: the real quotas]')
+def load(provider, operations, workers, url, tracks, seed, latency, spread,
+         server_limits, limits):
+    """Load-test the provider code paths against the mock server"""
+    catalogue = Catalogue(tracks, seed)
+    server = None
+    if url is None:
+        server = MockProviderServer(
+            ("127.0.0.1", 0), catalogue, latency, spread,
+            {name: (rate, burst) for name, rate, burst in server_limits})
+        url = server.start().url
+    # The mock token endpoint accepts any credentials
+    os.environ.setdefault("SPOTIPY_CLIENT_ID", "mock")
+    os.environ.setdefault("SPOTIPY_CLIENT_SECRET", "mock")
+    for name, rate, burst in limits:
+        configure_limiter(name, rate, burst)
+
+    click.echo(f"{'provider':<13}{'workers':>8}{'ops/s':>9}{'req/min':>9}"
+               f"{'p50 ms':>9}{'p95 ms':>9}{'failed':>8}{'throttled':>10}")
+    try:
+        for name in PROVIDERS if provider == "all" else (provider, ):
+            for count in workers or (DEFAULT_WORKERS, ):
+                before = server.stats().get(name, {}) if server else {}
+                stats = bench_load(name, url, catalogue, operations, count)
+                after = server.stats().get(name, {}) if server else {}
+                requests = (after.get("requests", 0) -
+                            before.get("requests", 0))
+                throttled = (after.get("throttled", 0) -
+                             before.get("throttled", 0))
+                per_minute = (f"{requests / stats['elapsed'] * 60:>9.0f}"
+                              if server else f"{'-':>9}")
+                click.echo(f"{name:<13}{count:>8}{stats['rate']:>9.1f}"
+                           f"{per_minute}{stats['p50'] * 1000:>9.0f}"
+                           f"{stats['p95'] * 1000:>9.0f}"
+                           f"{stats['outcomes'].get('failed', 0):>8}"
+                           f"{throttled if server else '-':>10}")
+    finally:
+        if server:
+            server.stop()
+
+
+if __name__ == "__main__":
+    bench()
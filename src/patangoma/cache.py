@@ -0,0 +1,264 @@
+"""A persistent, process-safe cache of provider responses.
+
+Responses are stored in a sqlite database under the PataNgoma store,
+keyed by provider and a normalised form of the query, so repeat lookups
+are served locally across Query instances, runs and worker processes.
+Responses are stored as JSON, never pickled, as the database may be
+shared with other users and machines.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from patangoma.memo import is_empty
+from patangoma.storage import storage
+from typing import Any, Dict, Optional
+
+cache_db = os.path.join(storage(), "responses.db")
+
+DEFAULT_TTL = 30 * 24 * 3600  # seconds
+DEFAULT_NEGATIVE_TTL = 24 * 3600  # seconds, for no-match results
+DEFAULT_MAX_ENTRIES = 100000
+
+# Writes between two checks of the size bound
+EVICT_EVERY = 100
+
+# An entry's last-read time is only rewritten once it is this much older,
+# so that most hits are read-only and do not take the database write lock
+TOUCH_INTERVAL = 3600  # seconds
+
+# Returned by `get` when a query is not cached
+MISSING = object()
+
+
+def normalize_query(*parts: Any, **params: Any) -> str:
+    """
+    Build a cache key from query parts, insensitive to case and spacing.
+
+    `normalize_query("Hello ", "ADELE")` and
+    `normalize_query("hello", "adele")` give the same key.
+    """
+
+    def clean(value):
+        if isinstance(value, str):
+            return " ".join(value.split()).casefold()
+        return value
+
+    key = [clean(part) for part in parts]
+    if params:
+        key.append({name: clean(value) for name, value in params.items()})
+    return json.dumps(key, sort_keys=True, default=str)
+
+
+def _encode_value(value: Any) -> Any:
+    """Tag dates and times for JSON, which has no type for them."""
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__date__": value.isoformat()}
+    raise TypeError(f"Cannot cache a {type(value).__name__}")
+
+
+def _decode_value(obj: Dict[str, Any]) -> Any:
+    """Restore the dates and times tagged by `_encode_value`."""
+    if len(obj) == 1:
+        if "__datetime__" in obj:
+            return datetime.datetime.fromisoformat(obj["__datetime__"])
+        if "__date__" in obj:
+            return datetime.date.fromisoformat(obj["__date__"])
+    return obj
+
+
+def dumps(value: Any) -> str:
+    """Serialise a response for the cache."""
+    return json.dumps(value, default=_encode_value, separators=(",", ":"))
+
+
+def loads(text: str) -> Any:
+    """Deserialise a response stored with `dumps`."""
+    return json.loads(text, object_hook=_decode_value)
+
+
+class ResponseCache:
+    """
+    A sqlite-backed response cache with TTL and LRU eviction.
+
+    Entries expire `ttl` seconds after being stored (None keeps them until
+    evicted), and empty results, meaning no match, after `negative_ttl`.
+    Failed requests raise instead of returning, so they are never cached.
+    Once more than `max_entries` are stored, the least recently read ones
+    are dropped; read times are kept to within TOUCH_INTERVAL. Responses
+    must be JSON serialisable, dates and times aside. The database runs in
+    WAL mode, so several processes can share it; each thread gets its own
+    connection.
+    """
+
+    def __init__(self,
+                 path: str = cache_db,
+                 ttl: Optional[float] = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 negative_ttl: Optional[float] = DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._create_table()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """This thread's connection to the cache database."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_table(self):
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    provider TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires REAL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (provider, query)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE INDEX IF NOT EXISTS responses_accessed
+                ON responses (accessed)
+            ''')
+
+    def get(self, provider: str, query: str, default: Any = MISSING) -> Any:
+        """Return the cached response, or `default` if missing or expired."""
+        now = time.time()
+        row = self.conn.execute(
+            'SELECT value, expires, accessed FROM responses '
+            'WHERE provider = ? AND query = ?', (provider, query)).fetchone()
+
+        if row is None or (row[1] is not None and row[1] <= now):
+            self.misses[provider] += 1
+            return default
+        try:
+            value = loads(row[0])
+        except (TypeError, ValueError):
+            # Written by an older version, which pickled responses
+            self.misses[provider] += 1
+            return default
+
+        if now - row[2] >= TOUCH_INTERVAL:
+            with self.conn:
+                self.conn.execute(
+                    'UPDATE responses SET accessed = ? '
+                    'WHERE provider = ? AND query = ?', (now, provider, query))
+        self.hits[provider] += 1
+        return value
+
+    def set(self,
+            provider: str,
+            query: str,
+            value: Any,
+            ttl: Any = MISSING):
+        """Store a response; `ttl` overrides the default for a match."""
+        now = time.time()
+        if is_empty(value):
+            ttl = self.negative_ttl
+        elif ttl is MISSING:
+            ttl = self.ttl
+        expires = now + ttl if ttl is not None else None
+        text = dumps(value)
+
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(provider, query, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?, ?)', (provider, query, text, expires, now))
+
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries and enforce the size bound.
+
+        Returns the number of entries removed.
+        """
+        with self.conn:
+            removed = self.conn.execute(
+                'DELETE FROM responses WHERE expires IS NOT NULL '
+                'AND expires <= ?', (time.time(), )).rowcount
+            removed += self.conn.execute(
+                '''DELETE FROM responses WHERE rowid IN (
+                    SELECT rowid FROM responses ORDER BY accessed DESC
+                    LIMIT -1 OFFSET ?
+                )''', (self.max_entries, )).rowcount
+        return removed
+
+    def invalidate(self,
+                   provider: Optional[str] = None,
+                   query: Optional[str] = None) -> int:
+        """Remove one entry, a provider's entries, or everything."""
+        with self.conn:
+            if provider is None:
+                cursor = self.conn.execute('DELETE FROM responses')
+            elif query is None:
+                cursor = self.conn.execute(
+                    'DELETE FROM responses WHERE provider = ?', (provider, ))
+            else:
+                cursor = self.conn.execute(
+                    'DELETE FROM responses WHERE provider = ? AND query = ?',
+                    (provider, query))
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return this process's hit and miss counts per provider."""
+        providers = set(self.hits) | set(self.misses)
+        return {
+            provider: {
+                "hits": self.hits[provider],
+                "misses": self.misses[provider],
+            }
+            for provider in sorted(providers)
+        }
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache, opening it on first use."""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+def configure_response_cache(**options) -> ResponseCache:
+    """Replace the shared cache, e.g. with an empty one for a benchmark.
+
+    Takes the options of ResponseCache. Objects that already hold the
+    previous cache keep using it.
+    """
+    global _response_cache
+    with _response_cache_lock:
+        _response_cache = ResponseCache(**options)
+        return _response_cache
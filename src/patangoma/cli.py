@@ -6,12 +6,33 @@ from InquirerPy import inquirer
 from InquirerPy.base.control import Choice
 from InquirerPy.validator import PathValidator
 from mediafile import MediaFile
+from patangoma.autotag import (
+    ALBUM_ONLY_SOURCES,
+    ALBUM_SOURCES,
+    SOURCES,
+    AutoTagger,
+    review_file,
+)
+from patangoma.base import BaseModel, save_stats
+from patangoma.batch import (
+    DEFAULT_WORKERS,
+    invalid_fields,
+    plan_updates,
+    save_tracks,
+    summarize_changes,
+)
 from patangoma.data_store import DataStore
+from patangoma.database import FileStorage, library_db
+from patangoma.fanout import PROVIDERS, FanOutSearch, parse_duration
+from patangoma.filetypes import is_audio_file
+from patangoma.library import iter_audio_files, scan_library
 from patangoma.query import Query
+from patangoma.resolver import IDResolver
+from patangoma.resilience import ProviderError
 from patangoma.sp import spotify_search, get_updates
 from patangoma.track import TrackInfo
 from rgbprint import gradient_print, gradient_scroll, Color
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 import click
 import os
 import toml
@@ -96,17 +117,23 @@ def set_default_path():
     return music_path
 
 
-def is_valid(file):
-    """Check if file is valid."""
+def is_valid(file) -> Optional[MediaFile]:
+    """Check if file is valid.
+
+    Non-audio files are rejected by extension and magic bytes before any
+    parsing. Returns the parsed MediaFile so callers can hand it to
+    TrackInfo instead of reading the tags a second time, or None.
+    """
     if not isinstance(file, str):
         file = file[0]
     try:
-        MediaFile(file)
-        return True
+        if is_audio_file(file):
+            return MediaFile(file)
     except Exception:
-        click.secho("\nERROR: Invalid or unsupported file format, exiting\n",
-                    fg="red")
-        return False
+        pass
+    click.secho("\nERROR: Invalid or unsupported file format, exiting\n",
+                fg="red")
+    return None
 
 
 def interactive_selection(music_path):
@@ -276,8 +303,9 @@ def _submenu_search(ctx):
                                 dir_okay=False))
 def show(file_path, all_t: bool, existing: bool, missing: bool):
     """Show metadata for a media file <file_path>"""
-    if is_valid(file_path):
-        track = TrackInfo(file_path)
+    media = is_valid(file_path)
+    if media:
+        track = TrackInfo(file_path, media)
 
         if all_t:
             track.show_all_metadata()
@@ -290,37 +318,75 @@ def show(file_path, all_t: bool, existing: bool, missing: bool):
 
 
 @click.command()
-@click.argument('file_path',
-                type=click.Path(exists=True, resolve_path=True,
-                                dir_okay=False))
+@click.argument('file_path', type=click.Path(exists=True, resolve_path=True))
 @click.argument('updates', nargs=-1)
-def update(file_path, updates):
-    """Update metadata for a media file <file_path>"""
-    if is_valid(file_path):
-        track = TrackInfo(file_path)
-        md_pre_update = track.as_dict()
+@click.option('--recursive',
+              '-r',
+              is_flag=True,
+              default=False,
+              help='Update every audio file under the directory <file_path>')
+@click.option('--glob',
+              '-g',
+              'pattern',
+              help='Only update files under <file_path> matching this pattern')
+@click.option('--workers',
+              '-w',
+              type=click.IntRange(min=1),
+              default=DEFAULT_WORKERS,
+              show_default=True,
+              help='Number of files read and written concurrently')
+@click.option('--atomic',
+              is_flag=True,
+              default=False,
+              help='Write each file to a temporary copy and rename it over '
+              'the original')
+@click.option('--verify',
+              is_flag=True,
+              default=False,
+              help='With --atomic, re-read each saved file and check it')
+@click.option('--padding',
+              type=click.IntRange(min=0),
+              default=BaseModel.TAG_PADDING,
+              show_default=True,
+              help='Bytes of tag padding to reserve when a file is rewritten')
+def update(file_path, updates, recursive, pattern, workers, atomic, verify,
+           padding):
+    """Update metadata for a media file or a directory <file_path>"""
+    if os.path.isdir(file_path):
+        if not (recursive or pattern):
+            click.secho(
+                "\nERROR: Path is a directory, use --recursive or --glob\n",
+                fg="red")
+            exit(1)
+        _update_directory(file_path, updates, pattern, workers, atomic,
+                          verify, padding)
+        return
 
+    media = is_valid(file_path)
+    if media:
+        track = TrackInfo(file_path, media)
         track.batch_update_metadata(updates)
+        changes = track.changes()
 
-        if track.has_changed(track.as_dict(), md_pre_update):
+        if changes:
             click.echo(f"\nMetadata changes for {track.metadata.filename}:\n")
-            for key, value in track.as_dict().items():
-                if key != "images" and md_pre_update[key] != value:
-                    if key not in ("art", "lyrics"):
-                        click.echo(f"{key}: {md_pre_update[key]} -> {value}")
-                    elif key == "art":
-                        click.echo(f"{'-' * 10} Original {'-' * 10}\n")
-                        imgcat(md_pre_update[key], width=24, height=24)
-
-                        click.echo(f"{'-' * 10} Updated {'-' * 10}\n")
-                        imgcat(value, width=24, height=24)
-                    else:
-                        click.echo(
-                            f"{key}: changed (diff too large to display)")
+            for key, (old, value) in changes.items():
+                if key not in ("art", "images", "lyrics"):
+                    click.echo(f"{key}: {old} -> {value}")
+                elif key == "art":
+                    click.echo(f"{'-' * 10} Original {'-' * 10}\n")
+                    imgcat(old, width=24, height=24)
+
+                    click.echo(f"{'-' * 10} Updated {'-' * 10}\n")
+                    imgcat(value, width=24, height=24)
+                else:
+                    click.echo(f"{key}: changed (diff too large to display)")
 
             if click.confirm("\nDo you want to save these changes?"):
-                track.save()
-                click.echo("Changes saved.")
+                if track.save(atomic, verify, padding):
+                    click.echo(f"Changes saved ({track.last_save}).")
+                else:
+                    click.echo("Changes not saved.")
             else:
                 click.echo("Changes not saved.")
         else:
@@ -329,12 +395,60 @@ def update(file_path, updates):
         exit(1)
 
 
+def _update_directory(directory: str,
+                      updates,
+                      pattern: Optional[str],
+                      workers: int,
+                      atomic: bool = False,
+                      verify: bool = False,
+                      padding: Optional[int] = None):
+    """Apply `updates` to every matching file under `directory` at once."""
+    unknown = invalid_fields(updates)
+    if unknown:
+        click.secho(f"\nERROR: Invalid metadata field(s): {', '.join(unknown)}",
+                    fg="red")
+        exit(1)
+
+    paths = list(iter_audio_files(directory, pattern))
+    if not paths:
+        click.secho("\nNo audio files found", fg="yellow")
+        return
+
+    click.echo(f"\nReading {len(paths)} files...")
+    plan = plan_updates(paths, updates, workers)
+    if not plan:
+        click.echo("No changes to save.")
+        return
+
+    click.echo(f"\nMetadata changes for {len(plan)} of {len(paths)} files:\n")
+    for key, transitions in summarize_changes(plan).items():
+        for (old, new), count in transitions.most_common(5):
+            click.echo(f"{key}: {old} -> {new} ({count} files)")
+        if len(transitions) > 5:
+            click.echo(f"{key}: ... and {len(transitions) - 5} other changes")
+
+    if click.confirm("\nDo you want to save these changes?"):
+        save_stats.reset()
+        saved, failed = save_tracks([track for track, _ in plan], workers,
+                                    atomic, verify, padding)
+        stats = save_stats.as_dict()
+        click.echo(f"Changes saved to {saved} files.")
+        click.echo(f"In place: {stats['in_place']} "
+                   f"({stats['avoided']} rewrites avoided)  "
+                   f"Rewritten: {stats['rewrites']}")
+        if failed:
+            click.secho(f"{failed} files could not be saved.", fg="red")
+    else:
+        click.echo("Changes not saved.")
+
+
 @click.command()
 @click.argument('file_path', type=click.Path(exists=True))
 def delete(file_path):
     """Delete all metadata from the media file <file_path>"""
-    if is_valid(file_path):
-        track = TrackInfo(file_path)
+    media = is_valid(file_path)
+    if media:
+        track = TrackInfo(file_path, media)
 
         proceed = inquirer.confirm(
             message="Are you sure you want to delete all tags?",
@@ -363,8 +477,16 @@ def delete(file_path):
 @click.argument('file_path',
                 type=click.Path(exists=True, resolve_path=True,
                                 dir_okay=False))
-@click.option('--source', '-s', help='Source service to use for search')
-def search(ctx, file_path, source):
+@click.option('--source',
+              '-s',
+              help='Source service to use for search, or "all" to search '
+              'every service at once')
+@click.option('--deadline',
+              '-d',
+              callback=lambda ctx, param, value: parse_deadline(value),
+              help='Show the results that arrived within this time, e.g. '
+              '800ms or 2s; slower services can be waited for afterwards')
+def search(ctx, file_path, source, deadline):
     """
     Search for music information using the provided audio file.
 
@@ -372,9 +494,10 @@ def search(ctx, file_path, source):
     The function searches using `artist` and `title` tags obtained from the music file.
     If either tag is missing, the user is prompted to provide them.
     """
-    if is_valid(file_path):
-        track = TrackInfo(file_path)
-        source_choices = ["spotify", "musicbrainz", "deezer"]
+    media = is_valid(file_path)
+    if media:
+        track = TrackInfo(file_path, media)
+        source_choices = ["spotify", "musicbrainz", "deezer", "all"]
         source_select = inquirer.select(message="Specify a service to use:",
                                         choices=source_choices,
                                         qmark="\n> ",
@@ -386,38 +509,23 @@ def search(ctx, file_path, source):
             click.secho("\nInvalid source provided", fg="yellow")
             source = source_select.execute()
 
-        if track.title and track.artist:
-            title, artist = track.title, track.artist
-        elif track.title:
-            title = track.title
-            click.secho("\nWARNING: Music file is missing an artist tag...",
-                        fg="yellow")
-            artist = inquirer.text(message="Provide an artist name:",
-                                   qmark="\n> ",
-                                   amark="✔️ ").execute()
-        elif track.artist:
-            artist = track.artist
-            click.secho("\nMusic file is missing a title tag...", fg="yellow")
-            title = inquirer.text(message="Provide a title:",
-                                  qmark="\n> ",
-                                  amark="✔️ ").execute()
-        else:
-            click.secho("\nMusic file is missing artist and title tags...",
-                        fg="yellow")
-            artist = inquirer.text(message="Provide an artist name:",
-                                   qmark="\n> ",
-                                   amark="✔️ ").execute()
-            title = inquirer.text(message="Provide a title:",
-                                  qmark="\n> ",
-                                  amark="✔️ ").execute()
-        if source == "spotify":
-            up_fields = spotify_subsearch(title, artist)
-        elif source == "musicbrainz":
-            up_fields = mb_subsearch(track, title, artist)
-        elif source == "deezer":
-            up_fields = dz_subsearch(track, title, artist, album="")
-        else:
-            up_fields = None
+        up_fields = id_subsearch(track, source)
+        if not up_fields:
+            title, artist = search_terms(track)
+            if deadline is not None and source in PROVIDERS:
+                up_fields = fanout_subsearch(track, title, artist, (source, ),
+                                             deadline)
+            elif source == "spotify":
+                up_fields = spotify_subsearch(title, artist)
+            elif source == "musicbrainz":
+                up_fields = mb_subsearch(track, title, artist)
+            elif source == "deezer":
+                up_fields = dz_subsearch(track, title, artist, album="")
+            elif source == "all":
+                up_fields = fanout_subsearch(track, title, artist,
+                                             deadline=deadline)
+            else:
+                up_fields = None
         if up_fields:
             proceed = inquirer.confirm(
                 message=
@@ -434,8 +542,70 @@ def search(ctx, file_path, source):
         exit(1)
 
 
+def search_terms(track: TrackInfo) -> Tuple[str, str]:
+    """Return the title and artist to search for, asking for missing ones."""
+    if track.title and track.artist:
+        title, artist = track.title, track.artist
+    elif track.title:
+        title = track.title
+        click.secho("\nWARNING: Music file is missing an artist tag...",
+                    fg="yellow")
+        artist = inquirer.text(message="Provide an artist name:",
+                               qmark="\n> ",
+                               amark="✔️ ").execute()
+    elif track.artist:
+        artist = track.artist
+        click.secho("\nMusic file is missing a title tag...", fg="yellow")
+        title = inquirer.text(message="Provide a title:",
+                              qmark="\n> ",
+                              amark="✔️ ").execute()
+    else:
+        click.secho("\nMusic file is missing artist and title tags...",
+                    fg="yellow")
+        artist = inquirer.text(message="Provide an artist name:",
+                               qmark="\n> ",
+                               amark="✔️ ").execute()
+        title = inquirer.text(message="Provide a title:",
+                              qmark="\n> ",
+                              amark="✔️ ").execute()
+    return title, artist
+
+
+def id_subsearch(track: TrackInfo, source: str) -> Dict[str, Any]:
+    """Look the file up by the IDs and ISRC in its tags, before searching.
+
+    Each provider of `source` ("all" for every one) is tried in turn.
+    Returns the first provider's tag updates, or {} if no identifier
+    leads to a track.
+    """
+    resolver = IDResolver(Query(track, None))
+    if not resolver.identifiers(track):
+        return {}
+    for provider in PROVIDERS if source == "all" else (source, ):
+        updates = resolver.resolve(track, provider)
+        if updates:
+            click.secho(f"\nFound on {provider} by the IDs in the tags",
+                        fg="green")
+            return updates
+    return {}
+
+
+def parse_deadline(value: Optional[str]) -> Optional[float]:
+    """Convert a --deadline value to seconds."""
+    if value is None:
+        return None
+    try:
+        return parse_duration(value)
+    except ValueError:
+        raise click.BadParameter(f"{value} (expected e.g. 800ms or 2s)")
+
+
 def spotify_subsearch(title: str, artist: str) -> Dict[str, Any]:
-    result, parsed_result = spotify_search(title, artist)
+    try:
+        result, parsed_result = spotify_search(title, artist)
+    except ProviderError as e:
+        click.secho(f"\nError searching track on Spotify: {e}", fg="red")
+        return {}
     if result and parsed_result:
         return get_updates(result, parsed_result)
     else:
@@ -445,7 +615,11 @@ def spotify_subsearch(title: str, artist: str) -> Dict[str, Any]:
 def mb_subsearch(track: TrackInfo, title: str, artist: str) -> List[str]:
     ds = DataStore()
     query = Query(track, ds)
-    musicbrainz_data = query.fetch_musicbrainz_data(title, artist)
+    try:
+        musicbrainz_data = query.fetch_musicbrainz_data(title, artist)
+    except ProviderError as e:
+        click.secho(f"\nError searching track on MusicBrainz: {e}", fg="red")
+        return []
 
     if musicbrainz_data:
         choices = []
@@ -485,7 +659,11 @@ def dz_subsearch(track: TrackInfo, title: str, artist: str,
                  album: Optional[str]) -> Union[Dict[str, Any], List[str]]:
     ds = DataStore()
     query = Query(track, ds)
-    deezer_data = query.fetch_deezer_data(title, artist, album)
+    try:
+        deezer_data = query.fetch_deezer_data(title, artist, album)
+    except ProviderError as e:
+        click.secho(f"\nError searching track on Deezer: {e}", fg="red")
+        return []
 
     gradient_scroll("Fetching ...",
                     start_color=Color.dark_sea_green,
@@ -516,19 +694,180 @@ def dz_subsearch(track: TrackInfo, title: str, artist: str,
         if selection:
             selected_track = deezer_data[selection - 1]
 
-            track_data = query.dz_api.get_track_by_id(selected_track["id"])
-            album_data = query.dz_api.get_album_by_id(
-                selected_track["album"]["id"])
-            metadata_mapping = query.dz_api.mapData(track_data, album_data)
-
-            return metadata_mapping
+            try:
+                return query.dz_api.fetch_details(selected_track)
+            except ProviderError as e:
+                click.secho(f"\nError fetching track from Deezer: {e}",
+                            fg="red")
+                return {}
         else:
             return {}
     else:
         return []
 
 
+def fanout_subsearch(track: TrackInfo,
+                     title: str,
+                     artist: str,
+                     providers=PROVIDERS,
+                     deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Search `providers` at once, showing each one's results as they come.
+
+    With a `deadline`, the picker opens once it has passed, and providers
+    that have not answered yet can be waited for from the picker.
+    """
+    query = Query(track, None)
+    fan_out = FanOutSearch(query, providers)
+    fan_out.start(title, artist)
+    print()
+
+    timeout = deadline
+    while True:
+        for provider, found in fan_out.stream(timeout):
+            click.echo(f"  {provider}: {len(found)} candidates "
+                       f"({fan_out.elapsed[provider]:.2f}s)")
+        if fan_out.first_result is not None:
+            click.echo(f"First candidate after {fan_out.first_result:.2f}s")
+        if fan_out.pending:
+            click.secho(f"No answer yet from: {', '.join(fan_out.pending)}",
+                        fg="yellow")
+
+        candidates = fan_out.ranked()
+        choices: List[Any] = []
+        for idx, rec in enumerate(candidates, start=1):
+            length = rec.get("length")
+            duration = f"{int(length // 60)}:{int(length % 60):02}" \
+                if length else "?"
+            choices.append({
+                "name":
+                f"{idx}. Title: {rec.get('title')} - {rec.get('artist')}\n" +
+                f"       Album: {rec.get('album')} - Duration: {duration}\n" +
+                f"       Score: {rec['score']} - " +
+                f"Sources: {', '.join(rec['sources'])}",
+                "value":
+                idx,
+            })
+        if fan_out.pending:
+            choices.append(
+                Choice(0, name=f"Wait for {', '.join(fan_out.pending)}"))
+        if not choices:
+            return {}
+
+        selection = inquirer.select(message="Select a track:",
+                                    choices=choices,
+                                    qmark="\n> ",
+                                    amark="✔ ",
+                                    max_height="70%").execute()
+        if selection:
+            try:
+                return fan_out.updates_for(candidates[selection - 1])
+            except ProviderError as e:
+                click.secho(f"\nError fetching track details: {e}",
+                            fg="red")
+                return {}
+        # Give the late providers another deadline, or all the time needed;
+        # after a zero deadline, waiting means waiting for all of them
+        timeout = deadline or None
+
+
+@click.command()
+@click.argument('directory',
+                type=click.Path(exists=True, resolve_path=True,
+                                file_okay=False))
+@click.option('--workers',
+              '-w',
+              type=click.IntRange(min=1),
+              help='Number of tag reader processes [default: CPU count]')
+@click.option('--database',
+              '-d',
+              type=click.Path(dir_okay=False, resolve_path=True),
+              default=library_db,
+              show_default=True,
+              help='Library index database')
+@click.option('--full',
+              '-f',
+              is_flag=True,
+              default=False,
+              help='Re-read every file, even if unchanged since the last scan')
+def scan(directory, workers, database, full):
+    """Index the tags of every audio file under <directory>"""
+    storage = FileStorage(database)
+    try:
+        stats = scan_library(directory, storage, workers=workers, full=full)
+    finally:
+        storage.close()
+
+    click.echo(f"\nIndexed {stats['indexed']} of {stats['files']} files "
+               f"({stats['skipped']} skipped) in {stats['elapsed']:.2f}s")
+    click.echo(f"Unchanged: {stats['unchanged']}  Moved: {stats['moved']}  "
+               f"Removed: {stats['removed']}")
+    click.secho(f"{stats['rate']:.1f} files/second", fg="green")
+
+
+@click.command()
+@click.argument('directory',
+                type=click.Path(exists=True, resolve_path=True,
+                                file_okay=False))
+@click.option('--source',
+              '-s',
+              type=click.Choice(SOURCES),
+              default="musicbrainz",
+              show_default=True,
+              help='Source service to use for search')
+@click.option('--min-score',
+              '-m',
+              type=click.IntRange(0, 100),
+              default=90,
+              show_default=True,
+              help='Lowest candidate score (0-100) accepted without review')
+@click.option('--glob',
+              '-g',
+              'pattern',
+              help='Only tag files under <directory> matching this pattern')
+@click.option('--dry-run',
+              is_flag=True,
+              default=False,
+              help='Search and score, but do not write any tags')
+@click.option('--atomic',
+              is_flag=True,
+              default=False,
+              help='Write each file to a temporary copy and rename it over '
+              'the original')
+@click.option('--album',
+              is_flag=True,
+              default=False,
+              help='Tag the files of each album from one release lookup '
+              '(MusicBrainz and Discogs only)')
+def autotag(directory, source, min_score, pattern, dry_run, atomic, album):
+    """Tag every audio file under <directory> without prompting"""
+    if album and source not in ALBUM_SOURCES:
+        click.secho(
+            "\nERROR: --album is only supported with MusicBrainz and Discogs",
+            fg="red")
+        exit(1)
+    if source in ALBUM_ONLY_SOURCES and not album:
+        click.secho(f"\nERROR: {source} only supports --album", fg="red")
+        exit(1)
+    tagger = AutoTagger(source, min_score, dry_run=dry_run, atomic=atomic,
+                        album=album)
+    counts = {"tagged": 0, "queued": 0, "failed": 0}
+    colors = {"tagged": "green", "queued": "yellow", "failed": "red"}
+
+    for path, outcome, score in tagger.run(iter_audio_files(directory,
+                                                             pattern)):
+        counts[outcome] += 1
+        detail = f" (score {score})" if score is not None else ""
+        click.secho(f"{outcome:>7}: {path}{detail}", fg=colors[outcome])
+
+    click.echo(f"\nTagged: {counts['tagged']}  Queued for review: "
+               f"{counts['queued']}  Failed: {counts['failed']}")
+    if counts["queued"]:
+        click.echo(f"Review queue: {review_file}")
+
+
+cli.add_command(autotag)
 cli.add_command(delete)
+cli.add_command(scan)
 cli.add_command(search)
 cli.add_command(show)
 cli.add_command(update)
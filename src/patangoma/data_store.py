@@ -3,7 +3,8 @@ import logging
 import os
 import threading
 import yaml
-from patangoma.sp import storage
+from patangoma.storage import storage
+from typing import List
 
 storage_file = os.path.join(storage(), "mb_storage.yaml")
 
@@ -30,6 +31,20 @@ class DataStore:
             except Exception as e:
                 self.logger.error(f"Error adding metadata: {str(e)}")
 
+    def extend_metadata(self, source: str, items: List[dict]):
+        """Append several entries for a source to the stored metadata.
+
+        Unlike `add_metadata`, entries already on disk are kept and the
+        file is written once for the whole batch.
+        """
+        with self.lock:
+            try:
+                self._load_metadata()
+                self.metadata.setdefault(source, []).extend(items)
+                self._save_metadata()
+            except Exception as e:
+                self.logger.error(f"Error adding metadata: {str(e)}")
+
     def get_metadata(self, source: str):
         """Get metadata from a specific external source."""
         with self.lock:
@@ -62,6 +77,8 @@ class DataStore:
                     self.metadata = json.load(f)
                 else:  # default is yaml
                     self.metadata = yaml.safe_load(f)
+            if not self.metadata:
+                self.metadata = {}
 
     def _save_metadata(self):
         """Save metadata to the file."""
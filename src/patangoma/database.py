@@ -1,15 +1,54 @@
+import csv
+import json
+import os
 import sqlite3
+import yaml
 from patangoma.base import BaseModel
+from patangoma.storage import storage
 from patangoma.track import TrackInfo
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+library_db = os.path.join(storage(), "library.db")
+
+# Columns of the library index, one row per audio file
+INDEX_COLUMNS = {
+    "path": "TEXT UNIQUE NOT NULL",
+    "inode": "INTEGER",
+    "size": "INTEGER",
+    "mtime": "INTEGER",
+    "title": "TEXT",
+    "artist": "TEXT",
+    "albumartist": "TEXT",
+    "album": "TEXT",
+    "genre": "TEXT",
+    "year": "INTEGER",
+    "track": "INTEGER",
+    "tracktotal": "INTEGER",
+    "disc": "INTEGER",
+    "disctotal": "INTEGER",
+    "length": "REAL",
+    "bitrate": "INTEGER",
+    "format": "TEXT",
+    "isrc": "TEXT",
+    "mb_trackid": "TEXT",
+    "mb_albumid": "TEXT",
+    "comments": "TEXT",
+    "scanned_at": "REAL",
+    "unreadable": "INTEGER",
+}
 
 
 class FileStorage(BaseModel):
     """ Class to handle database operations. """
 
-    def __init__(self, database_path, track_metadata: dict):
-        """ Initialize the database connection and create the table. """
+    def __init__(self,
+                 database_path=library_db,
+                 track_metadata: Optional[dict] = None):
+        """ Initialize the database connection and create the tables. """
         self.conn = sqlite3.connect(database_path)
-        self.create_tables(track_metadata)
+        if track_metadata:
+            self.create_tables(track_metadata)
+        self.create_index_table()
 
     def create_tables(self, track_metadata):
         """ Create the database tables. """
@@ -27,6 +66,78 @@ class FileStorage(BaseModel):
         cursor.execute(table_creation_sql)
         self.conn.commit()
 
+    def create_index_table(self):
+        """ Create the library index table. """
+        columns = ', '.join(f"{key} {sql_type}"
+                            for key, sql_type in INDEX_COLUMNS.items())
+        self.conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS library (
+                id INTEGER PRIMARY KEY,
+                {columns}
+            )
+        ''')
+
+        # Bring indexes created by older versions up to date
+        cursor = self.conn.execute('PRAGMA table_info(library)')
+        existing = {row[1] for row in cursor.fetchall()}
+        for key, sql_type in INDEX_COLUMNS.items():
+            if key not in existing:
+                self.conn.execute(
+                    f'ALTER TABLE library ADD COLUMN {key} {sql_type}')
+        self.conn.commit()
+
+    def add_index_rows(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Insert or refresh library index rows in a single transaction.
+
+        Rows are keyed by `path`; columns missing from a row are stored as
+        NULL. Returns the number of rows written.
+        """
+        keys = list(INDEX_COLUMNS)
+        updates = ', '.join(f"{key} = excluded.{key}" for key in keys[1:])
+        sql = f'''
+            INSERT INTO library ({', '.join(keys)})
+            VALUES ({', '.join('?' for _ in keys)})
+            ON CONFLICT(path) DO UPDATE SET {updates}
+        '''
+        values = [[row.get(key) for key in keys] for row in rows]
+
+        with self.conn:
+            self.conn.executemany(sql, values)
+        return len(values)
+
+    def get_fingerprints(self, root: str) -> Dict[str, Tuple[int, int, int]]:
+        """
+        Return the (inode, size, mtime) fingerprint of every indexed file
+        below the directory `root`, keyed by path.
+        """
+        prefix = os.path.join(root, '')
+        cursor = self.conn.execute(
+            'SELECT path, inode, size, mtime FROM library '
+            'WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+        return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+    def move_index_rows(self, moves: Iterable[Tuple[str, str]]) -> int:
+        """ Re-point index rows from an old path to a new one. """
+        moves = [(new, old) for old, new in moves]
+        with self.conn:
+            self.conn.executemany('UPDATE library SET path = ? WHERE path = ?',
+                                  moves)
+        return len(moves)
+
+    def remove_index_rows(self, paths: Iterable[str]) -> int:
+        """ Drop the index rows of files that no longer exist. """
+        paths = [(path, ) for path in paths]
+        with self.conn:
+            self.conn.executemany('DELETE FROM library WHERE path = ?', paths)
+        return len(paths)
+
+    def count_index_rows(self) -> int:
+        """ Return the number of readable files in the library index. """
+        cursor = self.conn.execute(
+            'SELECT COUNT(*) FROM library WHERE unreadable IS NOT 1')
+        return cursor.fetchone()[0]
+
     def get_sqlite_type(self, value):
         """
         Map Python data types to SQLite data types.
@@ -89,14 +200,10 @@ class FileStorage(BaseModel):
 
     def close(self):
         """Close the database connection."""
-        self.conn.close
+        self.conn.close()
 
 
 if __name__ == '__main__':
-    import json
-    import yaml
-    import csv
-    from tags import TrackInfo
     # Add track metadata
     t = TrackInfo('../audio.mp3')
     # print(t.as_dict().keys())
@@ -0,0 +1,254 @@
+# discogs.py
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from patangoma.cache import MISSING, get_response_cache, normalize_query
+from patangoma.endpoints import get_endpoint
+from patangoma.memo import memoize
+from patangoma.ratelimit import get_limiter
+from patangoma.resilience import ProviderError, call
+from patangoma.session import get_session
+from typing import Any, Dict, List, Optional
+
+DISCOGS_URL = "https://api.discogs.com"
+USER_AGENT = ("PataNgoma/1.0 "
+              "+https://github.com/FourtyThree43/PataNgoma-AudioTagger-tool")
+
+# Search results per page, and the most pages read per search; album
+# mode only fetches the best few results, which the first page holds
+PER_PAGE = 25
+MAX_PAGES = 1
+
+# Number of release lookups in flight at once; the shared rate limiter
+# still spaces them out to Discogs' quota
+RELEASE_WORKERS = 4
+
+# Discogs counts requests over a moving window of this many seconds
+RATELIMIT_WINDOW = 60.0
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+_NAME_SUFFIX = re.compile(r"\s+\(\d+\)$")
+_POSITION = re.compile(r"^(?:(?:CD|DVD)?(\d+)[-.])?(.+)$", re.IGNORECASE)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the thread pool shared by all Discogs release lookups."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=RELEASE_WORKERS)
+        return _executor
+
+
+class DiscogsAPI:
+    """Wrapper class for the Discogs database API.
+
+    Searches are bounded to `max_pages` pages. Release details are
+    fetched concurrently through the shared session, whose rate limiter
+    keeps the whole process within Discogs' quota, and are cached by ID
+    without expiry. Searching requires a personal access token, read from
+    DISCOGS_TOKEN (or a .env file).
+
+    Attributes:
+        token (str): The personal access token, if any.
+        max_pages (int): The most search result pages read per search.
+        logger (logging.Logger): The logger instance for this class.
+    """
+
+    def __init__(self,
+                 token: Optional[str] = None,
+                 max_pages: int = MAX_PAGES):
+        load_dotenv()
+        self.token = token or os.getenv("DISCOGS_TOKEN")
+        self.base_url = get_endpoint("discogs") or DISCOGS_URL
+        self.max_pages = max_pages
+        self.cache = get_response_cache()
+        self.limiter = get_limiter("discogs")
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The module's shared pool for concurrent release lookups."""
+        return get_executor()
+
+    def _get(self, path: str, **params) -> Dict[str, Any]:
+        """Send one GET request and return its JSON body.
+
+        Discogs reports the requests left in its window; when none are
+        left, the rate limiter is held back so the next request does not
+        bounce off a 429.
+        """
+        headers = {"User-Agent": USER_AGENT}
+        if self.token:
+            headers["Authorization"] = f"Discogs token={self.token}"
+        response = get_session().get(f"{self.base_url}/{path}",
+                                     params=params,
+                                     headers=headers)
+        remaining = response.headers.get("X-Discogs-Ratelimit-Remaining")
+        limit = response.headers.get("X-Discogs-Ratelimit")
+        if self.limiter and remaining == "0" and limit:
+            self.limiter.defer(RATELIMIT_WINDOW / max(int(limit), 1))
+        response.raise_for_status()
+        return response.json()
+
+    @memoize(method=True)
+    def search_release(self,
+                       album_title: str,
+                       artist_name: str,
+                       track_count: Optional[int] = None):
+        """Search for a release on Discogs.
+
+        Args:
+            album_title (str): The title of the album to search for.
+            artist_name (str): The name of the album artist.
+            track_count (int): Unused; Discogs search results carry no
+                tracklists. Accepted for parity with MusicBrainzAPI.
+
+        Returns:
+            list: Matching releases, without their tracklists, from at
+                most `max_pages` pages of results.
+
+        Raises:
+            ProviderError: If Discogs cannot be reached or fails, or no
+                token is configured.
+        """
+        if not self.token:
+            raise ProviderError("discogs",
+                                "searching requires DISCOGS_TOKEN to be set")
+
+        results: List[Dict[str, Any]] = []
+        for page in range(1, self.max_pages + 1):
+            body = call(
+                "discogs",
+                lambda: self._get("database/search",
+                                  type="release",
+                                  release_title=album_title,
+                                  artist=artist_name,
+                                  per_page=PER_PAGE,
+                                  page=page),
+                not_found={})
+            results.extend(body.get("results", []))
+            if page >= body.get("pagination", {}).get("pages", 0):
+                break
+        return results
+
+    def get_release(self, release_id: int) -> Dict[str, Any]:
+        """Get a release with its tracklist, from the cache if possible.
+
+        Args:
+            release_id (int): The Discogs ID of the release.
+
+        Returns:
+            dict: The release, or an empty dict if there is no such release.
+
+        Raises:
+            ProviderError: If Discogs cannot be reached or fails.
+        """
+        key = normalize_query("release", release_id)
+        release = self.cache.get("discogs", key)
+        if release is MISSING:
+            release = call("discogs",
+                           lambda: self._get(f"releases/{release_id}"),
+                           not_found={})
+            self.cache.set("discogs", key, release, ttl=None)
+        return release
+
+    def get_releases(self, release_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get many releases concurrently.
+
+        Args:
+            release_ids (list): The Discogs IDs of the releases.
+
+        Returns:
+            list: The releases, in the order of `release_ids`; an empty
+                dict for each release that does not exist.
+
+        Raises:
+            ProviderError: If a lookup fails.
+        """
+        return list(self.executor.map(self.get_release, release_ids))
+
+    @staticmethod
+    def split_title(result: Dict[str, Any]) -> List[Optional[str]]:
+        """Split a search result's "Artist - Title" into artist and title.
+        """
+        artist, sep, title = (result.get("title") or "").partition(" - ")
+        return [artist, title] if sep else [None, artist]
+
+    @staticmethod
+    def artist_name(artists: List[Dict[str, Any]]) -> Optional[str]:
+        """Join an artist credit, dropping Discogs' "(2)" name suffixes."""
+        if not artists:
+            return None
+        parts = []
+        for artist in artists:
+            name = artist.get("anv") or artist.get("name", "")
+            parts.append(_NAME_SUFFIX.sub("", name))
+            join = (artist.get("join") or "").strip()
+            parts.append(f" {join} " if join not in ("", ",") else ", ")
+        return "".join(parts[:-1])
+
+    def release_tracks(self, release) -> List[Dict[str, Any]]:
+        """Map every track of a release to MediaFile tags.
+
+        Each entry also carries the track's `length` in seconds, for
+        matching; it is not a writable tag and is ignored on update.
+
+        Args:
+            release (dict): A release fetched with `get_release`.
+
+        Returns:
+            list: One dict of tags per track, in tracklist order.
+        """
+        album_artist = self.artist_name(release.get("artists", []))
+        labels = release.get("labels") or [{}]
+        tracklist = []
+        for item in release.get("tracklist", []):
+            # Index tracks group several sub-tracks under one heading
+            tracklist.extend(item.get("sub_tracks") or [item])
+        tracklist = [t for t in tracklist if t.get("type_", "track") == "track"]
+
+        entries = []
+        numbers: Dict[int, int] = {}
+        for track in tracklist:
+            match = _POSITION.match(track.get("position") or "")
+            disc = int(match.group(1)) if match and match.group(1) else 1
+            numbers[disc] = numbers.get(disc, 0) + 1
+            entries.append({
+                "title": track.get("title"),
+                "artist": self.artist_name(track.get("artists", []))
+                or album_artist,
+                "album": release.get("title"),
+                "albumartist": album_artist,
+                "year": release.get("year") or None,
+                "country": release.get("country"),
+                "label": _NAME_SUFFIX.sub("", labels[0].get("name", "")) or None,
+                "catalognum": labels[0].get("catno"),
+                "genres": release.get("genres", []),
+                "disc": disc,
+                "track": numbers[disc],
+                "length": self._parse_duration(track.get("duration")),
+            })
+        for entry in entries:
+            entry["disctotal"] = len(numbers)
+            entry["tracktotal"] = numbers[entry["disc"]]
+        return entries
+
+    @staticmethod
+    def _parse_duration(value: Optional[str]) -> Optional[float]:
+        """Convert a "m:ss" or "h:mm:ss" duration to seconds."""
+        if not value:
+            return None
+        try:
+            seconds = 0.0
+            for part in value.split(":"):
+                seconds = seconds * 60 + float(part)
+            return seconds
+        except ValueError:
+            return None
@@ -1,9 +1,49 @@
-from functools import lru_cache
-from typing import Optional, List, Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from patangoma.art_cache import get_art_cache
+from patangoma.endpoints import get_endpoint
+from patangoma.memo import memoize
+from patangoma.resilience import call
+from patangoma.session import get_session
+from typing import Optional, List, Dict, Any, Iterator
 import deezer
 import imgcat
 import logging
-import requests
+import threading
+
+# Number of Deezer detail requests in flight at once
+DETAIL_WORKERS = 8
+
+# Default number of search results, and the most pages read to get them
+SEARCH_LIMIT = 25
+SEARCH_MAX_PAGES = 4
+
+# Largest page of search results Deezer returns
+MAX_PAGE_SIZE = 100
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the thread pool shared by all Deezer detail requests."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DETAIL_WORKERS)
+        return _executor
+
+
+def configure_executor(workers: int = DETAIL_WORKERS) -> ThreadPoolExecutor:
+    """Replace the shared thread pool, e.g. to size it for a batch job.
+
+    Requests already queued on the previous pool still complete.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ThreadPoolExecutor(max_workers=workers)
+        return _executor
 
 
 class DeezerAPI:
@@ -20,20 +60,39 @@ class DeezerAPI:
     -------
     search_track(artist_name: str, track_title: str, album_title: str):
         Searches for tracks in Deezer's database based on the given parameters
+    iter_search_track(track_title: str, artist_name: str, album_title: str):
+        Same as search_track, yielding results as each page arrives
     get_track_by_id(track_id: int):
         Gets a track based on the given track_id
-    dump_res(results: dict) -> None:
-        Prints the results in a JSON format
+    get_track_by_isrc(isrc: str):
+        Gets a track based on the given ISRC code
+    fetch_details(result: dict) -> dict:
+        Fetches a search result's track, album and cover concurrently
+    fetch_details_many(results: list) -> list:
+        Same as fetch_details, pipelined across many search results
     """
 
     def __init__(self):
         self.client = deezer.Client()
+        self.client.session = get_session()
+        base_url = get_endpoint("deezer")
+        if base_url:
+            self.client.base_url = base_url
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
 
-    @lru_cache(maxsize=128)
-    def search_track(self, track_title: str, artist_name: str,
-                     album_title: Optional[str]) -> List[Dict[str, Any]]:
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """The module's shared pool for concurrent detail requests."""
+        return get_executor()
+
+    @memoize(method=True)
+    def search_track(self,
+                     track_title: str,
+                     artist_name: str,
+                     album_title: Optional[str],
+                     limit: int = SEARCH_LIMIT,
+                     max_pages: int = SEARCH_MAX_PAGES) -> List[Dict[str, Any]]:
         """
         Searches for tracks in Deezer's database based on the given parameters &
         returns a list of Track instances.
@@ -46,28 +105,90 @@ class DeezerAPI:
             The name of the artist to search for.
         album_title : str, optional
             The title of the album to search for, if applicable.
+        limit : int, optional
+            The most results to return.
+        max_pages : int, optional
+            The most result pages to request.
 
         Returns
         -------
         List[Track]
             A list of Track instances matching the search criteria.
-            Returns an empty list if an error occurs or no matches are found.
+            Returns an empty list if no matches are found.
+
+        Raises
+        ------
+        ProviderError
+            If Deezer cannot be reached or fails.
         """
-        try:
-            if album_title:
-                query_params = 'track:"{}" artist:"{}" album:"{}"'.format(
-                    track_title, artist_name, album_title)
-            else:
-                query_params = 'track:"{}" artist:"{}"'.format(
-                    track_title, artist_name)
+        return list(
+            self.iter_search_track(track_title, artist_name, album_title,
+                                   limit, max_pages))
+
+    def iter_search_track(
+            self,
+            track_title: str,
+            artist_name: str,
+            album_title: Optional[str] = None,
+            limit: int = SEARCH_LIMIT,
+            max_pages: int = SEARCH_MAX_PAGES) -> Iterator[Dict[str, Any]]:
+        """
+        Searches for tracks like `search_track`, yielding each result as
+        soon as its page arrives.
 
-            results = self.client.search(query_params)
+        Pages are requested one at a time, only while the caller keeps
+        reading, and stop at `limit` results or `max_pages` pages, so a
+        broad query costs one request rather than one per page of matches.
 
-            return [result.as_dict() for result in results]
+        Parameters
+        ----------
+        track_title : str
+            The title of the track to search for.
+        artist_name : str
+            The name of the artist to search for.
+        album_title : str, optional
+            The title of the album to search for, if applicable.
+        limit : int, optional
+            The most results to yield.
+        max_pages : int, optional
+            The most result pages to request.
 
-        except Exception as e:
-            self.logger.error(f"Error searching track on Deezer: {str(e)}")
-            return []
+        Yields
+        ------
+        dict
+            The tracks matching the search criteria, best first.
+
+        Raises
+        ------
+        ProviderError
+            If Deezer cannot be reached or fails.
+        """
+        if album_title:
+            query_params = 'track:"{}" artist:"{}" album:"{}"'.format(
+                track_title, artist_name, album_title)
+        else:
+            query_params = 'track:"{}" artist:"{}"'.format(
+                track_title, artist_name)
+
+        index = 0
+        for _ in range(max_pages):
+            size = min(limit - index, MAX_PAGE_SIZE)
+            if size <= 0:
+                return
+            page = call("deezer",
+                        lambda: self.client.request("GET",
+                                                    "search",
+                                                    paginate_list=True,
+                                                    q=query_params,
+                                                    limit=size,
+                                                    index=index),
+                        not_found={})
+            results = page.get("data", [])
+            for result in results:
+                yield result.as_dict()
+            index += len(results)
+            if not results or not page.get("next"):
+                return
 
     def get_track_by_id(self, track_id: int) -> Dict[str, Any]:
         """
@@ -80,19 +201,41 @@ class DeezerAPI:
 
         Returns
         -------
-        dict or None
-            If the track is found, returns a dict containing the track data.
-            If an error occurs (e.g., the track_id is not valid), returns None.
+        dict
+            The track data, or an empty dict if there is no such track.
+
+        Raises
+        ------
+        ProviderError
+            If Deezer cannot be reached or fails.
         """
-        try:
-            results = self.client.get_track(track_id)
+        return call("deezer",
+                    lambda: self.client.get_track(track_id).as_dict(),
+                    not_found={})
 
-            return results.as_dict()
+    def get_track_by_isrc(self, isrc: str) -> Dict[str, Any]:
+        """
+        Retrieves a track from Deezer's database using its ISRC code.
 
-        except Exception as e:
-            self.logger.error(f"Error searching track on Deezer: {str(e)}")
+        Parameters
+        ----------
+        isrc : str
+            The International Standard Recording Code of the track.
+
+        Returns
+        -------
+        dict
+            The track data, or an empty dict if no track carries the code.
 
-            return {}
+        Raises
+        ------
+        ProviderError
+            If Deezer cannot be reached or fails.
+        """
+        return call(
+            "deezer",
+            lambda: self.client.get_track(f"isrc:{isrc}").as_dict(),  # pyright: ignore
+            not_found={})
 
     def get_album_by_id(self, album_id: int) -> Dict[str, Any]:
         """
@@ -105,19 +248,17 @@ class DeezerAPI:
 
         Returns
         -------
-        dict or None
-            If the album is found, returns a dict containing the album data.
-            If an error occurs (e.g., the album_id is not valid), returns None.
-        """
-        try:
-            results = self.client.get_album(album_id)
-
-            return results.as_dict()
-
-        except Exception as e:
-            self.logger.error(f"Error searching album on Deezer: {str(e)}")
+        dict
+            The album data, or an empty dict if there is no such album.
 
-            return {}
+        Raises
+        ------
+        ProviderError
+            If Deezer cannot be reached or fails.
+        """
+        return call("deezer",
+                    lambda: self.client.get_album(album_id).as_dict(),
+                    not_found={})
 
     def get_artist_by_id(self, album_id: int) -> Dict[str, Any]:
         """
@@ -130,19 +271,17 @@ class DeezerAPI:
 
         Returns
         -------
-        dict or None
-            If the album is found, returns a dict containing the album data.
-            If an error occurs (e.g., the album_id is not valid), returns None.
-        """
-        try:
-            results = self.client.get_artist(album_id)
-
-            return results.as_dict()
-
-        except Exception as e:
-            self.logger.error(f"Error searching album on Deezer: {str(e)}")
+        dict
+            The artist data, or an empty dict if there is no such artist.
 
-            return {}
+        Raises
+        ------
+        ProviderError
+            If Deezer cannot be reached or fails.
+        """
+        return call("deezer",
+                    lambda: self.client.get_artist(album_id).as_dict(),
+                    not_found={})
 
     def deezTrack(self, track_data: Dict[str, Any]) -> deezer.Track:
         """
@@ -192,8 +331,85 @@ class DeezerAPI:
         """
         return deezer.Artist(self.client, artist_data)
 
-    def mapData(self, track_data: Dict[str, Any],
-                album_data: Dict[str, Any]) -> Dict[str, Any]:
+    def fetch_details(self,
+                      result: Dict[str, Any],
+                      full: bool = False) -> Dict[str, Any]:
+        """
+        Fetch the full track, album and cover art of a search result
+        concurrently and map them with `mapData`.
+
+        Parameters
+        ----------
+        result : dict
+            A track as returned by `search_track`.
+        full : bool, optional
+            Whether `result` already is the full track, as returned by
+            `get_track_by_id` or `get_track_by_isrc`, so that it is not
+            requested again.
+
+        Returns
+        -------
+        dict
+            The mapped track data.
+        """
+        return self.fetch_details_many([result], full)[0]
+
+    def fetch_details_many(self,
+                           results: List[Dict[str, Any]],
+                           full: bool = False) -> List[Dict[str, Any]]:
+        """
+        Fetch and map the details of many search results at once.
+
+        Every track, album and cover request is queued on the thread pool
+        up front, so the round trips overlap across results. Albums and
+        covers shared by several results are only requested once.
+
+        Parameters
+        ----------
+        results : list
+            Tracks as returned by `search_track`.
+        full : bool, optional
+            Whether `results` already are full tracks, which are then not
+            requested again.
+
+        Returns
+        -------
+        list
+            The mapped track data, in the order of `results`.
+        """
+        tracks: List[Future] = []
+        for result in results:
+            if full:
+                track: Future = Future()
+                track.set_result(result)
+            else:
+                track = self.executor.submit(self.get_track_by_id,
+                                             result["id"])
+            tracks.append(track)
+        albums: Dict[int, Future] = {}
+        covers: Dict[str, Future] = {}
+        for result in results:
+            album = result["album"]
+            if album["id"] not in albums:
+                albums[album["id"]] = self.executor.submit(
+                    self.get_album_by_id, album["id"])
+            cover = album.get("cover_big")
+            if cover and cover not in covers:
+                covers[cover] = self.executor.submit(self._fetch_art, cover)
+
+        mapped = []
+        for result, track in zip(results, tracks):
+            album = result["album"]
+            cover = covers.get(album.get("cover_big"))
+            mapped.append(
+                self.mapData(track.result(), albums[album["id"]].result(),
+                             cover.result() if cover else None))
+        return mapped
+
+    def mapData(self,
+                track_data: Dict[str, Any],
+                album_data: Dict[str, Any],
+                album_art: Optional[bytes] = None) -> Dict[str, Any]:
         """
         Map the given track's data to a dict with the required fields.
 
@@ -205,6 +421,9 @@ class DeezerAPI:
         album_data : dict
             The album data to use.
 
+        album_art : bytes, optional
+            The album's cover, if already fetched.
+
         Returns
         -------
         dict
@@ -213,7 +432,8 @@ class DeezerAPI:
         track = self.deezTrack(track_data)
         album = self.deezAlbum(album_data)
 
-        album_art = self._fetch_art(album.cover_big)
+        if album_art is None:
+            album_art = self._fetch_art(album.cover_big)
 
         mapped_data = {
             "album": album.title,
@@ -238,7 +458,9 @@ class DeezerAPI:
 
     def _fetch_art(self, art_url: str) -> Optional[bytes]:
         """
-        Fetch the album art for the given album.
+        Fetch the album art for the given album, through the art cache:
+        an album's cover is downloaded once, and re-runs only revalidate
+        it once it has gone stale.
 
         Parameters
         ----------
@@ -252,7 +474,7 @@ class DeezerAPI:
             None, otherwise.
         """
         try:
-            art = requests.get(art_url).content
+            art = get_art_cache().fetch(art_url)
 
         except Exception as e:
             print(f"An error occurred while fetching album cover: {e}")
@@ -0,0 +1,70 @@
+"""Where the provider clients send their requests.
+
+By default the clients talk to the real services. Each provider can be
+pointed at another base URL, such as the local mock server, with a
+PATANGOMA_<PROVIDER>_URL environment variable (or a .env file), e.g.
+PATANGOMA_DEEZER_URL=http://127.0.0.1:8080, or with `configure_endpoint`.
+Clients read their endpoint when they are created.
+"""
+
+import os
+import threading
+from dotenv import load_dotenv
+from typing import Dict, Optional
+
+# Path of each provider's API under its base URL
+API_PATHS = {
+    "deezer": "/",
+    "musicbrainz": "/ws/2/",
+    "spotify": "/v1/",
+    "discogs": "/",
+}
+
+# Path of Spotify's token endpoint under its base URL
+SPOTIFY_TOKEN_PATH = "/api/token"
+
+# Paths outside a provider's API whose requests still count as its own
+AUTH_PATHS = {
+    "spotify": SPOTIFY_TOKEN_PATH,
+}
+
+_endpoints: Dict[str, Optional[str]] = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(provider: str) -> Optional[str]:
+    """Return the provider's base URL, or None for the real service."""
+    with _endpoints_lock:
+        if provider not in _endpoints:
+            load_dotenv()
+            url = os.getenv(f"PATANGOMA_{provider.upper()}_URL")
+            _endpoints[provider] = url.rstrip("/") if url else None
+        return _endpoints[provider]
+
+
+def configure_endpoint(provider: str, url: Optional[str]) -> Optional[str]:
+    """Point a provider at `url`; None goes back to the real service.
+
+    Clients created before the call keep their endpoint.
+    """
+    with _endpoints_lock:
+        _endpoints[provider] = url.rstrip("/") if url else None
+        return _endpoints[provider]
+
+
+def provider_for_endpoint(url: str) -> Optional[str]:
+    """Return the provider whose configured API `url` belongs to, if any.
+
+    Spotify's token endpoint counts as Spotify's. Several providers may
+    share one base URL, as they do on the mock server, so the longest
+    matching prefix wins.
+    """
+    best, best_length = None, 0
+    for provider, path in [*API_PATHS.items(), *AUTH_PATHS.items()]:
+        base = get_endpoint(provider)
+        if base is None:
+            continue
+        prefix = base + path
+        if url.startswith(prefix) and len(prefix) > best_length:
+            best, best_length = provider, len(prefix)
+    return best
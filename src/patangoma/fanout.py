@@ -0,0 +1,280 @@
+"""Search every provider at once and merge their candidates.
+
+Each provider's results are normalised to the MediaFile keys used by
+`MusicBrainzAPI.translate_mb_result`. They are scored against the file's
+title and artist, and deduplicated by ISRC, or by title, artist and
+duration. Providers are queried concurrently, so a search takes as long
+as the slowest provider rather than the sum of all of them, and can be
+cut short by a deadline.
+"""
+
+import logging
+import queue
+import re
+import threading
+import time
+from patangoma.matching import match_score, normalize
+from patangoma.query import Query
+from patangoma.sp import spotify_search, spotify_track_updates
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+PROVIDERS = ("musicbrainz", "deezer", "spotify")
+
+# Largest difference in seconds between durations of the same recording
+DUPLICATE_TOLERANCE = 3.0
+
+Candidate = Dict[str, Any]
+
+_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(ms|s)?\s*$")
+
+
+def parse_duration(value: str) -> float:
+    """Parse "800ms", "2s" or "1.5" (seconds) into seconds."""
+    match = _DURATION.match(value)
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    number, unit = float(match.group(1)), match.group(2)
+    return number / 1000 if unit == "ms" else number
+
+
+def from_musicbrainz(query: Query, rec: Dict[str, Any]) -> Candidate:
+    """Normalise a MusicBrainz recording search result."""
+    fields = query.mb_api.translate_mb_result(query.flatten_dict(rec))
+    fields.pop("score", None)
+    isrcs = rec.get("isrc-list") or [None]
+    length = rec.get("length")
+    return dict(fields,
+                isrc=isrcs[0],
+                length=int(length) / 1000 if length else None)
+
+
+def from_deezer(rec: Dict[str, Any]) -> Candidate:
+    """Normalise a Deezer track search result."""
+    return {
+        "title": rec.get("title"),
+        "artist": rec.get("artist", {}).get("name"),
+        "album": rec.get("album", {}).get("title"),
+        "isrc": rec.get("isrc"),
+        "length": rec.get("duration"),
+    }
+
+
+def from_spotify(rec: Dict[str, Any]) -> Candidate:
+    """Normalise a Spotify track search result."""
+    artists = [artist.get("name", "") for artist in rec.get("artists", [])]
+    album = rec.get("album", {})
+    duration = rec.get("duration_ms")
+    return {
+        "title": rec.get("name"),
+        "artist": ", ".join(artists),
+        "album": album.get("name"),
+        "date": album.get("release_date"),
+        "isrc": rec.get("external_ids", {}).get("isrc"),
+        "length": duration / 1000 if duration else None,
+    }
+
+
+def same_recording(a: Candidate, b: Candidate) -> bool:
+    """Whether two candidates describe the same recording."""
+    if a.get("isrc") and b.get("isrc"):
+        return a["isrc"] == b["isrc"]
+    if normalize(a.get("title")) != normalize(b.get("title")):
+        return False
+    if normalize(a.get("artist")) != normalize(b.get("artist")):
+        return False
+    if a.get("length") and b.get("length"):
+        return abs(a["length"] - b["length"]) <= DUPLICATE_TOLERANCE
+    return True
+
+
+def merge_candidates(candidates: List[Candidate]) -> List[Candidate]:
+    """
+    Fold duplicates into one candidate and rank the rest.
+
+    A merged candidate keeps the fields of its best-scored match and fills
+    the gaps from the others, and keeps each provider's best-scored raw
+    match. Its `sources` lists every provider that returned it, and it
+    ranks above a single-provider candidate with the same score.
+    """
+    merged: List[Candidate] = []
+    for candidate in sorted(candidates, key=lambda c: c["score"],
+                            reverse=True):
+        for existing in merged:
+            if same_recording(existing, candidate):
+                for key, value in candidate.items():
+                    if existing.get(key) is None:
+                        existing[key] = value
+                for source in candidate["sources"]:
+                    if source not in existing["sources"]:
+                        existing["sources"].append(source)
+                for source, raw in candidate["matches"].items():
+                    existing["matches"].setdefault(source, raw)
+                break
+        else:
+            merged.append(candidate)
+
+    return sorted(merged,
+                  key=lambda c: (c["score"], len(c["sources"])),
+                  reverse=True)
+
+
+class FanOutSearch:
+    """
+    Queries MusicBrainz, Deezer and Spotify concurrently.
+
+    Each provider runs on its own daemon thread and reports back through a
+    queue, so results can be consumed as they arrive and a provider that
+    stalls can be abandoned: it never blocks the caller or interpreter
+    exit, and if it does answer later, its result still lands in the
+    response cache for the next search. A provider that fails is logged
+    and left out.
+
+    Every candidate keeps the provider's own result under `matches`, from
+    which `updates_for` builds the tag updates.
+    """
+
+    def __init__(self, query: Query, providers=PROVIDERS):
+        self.query = query
+        self.providers = providers
+        self.candidates: List[Candidate] = []
+        self.elapsed: Dict[str, float] = {}
+        self.pending: List[str] = []
+        self.first_result: Optional[float] = None
+        self._title: Optional[str] = None
+        self._artist: Optional[str] = None
+        self._results: "queue.Queue[tuple]" = queue.Queue()
+        self._started = 0.0
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def start(self, title: str, artist: str):
+        """Send the search to every provider without waiting."""
+        self._title, self._artist = title, artist
+        self.candidates, self.elapsed = [], {}
+        self.pending = list(self.providers)
+        self.first_result = None
+        # A fresh queue, so answers to an earlier search cannot leak in
+        self._results = queue.Queue()
+        self._started = time.perf_counter()
+        for provider in self.providers:
+            threading.Thread(target=self._run,
+                             args=(self._results, provider, title, artist),
+                             name=f"search-{provider}",
+                             daemon=True).start()
+
+    def stream(self,
+               timeout: Optional[float] = None
+               ) -> Iterator[Tuple[str, List[Candidate]]]:
+        """
+        Yield (provider, candidates) as each provider answers.
+
+        Stops once every provider has answered or `timeout` seconds have
+        passed (at once for a `timeout` of 0, with only the answers already
+        in); providers still running are left in `pending`, and a later call
+        picks up their answers.
+        """
+        deadline = time.perf_counter() + timeout \
+            if timeout is not None else None
+        while self.pending:
+            # Past the deadline, answers already queued are still taken
+            remaining = max(deadline - time.perf_counter(), 0) \
+                if deadline is not None else None
+            try:
+                provider, results, error, elapsed = self._results.get(
+                    timeout=remaining)
+            except queue.Empty:
+                return
+
+            self.pending.remove(provider)
+            self.elapsed[provider] = elapsed
+            if error is not None:
+                self.logger.error(f"Error searching {provider}: {error}")
+                continue
+
+            scored = []
+            for normalized, raw in results:
+                normalized["score"] = match_score(self._title, self._artist,
+                                                  normalized.get("title"),
+                                                  normalized.get("artist"))
+                normalized["sources"] = [provider]
+                normalized["matches"] = {provider: raw}
+                scored.append(normalized)
+            if scored and self.first_result is None:
+                self.first_result = time.perf_counter() - self._started
+            self.candidates.extend(scored)
+            yield provider, scored
+
+    def ranked(self) -> List[Candidate]:
+        """The candidates received so far, merged and ranked."""
+        return merge_candidates([dict(candidate, sources=list(
+            candidate["sources"]), matches=dict(candidate["matches"]))
+                                 for candidate in self.candidates])
+
+    def search(self,
+               title: str,
+               artist: str,
+               deadline: Optional[float] = None) -> List[Candidate]:
+        """
+        Search all providers and return the merged, ranked candidates.
+
+        With a `deadline` in seconds, return what has arrived by then.
+        """
+        self.start(title, artist)
+        for _ in self.stream(deadline):
+            pass
+        return self.ranked()
+
+    def updates_for(self, candidate: Candidate) -> Dict[str, Any]:
+        """
+        Build tag updates from every provider that returned a candidate.
+
+        Providers are taken in PROVIDERS order; a field set by one is not
+        overwritten by the next, which only fills in what is missing.
+        """
+        updates: Dict[str, Any] = {}
+        for provider in PROVIDERS:
+            raw = candidate["matches"].get(provider)
+            if raw is None:
+                continue
+            if provider == "musicbrainz":
+                fields = {
+                    key: value
+                    for key, value in raw.items() if key != "score"
+                }
+            elif provider == "deezer":
+                fields = self.query.dz_api.fetch_details(raw)
+            else:
+                fields = spotify_track_updates(raw)
+            for key, value in fields.items():
+                updates.setdefault(key, value)
+        return updates
+
+    def _run(self, results: "queue.Queue[tuple]", provider: str, title: str,
+             artist: str):
+        """Run one provider's search on its thread and report back."""
+        start = time.perf_counter()
+        try:
+            found, error = self._search(provider, title, artist), None
+        except Exception as e:
+            found, error = None, e
+        results.put((provider, found, error, time.perf_counter() - start))
+
+    def _search(self, provider: str, title: str, artist: str) -> List[tuple]:
+        """Return (normalised candidate, provider result) pairs."""
+        if provider == "musicbrainz":
+            pairs = []
+            for rec in self.query.musicbrainz_recordings(title, artist):
+                candidate = from_musicbrainz(self.query, rec)
+                # MusicBrainz results are already tags, less the duration
+                fields = {
+                    key: value
+                    for key, value in candidate.items()
+                    if key != "length" and value is not None
+                }
+                pairs.append((candidate, fields))
+            return pairs
+        if provider == "deezer":
+            return [(from_deezer(rec), rec)
+                    for rec in self.query.deezer_tracks(title, artist, None)]
+        items, _ = spotify_search(title, artist, verbose=False)
+        return [(from_spotify(rec), rec) for rec in items]
@@ -0,0 +1,67 @@
+"""Cheap audio file classification by extension and leading magic bytes."""
+
+import os
+
+# Extensions of the containers MediaFile knows how to tag
+AUDIO_EXTENSIONS = frozenset({
+    ".aac", ".aif", ".aifc", ".aiff", ".alac", ".ape", ".asf", ".dsf",
+    ".flac", ".m4a", ".m4b", ".mp3", ".mp4", ".mpc", ".oga", ".ogg", ".opus",
+    ".wav", ".wma", ".wv",
+})
+
+# Signatures found at offset 0 of the supported containers
+MAGIC_PREFIXES = (
+    b"ID3",  # MP3 with an ID3v2 header
+    b"fLaC",  # FLAC
+    b"OggS",  # Ogg Vorbis/Opus/FLAC
+    b"MAC ",  # Monkey's Audio
+    b"APETAGEX",  # APEv2 header in front of MP3/APE
+    b"wvpk",  # WavPack
+    b"MPCK",  # Musepack SV8
+    b"MP+",  # Musepack SV7
+    b"DSD ",  # DSF
+    b"\x30\x26\xb2\x75\x8e\x66\xcf\x11",  # ASF/WMA header GUID
+)
+
+# Header length needed to tell every supported format apart
+MAGIC_LENGTH = 12
+
+
+def has_audio_extension(path: str) -> bool:
+    """Return True if `path` has an audio file extension. Does no I/O."""
+    return os.path.splitext(path)[1].lower() in AUDIO_EXTENSIONS
+
+
+def matches_audio_magic(header: bytes) -> bool:
+    """Return True if `header` starts like one of the supported containers."""
+    if header.startswith(MAGIC_PREFIXES):
+        return True
+    # Bare MPEG audio or ADTS AAC frame sync
+    if len(header) >= 2 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        return True
+    if header[4:8] == b"ftyp":  # MP4/M4A
+        return True
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        return True
+    if header[:4] == b"FORM" and header[8:12] in (b"AIFF", b"AIFC"):
+        return True
+    return False
+
+
+def is_audio_file(path: str) -> bool:
+    """
+    Check whether `path` looks like a taggable audio file without parsing it.
+
+    The extension is checked first, so cover art, cue sheets, rip logs and
+    the like are rejected without touching the disk. Otherwise only the
+    first few bytes of the file are read and matched against known
+    container signatures.
+    """
+    if not has_audio_extension(path):
+        return False
+    try:
+        with open(path, "rb") as f:
+            header = f.read(MAGIC_LENGTH)
+    except OSError:
+        return False
+    return matches_audio_magic(header)
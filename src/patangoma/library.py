@@ -0,0 +1,179 @@
+import logging
+import os
+from fnmatch import fnmatch
+import time
+from concurrent.futures import ProcessPoolExecutor
+from mediafile import MediaFile
+from patangoma.database import FileStorage, INDEX_COLUMNS
+from patangoma.filetypes import has_audio_extension, is_audio_file
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Number of index rows buffered before they are committed to the database
+COMMIT_BATCH = 500
+
+
+def iter_files(root: str) -> Iterator[str]:
+    """Yield the path of every file below `root`, depth first."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            yield os.path.join(dirpath, filename)
+
+
+def iter_audio_files(root: str, pattern: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield the audio files below `root`, judged by extension.
+
+    If `pattern` is given, only paths whose location relative to `root`,
+    or whose file name, matches the glob pattern are yielded.
+    """
+    for path in iter_files(root):
+        if not has_audio_extension(path):
+            continue
+        if pattern and not (fnmatch(os.path.relpath(path, root), pattern)
+                            or fnmatch(os.path.basename(path), pattern)):
+            continue
+        yield path
+
+
+def fingerprint(stat: os.stat_result) -> Tuple[int, int, int]:
+    """Return the (inode, size, mtime) triple used to detect file changes."""
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def read_index_row(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the tags of a single file into a library index row.
+
+    Runs inside the scan worker processes, so it must stay a module level
+    function. A file that is not audio or cannot be parsed gets a row with
+    its fingerprint and `unreadable` set, so that it is not re-opened on
+    every rescan until it changes. Returns None if the file is gone.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    row: Dict[str, Any] = {"path": path, "scanned_at": time.time()}
+    row["inode"], row["size"], row["mtime"] = fingerprint(stat)
+    try:
+        media = MediaFile(path) if is_audio_file(path) else None
+    except Exception:
+        media = None
+    if media is None:
+        row["unreadable"] = 1
+        return row
+
+    row["unreadable"] = 0
+    for key in INDEX_COLUMNS:
+        if key not in row:
+            row[key] = getattr(media, key, None)
+    return row
+
+
+def scan_library(root: str,
+                 storage: FileStorage,
+                 workers: Optional[int] = None,
+                 chunksize: int = 64,
+                 full: bool = False) -> Dict[str, Any]:
+    """
+    Index the tags of every audio file under `root` into `storage`.
+
+    Files without an audio extension are skipped without being opened, and
+    files whose (inode, size, mtime) fingerprint matches their index row
+    are skipped unless `full` is set. Index rows of files that disappeared
+    are re-pointed to a new path when an unindexed file carries the same
+    fingerprint (a move or rename), and dropped otherwise. Only new and
+    modified files are opened, in a pool of `workers` processes (one per
+    CPU by default), while this process batches the rows into the database.
+    Files that cannot be parsed are recorded as unreadable, so they too are
+    skipped until they change.
+
+    Returns
+    -------
+    dict
+        Scan statistics: `files` seen, `unchanged`, `moved`, `removed`,
+        `indexed`, `skipped`, `elapsed` seconds and `rate` in files per
+        second.
+    """
+    start = time.perf_counter()
+    root = os.path.abspath(root)
+    known = storage.get_fingerprints(root)
+
+    seen: Set[str] = set()
+    changed: List[str] = []
+    unindexed: Dict[Tuple[int, int, int], str] = {}
+    ignored = 0
+    for path in iter_files(root):
+        if not has_audio_extension(path):
+            ignored += 1
+            continue
+        try:
+            current = fingerprint(os.stat(path))
+        except OSError:
+            continue
+        seen.add(path)
+        previous = known.get(path)
+        if previous == current and not full:
+            continue
+        changed.append(path)
+        if previous is None:
+            unindexed[current] = path
+
+    moves = []
+    removed = []
+    for path in known.keys() - seen:
+        new_path = unindexed.pop(known[path], None)
+        if new_path:
+            moves.append((path, new_path))
+        else:
+            removed.append(path)
+
+    moved = storage.move_index_rows(moves)
+    storage.remove_index_rows(removed)
+    to_read = changed
+    if not full:
+        moved_to = {new_path for _, new_path in moves}
+        to_read = [path for path in changed if path not in moved_to]
+
+    indexed = 0
+    skipped = ignored
+    pending: List[Dict[str, Any]] = []
+
+    # Spawning the pool dominates a rescan where nothing changed
+    if to_read:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for row in executor.map(read_index_row, to_read,
+                                    chunksize=chunksize):
+                if row is None:
+                    skipped += 1
+                    continue
+                if row["unreadable"]:
+                    skipped += 1
+                else:
+                    indexed += 1
+                pending.append(row)
+                if len(pending) >= COMMIT_BATCH:
+                    storage.add_index_rows(pending)
+                    pending = []
+
+    if pending:
+        storage.add_index_rows(pending)
+
+    files = len(seen) + ignored
+    elapsed = time.perf_counter() - start
+    logger.info(f"Indexed {indexed} of {files} files in {elapsed:.2f}s")
+
+    return {
+        "files": files,
+        "unchanged": len(seen) - len(changed),
+        "moved": moved,
+        "removed": len(removed),
+        "indexed": indexed,
+        "skipped": skipped,
+        "elapsed": elapsed,
+        "rate": files / elapsed if elapsed else 0.0,
+    }
@@ -0,0 +1,117 @@
+"""Helpers to score how well a provider candidate matches a track."""
+
+import re
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Difference in seconds at which two durations no longer count as a match
+DURATION_TOLERANCE = 10.0
+
+# Weights of the title, position and duration in a track assignment
+TRACK_WEIGHTS = (0.5, 0.25, 0.25)
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lowercase `text` and strip punctuation and redundant whitespace."""
+    if not text:
+        return ""
+    text = _PUNCTUATION.sub(" ", str(text).lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def similarity(a: Optional[str], b: Optional[str]) -> float:
+    """Return the similarity of two strings, from 0.0 to 1.0."""
+    a, b = normalize(a), normalize(b)
+    if not (a and b):
+        return 0.0
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def match_score(title: Optional[str], artist: Optional[str],
+                candidate_title: Optional[str],
+                candidate_artist: Optional[str]) -> int:
+    """
+    Score a candidate against the track's title and artist, from 0 to 100.
+
+    The title weighs more than the artist, whose credit often differs
+    slightly between providers (featured artists, "&" versus "and").
+    """
+    score = (0.6 * similarity(title, candidate_title) +
+             0.4 * similarity(artist, candidate_artist))
+    return round(100 * score)
+
+
+def release_score(album: Optional[str], artist: Optional[str],
+                  track_count: int, candidate_album: Optional[str],
+                  candidate_artist: Optional[str],
+                  candidate_tracks: Optional[int]) -> int:
+    """
+    Score a release against an album's title, artist and size, 0 to 100.
+
+    A release with a different number of tracks than the files at hand
+    scores lower, but not to zero: the files may be a partial album.
+    """
+    score = match_score(album, artist, candidate_album, candidate_artist)
+    if candidate_tracks:
+        coverage = min(track_count, candidate_tracks) / max(
+            track_count, candidate_tracks)
+        score = round(score * (0.8 + 0.2 * coverage))
+    return score
+
+
+def track_score(item: Dict[str, Any], candidate: Dict[str, Any]) -> float:
+    """
+    Score how well a file matches a release track, from 0.0 to 1.0.
+
+    Both are dicts with `title`, `track`, `disc` and `length` (seconds).
+    Position and duration only count when the file has them.
+    """
+    title_weight, position_weight, duration_weight = TRACK_WEIGHTS
+    score = title_weight * similarity(item.get("title"),
+                                      candidate.get("title"))
+    weight = title_weight
+
+    if item.get("track"):
+        weight += position_weight
+        if item["track"] == candidate.get("track"):
+            disc = item.get("disc")
+            same_disc = not disc or disc == candidate.get("disc")
+            score += position_weight * (1.0 if same_disc else 0.5)
+
+    if item.get("length") and candidate.get("length"):
+        weight += duration_weight
+        difference = abs(item["length"] - candidate["length"])
+        score += duration_weight * max(0.0,
+                                       1.0 - difference / DURATION_TOLERANCE)
+
+    return score / weight
+
+
+def assign_tracks(items: List[Dict[str, Any]],
+                  candidates: List[Dict[str, Any]]) -> List[Tuple[int, int, int]]:
+    """
+    Pair files with release tracks, each used at most once.
+
+    Pairs are taken greedily, best `track_score` first. Returns
+    (item index, candidate index, score from 0 to 100) for every file that
+    could be paired.
+    """
+    pairs = sorted(((track_score(item, candidate), i, j)
+                    for i, item in enumerate(items)
+                    for j, candidate in enumerate(candidates)),
+                   reverse=True)
+
+    assigned: List[Tuple[int, int, int]] = []
+    used_items, used_candidates = set(), set()
+    for score, i, j in pairs:
+        if i in used_items or j in used_candidates:
+            continue
+        used_items.add(i)
+        used_candidates.add(j)
+        assigned.append((i, j, round(100 * score)))
+    return sorted(assigned)
@@ -1,8 +1,70 @@
 # mb.py
 import musicbrainzngs as mb
 import logging
-from functools import lru_cache
 from datetime import datetime
+from patangoma.endpoints import get_endpoint
+from patangoma.memo import memoize
+from patangoma.ratelimit import get_limiter, parse_retry_after
+from patangoma.resilience import call
+from patangoma.session import session_settings
+from patangoma.transport import get_transport
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+# Release data fetched for album mode, in a single request
+RELEASE_INCLUDES = ["recordings", "artist-credits", "release-groups", "media"]
+RECORDING_INCLUDES = ["releases", "artist-credits", "isrcs"]
+
+_library_read = mb.musicbrainz._safe_read
+
+
+class _TimeoutOpener:
+    """A urllib opener whose requests give up after `timeout` seconds."""
+
+    def __init__(self, opener, timeout: float):
+        self.opener = opener
+        self.timeout = timeout
+
+    def open(self, req, data=None):
+        return self.opener.open(req, data, timeout=self.timeout)
+
+
+def _safe_read(opener, req, body=None, **kwargs):
+    """Send a musicbrainzngs request once, with the shared HTTP timeout.
+
+    musicbrainzngs opens its requests without a socket timeout, so a
+    stalled server would hang the caller for good. It also retries 5xx
+    responses and timeouts itself, up to 8 times over about a minute;
+    `MusicBrainzAPI._call` does that with backoff and the circuit
+    breaker instead, so the library only gets one attempt.
+    """
+    _, timeout = session_settings()
+    kwargs["max_retries"] = 1
+    return _library_read(_TimeoutOpener(opener, timeout), req, body,
+                         **kwargs)
+
+
+def _install_safe_read():
+    """Send every musicbrainzngs request in the process through `_safe_read`.
+
+    musicbrainzngs has no setting for a timeout or its retry count, so its
+    private `_safe_read` is swapped for the wrapper, once, on import.
+    """
+    mb.musicbrainz._safe_read = _safe_read
+
+
+def _use_shared_limiter():
+    """Turn off musicbrainzngs' own throttling for the process.
+
+    MusicBrainz requests are paced by the shared "musicbrainz" token
+    bucket instead, in `MusicBrainzAPI._call`, which also spaces out
+    callers on other threads; the library's sleep would pace them twice.
+    """
+    mb.set_rate_limit(False)
+
+
+_install_safe_read()
+_use_shared_limiter()
 
 
 class MusicBrainzAPI:
@@ -23,6 +85,8 @@ class MusicBrainzAPI:
 
         self.set_user_agent()
         self.set_format(response_format)
+        self.set_hostname()
+        self.limiter = get_limiter("musicbrainz")
 
     def set_user_agent(self,
                        app="PataNgoma",
@@ -37,6 +101,18 @@ class MusicBrainzAPI:
         """
         mb.set_useragent(app=app, version=version, contact=contact)
 
+    def set_hostname(self, url=None):
+        """Point API requests at another server, e.g. the mock server.
+
+        Args:
+            url (str): The server's base URL. Defaults to the configured
+                MusicBrainz endpoint; nothing changes if there is none.
+        """
+        url = url or get_endpoint("musicbrainz")
+        if url:
+            parts = urlsplit(url)
+            mb.set_hostname(parts.netloc, use_https=parts.scheme == "https")
+
     def set_format(self, fmt="xml"):
         """Set the response format for API requests.
 
@@ -45,7 +121,7 @@ class MusicBrainzAPI:
         """
         mb.set_format(fmt=fmt)
 
-    @lru_cache(maxsize=None)
+    @memoize(method=True)
     def search_track(self, track_title: str, artist_name: str, query=None):
         """Search for a track on MusicBrainz.
 
@@ -55,22 +131,194 @@ class MusicBrainzAPI:
             query (dict): Optional additional query parameters to pass to the API.
 
         Returns:
-            list: A list of matching tracks.
+            list: A list of matching tracks, empty if there are none.
+
+        Raises:
+            ProviderError: If MusicBrainz cannot be reached or fails.
+        """
+        query_params = {"artist": artist_name, "recording": track_title}
+
+        if query:
+            query_params.update(query)
+
+        result = self._call(mb.search_recordings, **query_params, limit=10)
+        return result.get("recording-list", [])
+
+    @memoize(method=True)
+    def search_release(self, album_title: str, artist_name: str,
+                       track_count: Optional[int] = None):
+        """Search for a release on MusicBrainz.
+
+        Args:
+            album_title (str): The title of the album to search for.
+            artist_name (str): The name of the album artist.
+            track_count (int): Optional number of tracks on the release.
+
+        Returns:
+            list: A list of matching releases, without their tracklists.
+
+        Raises:
+            ProviderError: If MusicBrainz cannot be reached or fails.
+        """
+        query_params = {"release": album_title, "artist": artist_name}
+        if track_count:
+            query_params["tracks"] = track_count
+
+        result = self._call(mb.search_releases, **query_params, limit=5)
+        return result.get("release-list", [])
+
+    @memoize(method=True)
+    def get_release(self, release_id: str):
+        """Fetch a release with its full tracklist.
+
+        Args:
+            release_id (str): The MusicBrainz ID of the release.
+
+        Returns:
+            dict: The release, or an empty dict if there is no such release.
+
+        Raises:
+            ProviderError: If MusicBrainz cannot be reached or fails.
+        """
+        result = self._call(mb.get_release_by_id,
+                            release_id,
+                            includes=RELEASE_INCLUDES,
+                            not_found={})
+        return result.get("release", {})
+
+    @memoize(method=True)
+    def get_recording(self, recording_id: str):
+        """Fetch a recording by its MusicBrainz ID.
+
+        Args:
+            recording_id (str): The MusicBrainz ID of the recording.
+
+        Returns:
+            dict: The recording with its releases, or an empty dict if
+            there is no such recording.
+
+        Raises:
+            ProviderError: If MusicBrainz cannot be reached or fails.
+        """
+        result = self._call(mb.get_recording_by_id,
+                            recording_id,
+                            includes=RECORDING_INCLUDES,
+                            not_found={})
+        return result.get("recording", {})
+
+    @memoize(method=True)
+    def search_isrc(self, isrc: str):
+        """Look up the recordings carrying an ISRC.
+
+        Args:
+            isrc (str): The International Standard Recording Code.
+
+        Returns:
+            list: The recordings with their releases, empty if the ISRC
+            is unknown.
+
+        Raises:
+            ProviderError: If MusicBrainz cannot be reached or fails.
         """
-        try:
-            query_params = {"artist": artist_name, "recording": track_title}
+        result = self._call(mb.get_recordings_by_isrc,
+                            isrc,
+                            includes=["artists", "releases"],
+                            not_found={})
+        return result.get("isrc", {}).get("recording-list", [])
+
+    def release_tracks(self, release) -> List[Dict[str, Any]]:
+        """Map every track of a release to MediaFile tags.
+
+        Each entry also carries the track's `length` in seconds, for
+        matching; it is not a writable tag and is ignored on update.
+
+        Args:
+            release (dict): A release fetched with `get_release`.
 
-            if query:
-                query_params.update(query)
+        Returns:
+            list: One dict of tags per track, in disc and track order.
+        """
+        group = release.get("release-group", {})
+        credit = release.get("artist-credit") or [{}]
+        album_artist = release.get("artist-credit-phrase")
+        media = release.get("medium-list", [])
+
+        entries = []
+        for medium in media:
+            tracklist = medium.get("track-list", [])
+            for track in tracklist:
+                recording = track.get("recording", {})
+                length = track.get("length") or recording.get("length")
+                entry = {
+                    "title": track.get("title") or recording.get("title"),
+                    "artist": (track.get("artist-credit-phrase")
+                               or recording.get("artist-credit-phrase")
+                               or album_artist),
+                    "album": release.get("title"),
+                    "albumartist": album_artist,
+                    "albumstatus": release.get("status"),
+                    "albumtype": group.get("primary-type") or group.get("type"),
+                    "country": release.get("country"),
+                    "date": self._parse_date(release.get("date")),
+                    "track": int(track.get("position") or 0) or None,
+                    "tracktotal": len(tracklist),
+                    "disc": int(medium.get("position") or 1),
+                    "disctotal": len(media),
+                    "mb_albumid": release.get("id"),
+                    "mb_albumartistid": credit[0].get("artist", {}).get("id"),
+                    "mb_releasegroupid": group.get("id"),
+                    "mb_releasetrackid": track.get("id"),
+                    "mb_trackid": recording.get("id"),
+                    "length": int(length) / 1000 if length else None,
+                }
+                entries.append({
+                    key: value
+                    for key, value in entry.items() if value is not None
+                })
+        return entries
+
+    @staticmethod
+    def _parse_date(value):
+        """Parse a MusicBrainz "YYYY[-MM[-DD]]" date, or return None."""
+        for fmt in ("%Y-%m-%d", "%Y-%m", "%Y"):
+            try:
+                return datetime.strptime(value, fmt).date()
+            except (TypeError, ValueError):
+                continue
+        return None
+
+    def _call(self, method, *args, not_found=None, **kwargs):
+        """Call a musicbrainzngs function within the MusicBrainz rate limit.
+
+        Transient errors are retried with backoff, and a 503 (MusicBrainz's
+        throttling response) holds back every caller for the server's
+        Retry-After delay, or one second. A 404 returns `not_found`.
+
+        Raises:
+            ProviderError: If the call still fails, or MusicBrainz has
+                been failing repeatedly.
+        """
 
-            result = mb.search_recordings(**query_params, limit=10)
+        def attempt():
+            if self.limiter:
+                self.limiter.acquire()
+            transport = get_transport()
+            try:
+                if transport:
+                    return transport.call("musicbrainz", method.__name__,
+                                          args, kwargs,
+                                          lambda: method(*args, **kwargs))
+                return method(*args, **kwargs)
+            except mb.WebServiceError as e:
+                cause = getattr(e, "cause", None)
+                if self.limiter and getattr(cause, "code", None) in (429,
+                                                                     503):
+                    headers = getattr(cause, "headers", None) or {}
+                    delay = parse_retry_after(headers.get("Retry-After"))
+                    self.limiter.defer(delay if delay is not None else 1.0)
+                raise
 
-            if "recording-list" in result:
-                return result["recording-list"]
-        except mb.WebServiceError as e:
-            self.logger.error(
-                f"Error searching track on MusicBrainz: {str(e)}")
-        return []
+        return call("musicbrainz", attempt, not_found=not_found)
 
     def translate_mb_result(self, flattened_data):
         """
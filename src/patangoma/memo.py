@@ -0,0 +1,169 @@
+"""Bounded in-process memoization for the provider search calls.
+
+Unlike `functools.lru_cache` on a method, the cache is bounded in both
+entries and bytes, keeps no reference to the instance, lets empty
+results expire quickly, and can be invalidated per call. Calls are keyed
+by their bound arguments, so `f(x, verbose=False)` and `f(x, False)`
+share an entry, and callers get their own copy of a cached result.
+"""
+
+import copy
+import functools
+import inspect
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+MEMO_MAXSIZE = 256
+MEMO_MAX_BYTES = 8 * 1024 * 1024
+MEMO_TTL = 3600  # seconds
+MEMO_NEGATIVE_TTL = 60  # seconds, for empty results
+
+
+def is_empty(value: Any) -> bool:
+    """Whether a search result is a no-match, e.g. [] or ([], [])."""
+    if isinstance(value, tuple):
+        return not any(value)
+    return not value
+
+
+class Memo:
+    """The cache behind one memoized function."""
+
+    def __init__(self,
+                 func: Callable,
+                 maxsize: int = MEMO_MAXSIZE,
+                 max_bytes: int = MEMO_MAX_BYTES,
+                 ttl: Optional[float] = MEMO_TTL,
+                 negative_ttl: Optional[float] = MEMO_NEGATIVE_TTL,
+                 method: bool = False):
+        self.func = func
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.method = method
+        self.signature = inspect.signature(func)
+        # key -> (value, pickled size, expiry time or None)
+        self.entries: "OrderedDict[Any, Tuple[Any, int, Optional[float]]]" = (
+            OrderedDict())
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, args: tuple, kwargs: dict) -> tuple:
+        """Key a call by its arguments bound to the parameters, defaults
+        included. Raises TypeError if they do not fit the signature.
+        """
+        bound = self.signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        items = tuple(bound.arguments.items())
+        # A method is cached by its arguments alone, so the cache holds no
+        # reference to the instance and is shared by all instances
+        return items[1:] if self.method else items
+
+    def __call__(self, *args, **kwargs):
+        try:
+            key = self.key(args, kwargs)
+            hash(key)
+        except TypeError:
+            return self.func(*args, **kwargs)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[2] is None
+                                      or entry[2] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+            self.misses += 1
+
+        value = self.func(*args, **kwargs)
+        self.store(key, copy.deepcopy(value))
+        return value
+
+    def store(self, key: tuple, value: Any):
+        """Cache `value`, evicting the least recently used to fit."""
+        ttl = self.negative_ttl if is_empty(value) else self.ttl
+        if ttl == 0:
+            return
+        try:
+            size = len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            return
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + ttl if ttl is not None else None
+
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (value, size, expires)
+            self.nbytes += size
+            while (len(self.entries) > self.maxsize
+                   or self.nbytes > self.max_bytes):
+                self._discard(next(iter(self.entries)))
+
+    def _discard(self, key: tuple):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def invalidate(self, *args, **kwargs):
+        """Forget the result for these arguments, or everything if none.
+
+        For a method, pass the arguments without the instance.
+        """
+        with self.lock:
+            if not (args or kwargs):
+                self.entries.clear()
+                self.nbytes = 0
+                return
+            if self.method:
+                args = (None, ) + args
+            self._discard(self.key(args, kwargs))
+
+    def cache_info(self) -> Dict[str, Any]:
+        """Return the hit, miss, entry and byte counts."""
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+def memoize(maxsize: int = MEMO_MAXSIZE,
+            max_bytes: int = MEMO_MAX_BYTES,
+            ttl: Optional[float] = MEMO_TTL,
+            negative_ttl: Optional[float] = MEMO_NEGATIVE_TTL,
+            method: bool = False):
+    """
+    Memoize a function in a bounded, thread-safe LRU cache.
+
+    At most `maxsize` results and `max_bytes` of pickled data are kept.
+    Results expire after `ttl` seconds, and empty results (no match, or an
+    error reported as one) after `negative_ttl`; a TTL of 0 stops that kind
+    of result being cached. With `method=True` the instance is left out of
+    the key.
+
+    The wrapper exposes `invalidate(*args, **kwargs)` and `cache_info()`.
+    """
+
+    def decorator(func):
+        memo = Memo(func, maxsize, max_bytes, ttl, negative_ttl, method)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return memo(*args, **kwargs)
+
+        wrapper.invalidate = memo.invalidate  # type: ignore[attr-defined]
+        wrapper.cache_info = memo.cache_info  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorator
@@ -0,0 +1,840 @@
+"""A local stand-in for the Deezer, MusicBrainz and Spotify APIs.
+
+The server speaks the subset of each API used by `dz.py`, `mb.py` and
+`sp.py`, over a synthetic catalogue generated from a seed, so the tagging
+pipeline can be load-tested on one machine without the real services.
+Each provider can be rate limited, answering over-quota requests the way
+the real service does, and every response is delayed by a log-normally
+distributed latency.
+
+All three APIs are served from one address, at their usual paths:
+Deezer at the root, MusicBrainz under /ws/2/ and Spotify under /v1/ (with
+its token endpoint at /api/token). Point the clients at it with the
+PATANGOMA_<PROVIDER>_URL settings of `patangoma.endpoints`.
+
+Run with `python -m patangoma.mockserver --help`.
+"""
+
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from patangoma.fanout import parse_duration
+from patangoma.matching import normalize
+from patangoma.ratelimit import TokenBucket, parse_limit
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+import click
+
+DEFAULT_PORT = 8080
+DEFAULT_TRACKS = 10000
+TRACKS_PER_ALBUM = 10
+ALBUMS_PER_ARTIST = 3
+
+# Page size of Deezer searches, as on the real API
+DEEZER_PAGE_SIZE = 25
+
+# Offsets of the Deezer IDs of catalogue items
+DEEZER_TRACK_IDS = 1000000
+DEEZER_ALBUM_IDS = 500000
+DEEZER_ARTIST_IDS = 100
+
+MB_NAMESPACE = "http://musicbrainz.org/ns/mmd-2.0#"
+MB_EXT_NAMESPACE = "http://musicbrainz.org/ns/ext#-2.0"
+
+ET.register_namespace("ext", MB_EXT_NAMESPACE)
+
+_WORDS = (
+    "amber", "blue", "broken", "city", "cold", "dance", "dark", "dawn",
+    "desert", "dream", "echo", "electric", "empty", "fire", "forever",
+    "gold", "golden", "heart", "highway", "home", "honey", "island",
+    "kingdom", "last", "light", "lonely", "lost", "love", "midnight",
+    "moon", "morning", "night", "ocean", "paper", "rain", "red", "river",
+    "road", "rose", "satellite", "shadow", "silver", "sky", "slow", "song",
+    "star", "stone", "summer", "sun", "sweet", "thunder", "velvet",
+    "waves", "white", "wild", "wind", "winter", "wire", "young", "zero")
+
+_GENRES = ("Pop", "Rock", "Jazz", "Electro", "Soul", "Folk", "Hip Hop")
+
+_MB_SEARCH = re.compile(r"(\w+):\(((?:\\.|[^)])*)\)")
+_DEEZER_SEARCH = re.compile(r'(\w+):"([^"]*)"')
+_SPOTIFY_SEARCH = re.compile(r"(\w+):(.*?)(?=\s+\w+:|$)")
+
+
+class Catalogue:
+    """
+    A synthetic music catalogue, the same for the same `size` and `seed`.
+
+    Artists have ALBUMS_PER_ARTIST albums of TRACKS_PER_ALBUM tracks. Every
+    track carries a Deezer, MusicBrainz and Spotify ID and an ISRC, and is
+    indexed by normalised title for searches.
+    """
+
+    def __init__(self, size: int = DEFAULT_TRACKS, seed: int = 0):
+        rng = random.Random(seed)
+        self.seed = seed
+        self.artists: List[Dict[str, Any]] = []
+        self.albums: List[Dict[str, Any]] = []
+        self.tracks: List[Dict[str, Any]] = []
+
+        albums = math.ceil(size / TRACKS_PER_ALBUM)
+        for a in range(math.ceil(albums / ALBUMS_PER_ARTIST)):
+            name = " ".join(rng.sample(_WORDS, 2)).title()
+            self.artists.append({
+                "index": a,
+                "name": f"The {name}" if a % 4 == 0 else name,
+                "mbid": self._uuid("artist", a),
+            })
+        for b in range(albums):
+            artist = self.artists[b // ALBUMS_PER_ARTIST]
+            self.albums.append({
+                "index": b,
+                "title": " ".join(rng.sample(_WORDS, 2)).title(),
+                "artist": artist,
+                "date": f"{rng.randint(1960, 2024)}-"
+                        f"{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "genre": rng.choice(_GENRES),
+                "label": f"{rng.choice(_WORDS).title()} Records",
+                "mbid": self._uuid("release", b),
+                "group_mbid": self._uuid("release-group", b),
+                "spotify_id": self._spotify_id("album", b),
+                "tracks": [],
+            })
+        for t in range(size):
+            album = self.albums[t // TRACKS_PER_ALBUM]
+            track = {
+                "index": t,
+                "title": " ".join(rng.sample(_WORDS,
+                                             rng.randint(1, 3))).title(),
+                "album": album,
+                "artist": album["artist"],
+                "position": len(album["tracks"]) + 1,
+                "duration": rng.randint(120, 420),
+                "isrc": f"QZMCK{t:07d}",
+                "mbid": self._uuid("recording", t),
+                "track_mbid": self._uuid("track", t),
+                "spotify_id": self._spotify_id("track", t),
+            }
+            album["tracks"].append(track)
+            self.tracks.append(track)
+
+        self.by_title: Dict[str, List[Dict[str, Any]]] = {}
+        for track in self.tracks:
+            self.by_title.setdefault(normalize(track["title"]),
+                                     []).append(track)
+        self.by_isrc = {track["isrc"]: track for track in self.tracks}
+        self.by_mbid = {track["mbid"]: track for track in self.tracks}
+        self.by_spotify_id = {
+            track["spotify_id"]: track
+            for track in self.tracks
+        }
+        self.albums_by_mbid = {album["mbid"]: album for album in self.albums}
+        self.albums_by_spotify_id = {
+            album["spotify_id"]: album
+            for album in self.albums
+        }
+
+    def _uuid(self, kind: str, index: int) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL,
+                              f"patangoma-mock:{self.seed}:{kind}:{index}"))
+
+    def _spotify_id(self, kind: str, index: int) -> str:
+        digest = hashlib.sha1(
+            f"{self.seed}:{kind}:{index}".encode()).digest()
+        number = int.from_bytes(digest, "big")
+        alphabet = ("0123456789abcdefghijklmnopqrstuvwxyz"
+                    "ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+        chars = []
+        for _ in range(22):
+            number, digit = divmod(number, 62)
+            chars.append(alphabet[digit])
+        return "".join(chars)
+
+    def search(self,
+               title: Optional[str],
+               artist: Optional[str] = None,
+               album: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Tracks with this title, by this artist and on this album."""
+        candidates = self.by_title.get(normalize(title), [])
+        if artist:
+            artist = normalize(artist)
+            candidates = [
+                track for track in candidates
+                if artist in normalize(track["artist"]["name"])
+            ]
+        if album:
+            album = normalize(album)
+            candidates = [
+                track for track in candidates
+                if normalize(track["album"]["title"]) == album
+            ]
+        return candidates
+
+    def search_albums(self, title: Optional[str],
+                      artist: Optional[str]) -> List[Dict[str, Any]]:
+        """Albums with this title by this artist."""
+        title, artist = normalize(title), normalize(artist)
+        return [
+            album for album in self.albums
+            if normalize(album["title"]) == title and (
+                not artist or artist in normalize(album["artist"]["name"]))
+        ]
+
+
+class MockProviderServer(ThreadingHTTPServer):
+    """
+    Serves a Catalogue through the provider APIs, from its own threads.
+
+    `latency` is the median delay of a response and `spread` the standard
+    deviation of its logarithm, so a `spread` of 0 gives a fixed delay.
+    `limits` maps providers to (rate, burst) quotas in requests per second.
+    """
+
+    daemon_threads = True
+    # Load tests open many connections at once
+    request_queue_size = 1024
+
+    def __init__(self,
+                 address: Tuple[str, int] = ("127.0.0.1", DEFAULT_PORT),
+                 catalogue: Optional[Catalogue] = None,
+                 latency: float = 0.0,
+                 spread: float = 0.0,
+                 limits: Optional[Dict[str, Tuple[float, float]]] = None):
+        super().__init__(address, MockProviderHandler)
+        self.catalogue = catalogue or Catalogue()
+        self.latency = latency
+        self.spread = spread
+        self.buckets = {
+            provider: TokenBucket(rate, burst)
+            for provider, (rate, burst) in (limits or {}).items()
+        }
+        self.requests: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockProviderServer":
+        """Serve on a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name="mock-provider-server",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def delay(self) -> float:
+        """Draw a response latency in seconds."""
+        if not self.latency:
+            return 0.0
+        return self.latency * math.exp(random.gauss(0, self.spread))
+
+    def admit(self, provider: str) -> Optional[float]:
+        """Count a request; return a Retry-After in seconds if over quota."""
+        with self._lock:
+            self.requests[provider] += 1
+        bucket = self.buckets.get(provider)
+        if bucket is None or bucket.try_acquire():
+            return None
+        with self._lock:
+            self.throttled[provider] += 1
+        return max(1.0, 1 / bucket.rate)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Return the request and throttled counts per provider."""
+        with self._lock:
+            return {
+                provider: {
+                    "requests": self.requests[provider],
+                    "throttled": self.throttled[provider],
+                }
+                for provider in sorted(self.requests)
+            }
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    """Routes a request to the Deezer, MusicBrainz or Spotify handlers."""
+
+    server: MockProviderServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str):
+        parts = urlsplit(self.path)
+        path = parts.path
+        params = {
+            name: values[-1]
+            for name, values in parse_qs(parts.query).items()
+        }
+        if path.startswith("/ws/2/"):
+            provider, handler = "musicbrainz", self._musicbrainz
+        elif path.startswith("/v1/") or path == "/api/token":
+            provider, handler = "spotify", self._spotify
+        elif path.startswith("/cover/"):
+            provider, handler = "deezer-cdn", self._cover
+        else:
+            provider, handler = "deezer", self._deezer
+
+        delay = self.server.delay()
+        if delay:
+            time.sleep(delay)
+        retry_after = self.server.admit(provider)
+        if retry_after is not None:
+            self._throttle(provider, retry_after)
+            return
+        handler(method, path, params)
+
+    def _send(self,
+              status: int,
+              body: bytes,
+              content_type: str,
+              headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _json(self, data: Any, status: int = 200,
+              headers: Optional[Dict[str, str]] = None):
+        self._send(status,
+                   json.dumps(data).encode(), "application/json", headers)
+
+    def _xml(self, root: ET.Element, status: int = 200):
+        self._send(status, ET.tostring(root, encoding="utf-8"),
+                   "application/xml; charset=utf-8")
+
+    def _throttle(self, provider: str, retry_after: float):
+        """Answer an over-quota request the way the provider does."""
+        headers = {"Retry-After": str(math.ceil(retry_after))}
+        if provider == "deezer":
+            # Deezer reports its quota with a 200 and an error code
+            self._json({
+                "error": {
+                    "type": "Exception",
+                    "message": "Quota limit exceeded",
+                    "code": 4,
+                }
+            })
+        elif provider == "musicbrainz":
+            self._send(503, b"<error><text>Rate limit exceeded</text></error>",
+                       "application/xml", headers)
+        else:
+            self._json({"error": {
+                "status": 429,
+                "message": "API rate limit exceeded"
+            }}, 429, headers)
+
+    def _deezer(self, method: str, path: str, params: Dict[str, str]):
+        catalogue = self.server.catalogue
+        base = self.server.url
+        not_found = {
+            "error": {
+                "type": "DataException",
+                "message": "no data",
+                "code": 800
+            }
+        }
+        resource, _, key = path.strip("/").partition("/")
+
+        if resource == "search":
+            fields = dict(_DEEZER_SEARCH.findall(params.get("q", "")))
+            found = catalogue.search(fields.get("track"), fields.get("artist"),
+                                     fields.get("album"))
+            index = int(params.get("index", 0))
+            limit = int(params.get("limit", DEEZER_PAGE_SIZE))
+            page = {
+                "data": [
+                    deezer_track(track, base, brief=True)
+                    for track in found[index:index + limit]
+                ],
+                "total": len(found),
+            }
+            if index + limit < len(found):
+                query = urlencode(dict(params, index=index + limit))
+                page["next"] = f"{base}/search?{query}"
+            self._json(page)
+            return
+
+        if resource == "track":
+            if key.startswith("isrc:"):
+                track = catalogue.by_isrc.get(key[5:])
+            else:
+                track = self._indexed(catalogue.tracks, key, DEEZER_TRACK_IDS)
+            self._json(deezer_track(track, base) if track else not_found)
+        elif resource == "album":
+            album = self._indexed(catalogue.albums, key, DEEZER_ALBUM_IDS)
+            self._json(deezer_album(album, base) if album else not_found)
+        elif resource == "artist":
+            artist = self._indexed(catalogue.artists, key, DEEZER_ARTIST_IDS)
+            self._json(deezer_artist(artist) if artist else not_found)
+        else:
+            self._json(not_found)
+
+    @staticmethod
+    def _indexed(items: List[Dict[str, Any]], key: str,
+                 offset: int) -> Optional[Dict[str, Any]]:
+        """Look up an item by its Deezer ID."""
+        try:
+            index = int(key) - offset
+        except ValueError:
+            return None
+        return items[index] if 0 <= index < len(items) else None
+
+    def _cover(self, method: str, path: str, params: Dict[str, str]):
+        """Serve a tiny cover image, with validators for revalidation."""
+        body = hashlib.sha256(path.encode()).digest()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(0, usegmt=True),
+            "Cache-Control": "max-age=86400",
+        }
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, b"", "image/jpeg", headers)
+            return
+        self._send(200, b"\xff\xd8\xff\xe0" + body + b"\xff\xd9",
+                   "image/jpeg", headers)
+
+    def _musicbrainz(self, method: str, path: str, params: Dict[str, str]):
+        catalogue = self.server.catalogue
+        entity, _, key = path[len("/ws/2/"):].strip("/").partition("/")
+        includes = set(params.get("inc", "").split())
+        root = ET.Element("metadata", {"xmlns": MB_NAMESPACE})
+
+        if entity == "recording" and not key:
+            fields = mb_search_fields(params.get("query", ""))
+            found = catalogue.search(fields.get("recording"),
+                                     fields.get("artist"))
+            found = found[:int(params.get("limit", 25))]
+            listing = ET.SubElement(root, "recording-list", {
+                "count": str(len(found)),
+                "offset": "0"
+            })
+            for track in found:
+                listing.append(
+                    mb_recording(track, {"releases", "isrcs"}, score=100))
+        elif entity == "recording":
+            track = catalogue.by_mbid.get(key)
+            if track is None:
+                self._xml(mb_not_found(), 404)
+                return
+            root.append(mb_recording(track, includes))
+        elif entity == "release" and not key:
+            fields = mb_search_fields(params.get("query", ""))
+            found = catalogue.search_albums(fields.get("release"),
+                                            fields.get("artist"))
+            found = found[:int(params.get("limit", 25))]
+            listing = ET.SubElement(root, "release-list", {
+                "count": str(len(found)),
+                "offset": "0"
+            })
+            for album in found:
+                listing.append(mb_release(album, set(), score=100))
+        elif entity == "release":
+            album = catalogue.albums_by_mbid.get(key)
+            if album is None:
+                self._xml(mb_not_found(), 404)
+                return
+            root.append(mb_release(album, includes))
+        elif entity == "isrc":
+            track = catalogue.by_isrc.get(key)
+            if track is None:
+                self._xml(mb_not_found(), 404)
+                return
+            isrc = ET.SubElement(root, "isrc", {"id": key})
+            listing = ET.SubElement(isrc, "recording-list", {"count": "1"})
+            listing.append(mb_recording(track, {"releases", "artists"}))
+        else:
+            self._xml(mb_not_found(), 404)
+            return
+        self._xml(root)
+
+    def _spotify(self, method: str, path: str, params: Dict[str, str]):
+        catalogue = self.server.catalogue
+        if path == "/api/token":
+            self._json({
+                "access_token": "mock-token",
+                "token_type": "Bearer",
+                "expires_in": 3600,
+            })
+            return
+
+        not_found = {"error": {"status": 404, "message": "Non existing id"}}
+        resource, _, key = path[len("/v1/"):].strip("/").partition("/")
+        if resource == "search":
+            fields = spotify_search_fields(params.get("q", ""))
+            if "isrc" in fields:
+                track = catalogue.by_isrc.get(fields["isrc"].upper())
+                found = [track] if track else []
+            else:
+                found = catalogue.search(fields.get("track"),
+                                         fields.get("artist"),
+                                         fields.get("album"))
+            offset = int(params.get("offset", 0))
+            limit = int(params.get("limit", 10))
+            self._json({
+                "tracks": {
+                    "items": [
+                        spotify_track(track)
+                        for track in found[offset:offset + limit]
+                    ],
+                    "limit": limit,
+                    "offset": offset,
+                    "total": len(found),
+                    "next": None,
+                    "previous": None,
+                }
+            })
+        elif resource == "tracks" and key:
+            track = catalogue.by_spotify_id.get(key)
+            if track is None:
+                self._json(not_found, 404)
+                return
+            self._json(spotify_track(track))
+        elif resource == "tracks":
+            ids = [i for i in params.get("ids", "").split(",") if i]
+            self._json({
+                "tracks": [
+                    spotify_track(catalogue.by_spotify_id[i])
+                    if i in catalogue.by_spotify_id else None for i in ids
+                ]
+            })
+        elif resource == "albums" and key:
+            album = catalogue.albums_by_spotify_id.get(key)
+            if album is None:
+                self._json(not_found, 404)
+                return
+            self._json(spotify_album(album, tracks=True))
+        else:
+            self._json(not_found, 404)
+
+
+def deezer_artist(artist: Dict[str, Any]) -> Dict[str, Any]:
+    artist_id = DEEZER_ARTIST_IDS + artist["index"]
+    return {
+        "id": artist_id,
+        "name": artist["name"],
+        "link": f"https://www.deezer.com/artist/{artist_id}",
+        "type": "artist",
+    }
+
+
+def deezer_album(album: Dict[str, Any],
+                 base: str,
+                 brief: bool = False) -> Dict[str, Any]:
+    album_id = DEEZER_ALBUM_IDS + album["index"]
+    data = {
+        "id": album_id,
+        "title": album["title"],
+        "cover_big": f"{base}/cover/{album_id}.jpg",
+        "type": "album",
+    }
+    if brief:
+        return data
+    return dict(data,
+                link=f"https://www.deezer.com/album/{album_id}",
+                genres={
+                    "data": [{
+                        "id": _GENRES.index(album["genre"]) + 1,
+                        "name": album["genre"],
+                        "type": "genre",
+                    }]
+                },
+                label=album["label"],
+                nb_tracks=len(album["tracks"]),
+                release_date=album["date"],
+                record_type="album",
+                artist=deezer_artist(album["artist"]),
+                tracks={
+                    "data": [
+                        deezer_track(track, base, brief=True)
+                        for track in album["tracks"]
+                    ]
+                })
+
+
+def deezer_track(track: Dict[str, Any],
+                 base: str,
+                 brief: bool = False) -> Dict[str, Any]:
+    track_id = DEEZER_TRACK_IDS + track["index"]
+    data = {
+        "id": track_id,
+        "readable": True,
+        "title": track["title"],
+        "title_short": track["title"],
+        "link": f"https://www.deezer.com/track/{track_id}",
+        "duration": track["duration"],
+        "rank": 500000,
+        "artist": deezer_artist(track["artist"]),
+        "album": deezer_album(track["album"], base, brief=True),
+        "type": "track",
+    }
+    if brief:
+        return data
+    return dict(data,
+                isrc=track["isrc"],
+                track_position=track["position"],
+                disk_number=1,
+                release_date=track["album"]["date"],
+                contributors=[deezer_artist(track["artist"])])
+
+
+def _text(parent: ET.Element, tag: str, text: Any,
+          attributes: Optional[Dict[str, str]] = None) -> ET.Element:
+    element = ET.SubElement(parent, tag, attributes or {})
+    element.text = str(text)
+    return element
+
+
+def mb_search_fields(query: str) -> Dict[str, str]:
+    """Parse the `field:(value)` terms of a musicbrainzngs search."""
+    return {
+        field: re.sub(r"\\(.)", r"\1", value)
+        for field, value in _MB_SEARCH.findall(query)
+    }
+
+
+def mb_not_found() -> ET.Element:
+    error = ET.Element("error")
+    _text(error, "text", "Not Found")
+    return error
+
+
+def mb_artist_credit(artist: Dict[str, Any]) -> ET.Element:
+    credit = ET.Element("artist-credit")
+    name_credit = ET.SubElement(credit, "name-credit")
+    element = ET.SubElement(name_credit, "artist", {"id": artist["mbid"]})
+    _text(element, "name", artist["name"])
+    _text(element, "sort-name", artist["name"])
+    return credit
+
+
+def mb_recording(track: Dict[str, Any],
+                 includes: set,
+                 score: Optional[int] = None) -> ET.Element:
+    attributes = {"id": track["mbid"]}
+    if score is not None:
+        attributes[f"{{{MB_EXT_NAMESPACE}}}score"] = str(score)
+    recording = ET.Element("recording", attributes)
+    _text(recording, "title", track["title"])
+    _text(recording, "length", track["duration"] * 1000)
+    recording.append(mb_artist_credit(track["artist"]))
+    if "releases" in includes:
+        listing = ET.SubElement(recording, "release-list", {"count": "1"})
+        release = mb_release(track["album"], set())
+        medium = ET.SubElement(
+            ET.SubElement(release, "medium-list", {"count": "1"}), "medium")
+        _text(medium, "position", 1)
+        _text(medium, "format", "Digital Media")
+        tracks = ET.SubElement(medium, "track-list", {
+            "count": str(len(track["album"]["tracks"])),
+            "offset": str(track["position"] - 1),
+        })
+        tracks.append(mb_track(track, recording=False))
+        listing.append(release)
+    if "isrcs" in includes:
+        isrcs = ET.SubElement(recording, "isrc-list", {"count": "1"})
+        ET.SubElement(isrcs, "isrc", {"id": track["isrc"]})
+    return recording
+
+
+def mb_track(track: Dict[str, Any], recording: bool = True) -> ET.Element:
+    element = ET.Element("track", {"id": track["track_mbid"]})
+    _text(element, "position", track["position"])
+    _text(element, "number", track["position"])
+    _text(element, "title", track["title"])
+    _text(element, "length", track["duration"] * 1000)
+    if recording:
+        element.append(mb_recording(track, set()))
+    return element
+
+
+def mb_release(album: Dict[str, Any],
+               includes: set,
+               score: Optional[int] = None) -> ET.Element:
+    attributes = {"id": album["mbid"]}
+    if score is not None:
+        attributes[f"{{{MB_EXT_NAMESPACE}}}score"] = str(score)
+    release = ET.Element("release", attributes)
+    _text(release, "title", album["title"])
+    _text(release, "status", "Official")
+    release.append(mb_artist_credit(album["artist"]))
+    group = ET.SubElement(release, "release-group", {
+        "id": album["group_mbid"],
+        "type": "Album"
+    })
+    _text(group, "title", album["title"])
+    _text(group, "primary-type", "Album")
+    _text(release, "date", album["date"])
+    _text(release, "country", "XW")
+    if score is not None:
+        media = ET.SubElement(release, "medium-list", {"count": "1"})
+        _text(media, "track-count", len(album["tracks"]))
+        medium = ET.SubElement(media, "medium")
+        _text(medium, "format", "Digital Media")
+        ET.SubElement(medium, "track-list",
+                      {"count": str(len(album["tracks"]))})
+    elif "recordings" in includes:
+        media = ET.SubElement(release, "medium-list", {"count": "1"})
+        medium = ET.SubElement(media, "medium")
+        _text(medium, "position", 1)
+        _text(medium, "format", "Digital Media")
+        tracks = ET.SubElement(medium, "track-list",
+                               {"count": str(len(album["tracks"]))})
+        for track in album["tracks"]:
+            tracks.append(mb_track(track))
+    return release
+
+
+def spotify_search_fields(query: str) -> Dict[str, str]:
+    """Parse the `field:value` terms of a Spotify search."""
+    # sp.py encodes spaces itself, so they arrive encoded twice
+    query = unquote(query)
+    return {
+        field: value.strip()
+        for field, value in _SPOTIFY_SEARCH.findall(query)
+    }
+
+
+def spotify_album(album: Dict[str, Any],
+                  tracks: bool = False) -> Dict[str, Any]:
+    data = {
+        "id": album["spotify_id"],
+        "name": album["title"],
+        "album_type": "album",
+        "release_date": album["date"],
+        "release_date_precision": "day",
+        "total_tracks": len(album["tracks"]),
+        "artists": [spotify_artist(album["artist"])],
+        "images": [],
+        "type": "album",
+    }
+    if tracks:
+        items = [spotify_track(track) for track in album["tracks"]]
+        data["tracks"] = {
+            "items": items,
+            "total": len(items),
+            "limit": 50,
+            "offset": 0,
+            "next": None,
+        }
+        data["label"] = album["label"]
+        data["genres"] = [album["genre"]]
+    return data
+
+
+def spotify_artist(artist: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": f"artist{artist['index']}",
+        "name": artist["name"],
+        "type": "artist",
+    }
+
+
+def spotify_track(track: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": track["spotify_id"],
+        "name": track["title"],
+        "artists": [spotify_artist(track["artist"])],
+        "album": spotify_album(track["album"]),
+        "disc_number": 1,
+        "track_number": track["position"],
+        "duration_ms": track["duration"] * 1000,
+        "external_ids": {
+            "isrc": track["isrc"]
+        },
+        "external_urls": {
+            "spotify":
+            f"https://open.spotify.com/track/{track['spotify_id']}"
+        },
+        "popularity": 50,
+        "type": "track",
+    }
+
+
+def parse_limits(values) -> Dict[str, Tuple[float, float]]:
+    """Parse PROVIDER=RATE[/BURST] options into (rate, burst) quotas."""
+    limits = {}
+    for value in values:
+        provider, _, limit = value.partition("=")
+        try:
+            limits[provider] = parse_limit(limit)
+        except ValueError:
+            raise click.BadParameter(
+                f"{value} (expected PROVIDER=RATE[/BURST])")
+    return limits
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True,
+              help='Address to listen on')
+@click.option('--port', '-p', type=int, default=DEFAULT_PORT,
+              show_default=True, help='Port to listen on')
+@click.option('--tracks', '-n', type=click.IntRange(min=1),
+              default=DEFAULT_TRACKS, show_default=True,
+              help='Number of tracks in the catalogue')
+@click.option('--seed', type=int, default=0, show_default=True,
+              help='Seed of the catalogue')
+@click.option('--latency', default='0',
+              show_default=True,
+              help='Median response latency, e.g. 80ms or 1s')
+@click.option('--spread', type=click.FloatRange(min=0), default=0.0,
+              show_default=True,
+              help='Log-normal spread of the latency (0 for a fixed delay)')
+@click.option('--rate-limit', 'limits', multiple=True,
+              metavar='PROVIDER=RATE[/BURST]',
+              help='Quota of a provider, in requests per second')
+def serve(host, port, tracks, seed, latency, spread, limits):
+    """Serve a synthetic catalogue through mock provider APIs"""
+    try:
+        latency = parse_duration(latency)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--latency")
+    server = MockProviderServer((host, port), Catalogue(tracks, seed),
+                                latency, spread, parse_limits(limits))
+    click.echo(f"Serving {tracks} tracks on {server.url}")
+    click.echo(f"Point the clients at it with PATANGOMA_DEEZER_URL, "
+               f"PATANGOMA_MUSICBRAINZ_URL and PATANGOMA_SPOTIFY_URL="
+               f"{server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        for provider, counts in server.stats().items():
+            click.echo(f"{provider}: {counts['requests']} requests, "
+                       f"{counts['throttled']} throttled")
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,7 +1,8 @@
-from cachetools import TTLCache
+from patangoma.cache import MISSING, get_response_cache, normalize_query
 from patangoma.data_store import DataStore
 from patangoma.dz import DeezerAPI
 from patangoma.mb import MusicBrainzAPI
+from patangoma.resilience import ProviderError
 from patangoma.track import TrackInfo
 from typing import Optional, List, Dict, Any
 import logging
@@ -18,7 +19,9 @@ from patangoma.id_extractor import (
 class Query:
     """ Class that handles the query to the MusicBrainzAPI """
 
-    def __init__(self, track_info: TrackInfo, data_store: DataStore):
+    def __init__(self,
+                 track_info: Optional[TrackInfo] = None,
+                 data_store: Optional[DataStore] = None):
 
         self.track_info = track_info
         self.mb_api = MusicBrainzAPI()
@@ -26,25 +29,20 @@ class Query:
         self.data_store = data_store
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        self.cache = TTLCache(maxsize=100, ttl=3600)  # Cache for 1 hour
+        self.cache = get_response_cache()
         self.fetched_data = None
 
     def fetch_musicbrainz_data(self, title: Optional[str],
                                artist: Optional[str]) -> List[Dict[str, Any]]:
         # Extract title and artist from TrackInfo
-        if not (self.track_info.title and self.track_info.artist):
+        if self.track_info is not None and not (self.track_info.title
+                                                and self.track_info.artist):
             title = self.track_info.title
             artist = self.track_info.artist
         # else:
         #     click.secho("Error: Missing title or artist", fg="red")
         #     exit(1)
 
-        cache_key = (title, artist)
-
-        if cache_key in self.cache:
-            self.logger.info("Using cached result for MusicBrainz query.")
-            return self.cache[cache_key]
-
         try:
             # qparams = {}
 
@@ -54,11 +52,10 @@ class Query:
             # qparams = self.translate_query_params(
             #     self.track_info.get_params()) if self.track_info else {}
 
-            result = self.mb_api.search_track(title, artist)
+            result = self.musicbrainz_recordings(title, artist)
 
             if result:
                 translated_data_list = []
-                self.cache[cache_key] = result
 
                 for idx, res in enumerate(result, start=1):
                     flat_result = self.flatten_dict(res)
@@ -69,6 +66,8 @@ class Query:
 
                 return translated_data_list
                 # return self.mb_api.translate_mb_result(result[0])
+        except ProviderError:
+            raise
         except Exception as e:
             print(f"Error searching track on MusicBrainz: {str(e)}")
 
@@ -95,11 +94,11 @@ class Query:
                 An empty list if an error occurs or no matches are found.
         """
         try:
-            if not (title and artist):
+            if not (title and artist) and self.track_info is not None:
                 title = self.track_info.title
                 artist = self.track_info.artist
 
-            results = self.dz_api.search_track(title, artist, album)
+            results = self.deezer_tracks(title, artist, album)
 
             if results:
                 data_list: List[Dict[str, Any]] = []
@@ -110,11 +109,43 @@ class Query:
 
                 return data_list
 
+        except ProviderError:
+            raise
         except Exception as e:
             print(f"Error searching track on Deezer: {str(e)}")
 
         return []
 
+    def musicbrainz_recordings(self, title: Optional[str],
+                               artist: Optional[str]) -> List[Dict[str, Any]]:
+        """Search MusicBrainz recordings, through the response cache.
+
+        Raises ProviderError if MusicBrainz fails; failures are not cached.
+        """
+        cache_key = normalize_query("search_recordings", title, artist)
+        result = self.cache.get("musicbrainz", cache_key)
+        if result is MISSING:
+            result = self.mb_api.search_track(title, artist)
+            self.cache.set("musicbrainz", cache_key, result)
+        else:
+            self.logger.info("Using cached result for MusicBrainz query.")
+        return result
+
+    def deezer_tracks(self, title: Optional[str], artist: Optional[str],
+                      album: Optional[str]) -> List[Dict[str, Any]]:
+        """Search Deezer tracks, through the response cache.
+
+        Raises ProviderError if Deezer fails; failures are not cached.
+        """
+        cache_key = normalize_query("search", title, artist, album)
+        results = self.cache.get("deezer", cache_key)
+        if results is MISSING:
+            results = self.dz_api.search_track(title, artist, album)
+            self.cache.set("deezer", cache_key, results)
+        else:
+            self.logger.info("Using cached result for Deezer query.")
+        return results
+
     def fetch_spotify_data(self):
         pass
 
@@ -189,5 +220,6 @@ class Query:
         return data
 
     def store_metadata(self, source, data: dict):
-        """Store the metadata in the DataStore"""
-        self.data_store.add_metadata(source, data)
+        """Store the metadata in the DataStore, if there is one"""
+        if self.data_store is not None:
+            self.data_store.add_metadata(source, data)
@@ -0,0 +1,153 @@
+"""Per-provider token buckets pacing requests to the metadata services.
+
+Each provider gets one bucket per process, shared by every thread, so a
+pool of workers together stays within the provider's quota. Limits are
+given as "rate[/burst]" in requests per second, and can be overridden
+with PATANGOMA_RATE_LIMIT_<PROVIDER> environment variables (or a .env
+file), e.g. PATANGOMA_RATE_LIMIT_DEEZER=10/50.
+"""
+
+import email.utils
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from patangoma.endpoints import provider_for_endpoint
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Documented or observed quotas, as (requests per second, burst)
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "musicbrainz": (1.0, 1.0),
+    "deezer": (10.0, 50.0),  # 50 requests per 5 seconds
+    "spotify": (10.0, 10.0),
+    "discogs": (1.0, 5.0),  # 60 requests per minute with a token
+}
+
+# API hosts whose requests count against a provider's quota
+PROVIDER_HOSTS = {
+    "api.deezer.com": "deezer",
+    "api.spotify.com": "spotify",
+    "musicbrainz.org": "musicbrainz",
+    "api.discogs.com": "discogs",
+}
+
+# Longest Retry-After delay honoured; longer delays are clamped to this and
+# the request is retried after it
+MAX_RETRY_AFTER = 120.0
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled at `rate` tokens per second.
+
+    Callers reserve tokens in arrival order: when the bucket is empty the
+    balance goes negative and each caller sleeps until its share has been
+    refilled, so concurrent callers are spread exactly `1 / rate` apart.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take `tokens`, sleeping until they are available.
+
+        Returns the number of seconds spent waiting.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take `tokens` if they are available now, without waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < tokens:
+                return False
+            self._tokens -= tokens
+            return True
+
+    def defer(self, seconds: float):
+        """Hold back every caller for `seconds`, e.g. after a Retry-After.
+
+        The next caller not already waiting gets its token `seconds` from
+        now, or later if the bucket is already held back further.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, 1.0 - seconds * self.rate)
+
+
+_limiters: Dict[str, Optional[TokenBucket]] = {}
+_limiters_lock = threading.Lock()
+
+
+def parse_limit(value: str) -> Tuple[float, float]:
+    """Parse a "rate[/burst]" limit string."""
+    rate, _, burst = value.partition("/")
+    return float(rate), float(burst or 1.0)
+
+
+def get_limiter(provider: str) -> Optional[TokenBucket]:
+    """Return the provider's shared bucket, or None if it is unlimited."""
+    with _limiters_lock:
+        if provider not in _limiters:
+            load_dotenv()
+            limit = DEFAULT_LIMITS.get(provider)
+            setting = os.getenv(f"PATANGOMA_RATE_LIMIT_{provider.upper()}")
+            if setting:
+                limit = parse_limit(setting)
+            _limiters[provider] = TokenBucket(*limit) if limit else None
+        return _limiters[provider]
+
+
+def configure_limiter(provider: str,
+                      rate: Optional[float],
+                      burst: float = 1.0) -> Optional[TokenBucket]:
+    """Replace a provider's limit; a `rate` of None removes the limit."""
+    with _limiters_lock:
+        bucket = TokenBucket(rate, burst) if rate else None
+        _limiters[provider] = bucket
+        return bucket
+
+
+def provider_for_url(url: str) -> Optional[str]:
+    """Return the provider whose quota a request to `url` counts against."""
+    provider = provider_for_endpoint(url)
+    if provider:
+        return provider
+    host = urlsplit(url).hostname or ""
+    for provider_host, provider in PROVIDER_HOSTS.items():
+        if host == provider_host or host.endswith("." + provider_host):
+            return provider
+    return None
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Convert a Retry-After header (seconds or HTTP date) to seconds."""
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = date.timestamp() - time.time()
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
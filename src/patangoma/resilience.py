@@ -0,0 +1,223 @@
+"""Retries with jittered backoff, and circuit breakers, for the providers.
+
+`call` runs a provider request and tells three outcomes apart:
+- an answer, which is returned;
+- "not found" (a 404, or Deezer's "no data"), for which `not_found` is
+  returned, as it is a valid answer rather than a failure;
+- a failure, which raises ProviderError once retries are exhausted.
+
+Transient failures (timeouts, dropped connections, 429 and 5xx answers)
+are retried with full-jitter exponential backoff. Each provider has one
+circuit breaker per process: after FAILURE_THRESHOLD failed calls in a
+row, calls fail fast with CircuitOpenError for RESET_TIMEOUT seconds,
+then a single trial call decides whether the circuit closes again.
+"""
+
+import random
+import threading
+import time
+import deezer.exceptions
+import musicbrainzngs
+import requests
+import spotipy
+import spotipy.oauth2
+from typing import Any, Callable, Dict, Optional
+
+RETRY_ATTEMPTS = 3
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 8.0  # seconds
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0  # seconds
+
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Deezer error codes: quota exceeded, service busy, and no data
+DEEZER_RETRYABLE_CODES = (4, 700)
+DEEZER_NOT_FOUND_CODE = 800
+
+# Exceptions through which the provider clients report a failed request;
+# anything else raised by a request is a bug and propagates as it is
+PROVIDER_ERRORS = (
+    requests.RequestException,
+    musicbrainzngs.WebServiceError,
+    deezer.exceptions.DeezerAPIException,
+    spotipy.SpotifyException,
+    spotipy.oauth2.SpotifyOauthError,
+    ConnectionError,
+    TimeoutError,
+)
+
+
+class ProviderError(Exception):
+    """A provider request failed, as opposed to finding nothing."""
+
+    def __init__(self, provider: str, message: str, retryable: bool = False):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.retryable = retryable
+
+
+class CircuitOpenError(ProviderError):
+    """A provider is skipped after failing repeatedly."""
+
+    def __init__(self, provider: str):
+        super().__init__(provider,
+                         "too many recent failures, skipping requests",
+                         retryable=True)
+
+
+def status_of(error: BaseException) -> Optional[int]:
+    """The HTTP status behind a provider client's exception, if any."""
+    if isinstance(error, spotipy.SpotifyException):
+        return error.http_status
+    for cause in (error, getattr(error, "cause", None), error.__cause__):
+        response = getattr(cause, "response", None)
+        if response is not None and hasattr(response, "status_code"):
+            return response.status_code
+        code = getattr(cause, "code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def deezer_error_code(error: BaseException) -> Optional[int]:
+    """The code of a Deezer error response, if `error` is one."""
+    if isinstance(error, deezer.exceptions.DeezerErrorResponse):
+        return (error.json_data.get("error") or {}).get("code")
+    return None
+
+
+def is_not_found(error: BaseException) -> bool:
+    """Whether `error` means the provider has nothing for the request."""
+    return (status_of(error) == 404
+            or deezer_error_code(error) == DEEZER_NOT_FOUND_CODE)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether `error` is transient and the request may succeed later."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout,
+                          musicbrainzngs.NetworkError,
+                          deezer.exceptions.DeezerRetryableException,
+                          ConnectionError, TimeoutError)):
+        return True
+    if deezer_error_code(error) in DEEZER_RETRYABLE_CODES:
+        return True
+    return status_of(error) in RETRYABLE_STATUSES
+
+
+def backoff_delay(attempt: int,
+                  base: float = BACKOFF_BASE,
+                  cap: float = BACKOFF_MAX) -> float:
+    """Full-jitter exponential backoff before retry number `attempt`."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class CircuitBreaker:
+    """
+    Counts a provider's consecutive failed calls and opens after too many.
+
+    While open, `allow` refuses calls until `reset_timeout` has passed;
+    then one caller is let through as a trial, and its outcome closes the
+    circuit or opens it for another period.
+    """
+
+    def __init__(self,
+                 threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """One of "closed", "open" or "half-open"."""
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return "open"
+            return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if (time.monotonic() - self.opened_at < self.reset_timeout
+                    or self._trial):
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release_trial(self):
+        """Give up a trial call that ended without an answer or failure."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """Return the provider's shared circuit breaker."""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker()
+        return _breakers[provider]
+
+
+def call(provider: str,
+         request: Callable[[], Any],
+         not_found: Any = None,
+         attempts: int = RETRY_ATTEMPTS) -> Any:
+    """
+    Run `request` for `provider` with retries and the circuit breaker.
+
+    Returns the request's result, or `not_found` if the provider has
+    nothing for it. Raises ProviderError if it fails, and CircuitOpenError
+    without calling it if the provider has been failing. Exceptions other
+    than PROVIDER_ERRORS propagate unchanged and do not count either way.
+    """
+    breaker = get_breaker(provider)
+    if not breaker.allow():
+        raise CircuitOpenError(provider)
+
+    for attempt in range(attempts):
+        try:
+            result = request()
+        except PROVIDER_ERRORS as e:
+            if is_not_found(e):
+                breaker.record_success()
+                return not_found
+            if not is_retryable(e):
+                # The provider answered; the request itself is at fault
+                breaker.record_success()
+                raise ProviderError(provider, str(e)) from e
+            if attempt == attempts - 1:
+                breaker.record_failure()
+                raise ProviderError(provider, str(e), retryable=True) from e
+            time.sleep(backoff_delay(attempt))
+        except BaseException:
+            breaker.release_trial()
+            raise
+        else:
+            breaker.record_success()
+            return result
@@ -0,0 +1,234 @@
+"""Direct lookups by the identifiers a file already carries.
+
+A file tagged with a MusicBrainz recording ID, an ISRC, or a Spotify or
+Deezer track link in its comments or url tag can be resolved with one ID
+lookup instead of a free-text search and candidate scoring. The answer
+to an ID lookup does not change, so it is cached without expiry.
+"""
+
+import logging
+import re
+from patangoma.cache import (
+    MISSING,
+    ResponseCache,
+    get_response_cache,
+    normalize_query,
+)
+from patangoma.id_extractor import deezer_id_regex, spotify_id_regex
+from patangoma.matching import match_score
+from patangoma.query import Query
+from patangoma.resilience import ProviderError, call
+from patangoma.sp import spotify_client, spotify_track_updates
+from patangoma.track import TrackInfo
+from typing import Any, Callable, Dict, List, Optional
+
+# Tags scanned for Spotify and Deezer track links
+LINK_FIELDS = ("comments", "url")
+
+# Most IDs Spotify's several-tracks endpoint accepts per request
+SPOTIFY_TRACK_BATCH = 50
+
+_ISRC = re.compile(r"^[A-Z]{2}[A-Z0-9]{3}\d{7}$")
+
+
+def normalize_isrc(value: Optional[str]) -> Optional[str]:
+    """Return the ISRC in canonical form, or None if it is not valid."""
+    if not value:
+        return None
+    isrc = re.sub(r"[\s-]", "", str(value)).upper()
+    return isrc if _ISRC.match(isrc) else None
+
+
+def linked_id(regex: Dict[str, Any], kind: str, text: str) -> Optional[str]:
+    """
+    Find the ID of a `kind` ("track", "album") link in free text.
+
+    Bare IDs are ignored, as any number or word in a comment would pass
+    for one; only full links are taken.
+    """
+    for match in re.finditer(regex["pattern"].format(kind), text):
+        if f"{kind}/" in match.group(0):
+            return match.group(regex["match_group"])
+    return None
+
+
+class IDResolver:
+    """
+    Resolves files to tag updates through the IDs they already carry.
+
+    For each source, the identifiers are tried in order: MusicBrainz uses
+    the recording ID then the ISRC, Deezer and Spotify a track link then
+    the ISRC. `resolve` returns None when no identifier leads to a track,
+    and the caller falls back to searching.
+    """
+
+    def __init__(self, query: Query, cache: Optional[ResponseCache] = None):
+        self.query = query
+        self.cache = cache or get_response_cache()
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+
+    def identifiers(self, track: TrackInfo) -> Dict[str, str]:
+        """Collect the identifiers found in a file's tags."""
+        metadata = track.metadata
+        ids = {}
+        if metadata.mb_trackid:
+            ids["mb_trackid"] = metadata.mb_trackid
+        isrc = normalize_isrc(metadata.isrc)
+        if isrc:
+            ids["isrc"] = isrc
+
+        links = " ".join(
+            str(getattr(metadata, field, None) or "") for field in LINK_FIELDS)
+        spotify_id = linked_id(spotify_id_regex, "track", links)
+        if spotify_id:
+            ids["spotify_id"] = spotify_id
+        deezer_id = linked_id(deezer_id_regex, "track", links)
+        if deezer_id:
+            ids["deezer_id"] = deezer_id
+        return ids
+
+    def resolve(self, track: TrackInfo,
+                source: str) -> Optional[Dict[str, Any]]:
+        """Return tag updates from a direct lookup, or None."""
+        ids = self.identifiers(track)
+        lookups: Dict[str, List[tuple]] = {
+            "musicbrainz": [("mb_trackid", self._mb_recording),
+                            ("isrc", self._mb_isrc)],
+            "deezer": [("deezer_id", self._dz_track),
+                       ("isrc", self._dz_isrc)],
+            "spotify": [("spotify_id", self._sp_track),
+                        ("isrc", self._sp_isrc)],
+        }
+
+        for name, lookup in lookups.get(source, []):
+            if name not in ids:
+                continue
+            try:
+                updates = lookup(ids[name], track)
+            except Exception as e:
+                self.logger.error(
+                    f"Error looking up {name} {ids[name]} on {source}: {e}")
+                continue
+            if updates:
+                return updates
+        return None
+
+    def prefetch(self, tracks: List[TrackInfo], source: str) -> int:
+        """
+        Warm the cache for many files with as few requests as possible.
+
+        Spotify tracks are fetched SPOTIFY_TRACK_BATCH IDs at a time, so
+        `resolve` then answers those files from the cache. Other sources
+        have no bulk endpoint and are left alone. Returns the number of
+        requests made.
+        """
+        if source != "spotify":
+            return 0
+
+        missing = []
+        for track in tracks:
+            track_id = self.identifiers(track).get("spotify_id")
+            if track_id and track_id not in missing and self.cache.get(
+                    "spotify", normalize_query("track", track_id)) is MISSING:
+                missing.append(track_id)
+
+        requests = 0
+        for start in range(0, len(missing), SPOTIFY_TRACK_BATCH):
+            batch = missing[start:start + SPOTIFY_TRACK_BATCH]
+            try:
+                result = call("spotify",
+                              lambda: spotify_client().tracks(batch))
+            except ProviderError as e:
+                self.logger.error(f"Error fetching tracks from Spotify: {e}")
+                continue
+            requests += 1
+            # Unknown IDs come back as None and are cached as no-matches
+            for track_id, item in zip(batch, result["tracks"]):
+                self.cache.set("spotify",
+                               normalize_query("track", track_id),
+                               item or {},
+                               ttl=None)
+        return requests
+
+    def _cached(self, provider: str, kind: str, key: str,
+                fetch: Callable[[], Any]) -> Any:
+        """Run an ID lookup once; found results are kept forever.
+
+        A lookup that finds nothing is cached for the cache's negative TTL,
+        one that fails raises and is not cached.
+        """
+        cache_key = normalize_query(kind, key)
+        result = self.cache.get(provider, cache_key)
+        if result is MISSING:
+            result = fetch()
+            self.cache.set(provider, cache_key, result, ttl=None)
+        return result
+
+    @staticmethod
+    def _best(track: TrackInfo, candidates: List[Dict[str, Any]],
+              title: Callable, artist: Callable) -> Optional[Dict[str, Any]]:
+        """Pick the candidate closest to the file, for shared ISRCs."""
+        if not candidates:
+            return None
+        return max(candidates,
+                   key=lambda c: match_score(track.title, track.artist,
+                                             title(c), artist(c)))
+
+    def _mb_updates(self, recording: Dict[str, Any]) -> Dict[str, Any]:
+        mb_api = self.query.mb_api
+        updates = mb_api.translate_mb_result(
+            self.query.flatten_dict(recording))
+        updates.pop("score", None)
+        updates.pop("mb_workid", None)
+        updates["mb_trackid"] = recording["id"]
+        return updates
+
+    def _mb_recording(self, recording_id: str, track: TrackInfo):
+        recording = self._cached(
+            "musicbrainz", "recording", recording_id,
+            lambda: self.query.mb_api.get_recording(recording_id))
+        return self._mb_updates(recording) if recording else None
+
+    def _mb_isrc(self, isrc: str, track: TrackInfo):
+        recordings = self._cached("musicbrainz", "isrc", isrc,
+                                  lambda: self.query.mb_api.search_isrc(isrc))
+        best = self._best(track, recordings, lambda r: r.get("title"),
+                          lambda r: r.get("artist-credit-phrase"))
+        return self._mb_updates(best) if best else None
+
+    def _dz_track(self, track_id: str, track: TrackInfo):
+        dz_api = self.query.dz_api
+        result = self._cached("deezer", "track", track_id,
+                              lambda: dz_api.get_track_by_id(int(track_id)))
+        return dz_api.fetch_details(result, full=True) if result else None
+
+    def _dz_isrc(self, isrc: str, track: TrackInfo):
+        dz_api = self.query.dz_api
+        result = self._cached("deezer", "isrc", isrc,
+                              lambda: dz_api.get_track_by_isrc(isrc))
+        return dz_api.fetch_details(result, full=True) if result else None
+
+    def _sp_track(self, track_id: str, track: TrackInfo):
+
+        def fetch():
+            return call("spotify",
+                        lambda: spotify_client().track(track_id),
+                        not_found={})
+
+        result = self._cached("spotify", "track", track_id, fetch)
+        return spotify_track_updates(result) if result else None
+
+    def _sp_isrc(self, isrc: str, track: TrackInfo):
+
+        def fetch():
+            result = call(
+                "spotify", lambda: spotify_client().search(
+                    f"isrc:{isrc}", limit=5, type="track"))
+            return (result or {}).get("tracks", {}).get("items", [])
+
+        items = self._cached("spotify", "isrc", isrc, fetch)
+        best = self._best(
+            track, items, lambda t: t.get("name"),
+            lambda t: ", ".join(a.get("name", "") for a in t["artists"]))
+        return spotify_track_updates(best) if best else None
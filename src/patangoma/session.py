@@ -0,0 +1,139 @@
+"""A process-wide, connection-pooled HTTP session shared by the providers.
+
+Reusing one `requests.Session` keeps TCP/TLS connections to Deezer, Spotify
+and the cover art CDNs alive between calls, so a batch run pays the
+handshake once per host instead of once per request. Requests to the
+provider APIs are paced by the limiters in `patangoma.ratelimit`.
+
+The pool size and default timeout can be set with the
+PATANGOMA_HTTP_POOL_SIZE and PATANGOMA_HTTP_TIMEOUT environment variables
+(or a .env file), or with `configure_session`.
+"""
+
+import os
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+from patangoma.ratelimit import (
+    get_limiter,
+    parse_retry_after,
+    provider_for_url,
+)
+from patangoma.transport import get_transport
+from requests.adapters import HTTPAdapter
+from typing import Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_TIMEOUT = 10.0  # seconds
+USER_AGENT = "PataNgoma/1.0 ( pata@example.com )"
+
+# Statuses providers answer with when asked to slow down
+THROTTLE_STATUSES = (429, 503)
+RETRY_AFTER_ATTEMPTS = 3
+
+Timeout = Union[float, Tuple[float, float]]
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+class ProviderHTTPAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that applies a default timeout to every request.
+
+    Requests to a provider's API first take a token from that provider's
+    rate limiter. Throttled responses carrying a Retry-After header hold
+    back the provider's limiter for that long and are then retried. If a
+    transport is configured, requests are recorded or replayed beneath all
+    of that.
+    """
+
+    def __init__(self, timeout: Timeout = DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+
+        provider = provider_for_url(request.url)
+        limiter = get_limiter(provider) if provider else None
+        for attempt in range(RETRY_AFTER_ATTEMPTS + 1):
+            if limiter:
+                limiter.acquire()
+            response = self._send(provider, request, **kwargs)
+
+            delay = None
+            if response.status_code in THROTTLE_STATUSES:
+                delay = parse_retry_after(response.headers.get("Retry-After"))
+            if delay is None or attempt == RETRY_AFTER_ATTEMPTS:
+                return response
+
+            response.close()
+            if limiter:
+                limiter.defer(delay)
+            else:
+                time.sleep(delay)
+        return response
+
+    def _send(self, provider: Optional[str], request, **kwargs):
+        """Send over the network, or through the transport if there is one.
+        """
+        send = lambda: super(ProviderHTTPAdapter, self).send(request, **kwargs)
+        transport = get_transport()
+        if transport is None:
+            return send()
+        name = provider or urlsplit(request.url).hostname or "other"
+        return transport.http(name, request, send)
+
+
+def session_settings() -> Tuple[int, float]:
+    """Return the pool size and timeout configured in the environment."""
+    load_dotenv()
+    pool_size = int(
+        os.getenv("PATANGOMA_HTTP_POOL_SIZE", str(DEFAULT_POOL_SIZE)))
+    timeout = float(os.getenv("PATANGOMA_HTTP_TIMEOUT", str(DEFAULT_TIMEOUT)))
+    return pool_size, timeout
+
+
+def build_session(pool_size: Optional[int] = None,
+                  timeout: Optional[Timeout] = None) -> requests.Session:
+    """Create a keep-alive session with a bounded connection pool per host.
+    """
+    default_pool_size, default_timeout = session_settings()
+    pool_size = pool_size or default_pool_size
+    timeout = timeout or default_timeout
+
+    session = requests.Session()
+    adapter = ProviderHTTPAdapter(timeout=timeout,
+                                  pool_connections=pool_size,
+                                  pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the shared session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = build_session()
+        return _session
+
+
+def configure_session(pool_size: Optional[int] = None,
+                      timeout: Optional[Timeout] = None) -> requests.Session:
+    """Replace the shared session, e.g. to size the pool for a batch job.
+
+    Clients created before the call keep using the previous session.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = build_session(pool_size, timeout)
+        return _session
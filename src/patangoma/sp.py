@@ -1,48 +1,64 @@
 import click
 import os
 import spotipy
-import yaml
+import threading
 from InquirerPy import inquirer
 from InquirerPy.validator import PathValidator
 from dotenv import load_dotenv
-from functools import lru_cache
+from spotipy.cache_handler import MemoryCacheHandler
 from spotipy.oauth2 import SpotifyClientCredentials
 from mediafile import MediaFile
 from datetime import datetime
+from patangoma.cache import MISSING, get_response_cache, normalize_query
+from patangoma.endpoints import API_PATHS, SPOTIFY_TOKEN_PATH, get_endpoint
+from patangoma.memo import memoize
+from patangoma.resilience import call
+from patangoma.session import get_session, session_settings
 from rgbprint import gradient_print, gradient_scroll, Color
+from typing import Optional
 
 
-def storage():
-    home = os.path.expanduser("~")
-    storage_path = os.path.normpath(f"{home}/.patangoma_store/")
-    if not os.path.exists(storage_path):
-        os.makedirs(storage_path)
-    return storage_path
+_spotify: Optional[spotipy.Spotify] = None
+_spotify_lock = threading.Lock()
 
-storage_file = os.path.join(storage(), "sp_storage.yaml")
 
+def spotify_client() -> spotipy.Spotify:
+    """Return the process-wide Spotify client, creating it on first use.
+
+    Credentials are read from the environment (or .env) once, and both the
+    client and its token requests go through the shared HTTP session, to
+    the configured Spotify endpoint if there is one.
+    """
+    global _spotify
+    with _spotify_lock:
+        if _spotify is None:
+            load_dotenv()
+            session = get_session()
+            _, timeout = session_settings()
+            base_url = get_endpoint("spotify")
+            # Keep another endpoint's tokens out of the shared token cache
+            auth_manager = SpotifyClientCredentials(
+                requests_session=session,
+                requests_timeout=timeout,
+                cache_handler=MemoryCacheHandler() if base_url else None)
+            _spotify = spotipy.Spotify(auth_manager=auth_manager,
+                                       requests_session=session,
+                                       requests_timeout=timeout)
+            if base_url:
+                auth_manager.OAUTH_TOKEN_URL = base_url + SPOTIFY_TOKEN_PATH
+                _spotify.prefix = base_url + API_PATHS["spotify"]
+        return _spotify
 
-def store(dump: dict):
-    """Save queries for future reference"""
-    try:
-        with open(storage_file, "r") as f:
-            loaded = yaml.safe_load(f)
-            loaded.update(dump)
-        with open(storage_file, "w") as f:
-            yaml.safe_dump(loaded, f)
-    except FileNotFoundError:
-        with open(storage_file, "w") as f:
-            yaml.safe_dump(dump, f)
-
-
-def cached():
-    """Retrieve cached queries from the store"""
-    try:
-        with open(storage_file, "r") as f:
-            cache: dict = yaml.safe_load(f)
-    except FileNotFoundError:
-        cache = {}
-    return cache
+
+def reset_spotify_client():
+    """Drop the shared Spotify client, e.g. after `configure_session`.
+
+    The next `spotify_client()` call builds a new one on the current
+    session and endpoint.
+    """
+    global _spotify
+    with _spotify_lock:
+        _spotify = None
 
 
 def get_search_params() -> tuple:
@@ -67,38 +83,39 @@ def get_search_params() -> tuple:
     return media_file, title, artist
 
 
-@lru_cache(maxsize=128)
-def spotify_search(title: str, artist: str) -> tuple:
-    """Search for matching tracks in the Spotify database using track title and artist name"""
+@memoize()
+def spotify_search(title: str, artist: str, verbose: bool = True) -> tuple:
+    """Search for matching tracks in the Spotify database using track title and artist name
+
+    Raises ProviderError if Spotify cannot be reached or fails.
+    """
     # end_color = Color.random
-    print()
-    gradient_scroll(f"Searching for {title} by {artist}...",
-                    start_color=Color.gold,
-                    end_color=0xFF00FF)
-    print()
-    load_dotenv()
-    sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials())
+    if verbose:
+        print()
+        gradient_scroll(f"Searching for {title} by {artist}...",
+                        start_color=Color.gold,
+                        end_color=0xFF00FF)
+        print()
+
     q = f"remaster track:{title} artist:{artist}".replace(" ", "%20")
-    cache = cached()
-    if q in cache:
-        result: dict = cache[q]
-    else:
-        result: dict = sp.search(q)  # pyright: ignore
-        if result["tracks"]["total"] == 0:
+    cache = get_response_cache()
+    key = normalize_query("search", q)
+    result = cache.get("spotify", key)
+    if result is MISSING:
+        result = call("spotify", lambda: spotify_client().search(q))
+        if not result["tracks"]["total"]:  # pyright: ignore
+            result = {}
+        cache.set("spotify", key, result)
+    if not result:
+        if verbose:
             click.secho("No matches found!", fg="yellow")
-            return [], []
-        else:
-            store({q: result})
-    return result.get("tracks", {}).get("items", []), [{
-        "name":
-        result.get("tracks", {}).get("items", [])[i].get("name", ""),
-        "artists": [
-            j.get("name", "") for j in result.get("tracks", {}).get(
-                "items", [])[i].get("artists", [])
-        ],
-        "popularity":
-        result.get("tracks", {}).get("items", [])[i].get("popularity", 0),
-    } for i in range(10)]
+        return [], []
+    items = result.get("tracks", {}).get("items", [])
+    return items, [{
+        "name": item.get("name", ""),
+        "artists": [j.get("name", "") for j in item.get("artists", [])],
+        "popularity": item.get("popularity", 0),
+    } for item in items[:10]]
 
 
 def get_updates(result: list, parsed_result: list):
@@ -116,7 +133,11 @@ def get_updates(result: list, parsed_result: list):
         qmark="\n> ",
         amark="✔️ ").execute()
     selected = int(selection.split(".")[0])
-    raw: dict = result[selected - 1]
+    return spotify_track_updates(result[selected - 1])
+
+
+def spotify_track_updates(raw: dict) -> dict:
+    """Map a Spotify track object to a dictionary of tags"""
     update = {}
     update["title"] = raw["name"]
     update["album"] = raw["album"]["name"]
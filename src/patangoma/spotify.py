@@ -3,11 +3,10 @@ import spotipy
 import yaml
 from InquirerPy import inquirer
 from InquirerPy.validator import PathValidator
-from dotenv import load_dotenv
 from functools import lru_cache
-from spotipy.oauth2 import SpotifyClientCredentials
 from mediafile import MediaFile
 from datetime import datetime
+from patangoma.sp import spotify_client
 
 
 class SpotifyAPI:
@@ -21,8 +20,7 @@ class SpotifyAPI:
 
     def search(self, title: str, artist: str):
         """Look up a track in the Spotify database based on track title and artist"""
-        load_dotenv()
-        sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials())
+        sp = spotify_client()
         # sp.auth = sp.auth_manager.get_access_token(as_dict=False)
         q = f"remaster track:{self.title} artist:{self.artist}".replace(" ", "%20")
         cached = self.cache()
@@ -0,0 +1,11 @@
+"""Where PataNgoma keeps its files: the index, caches and review queue."""
+
+import os
+
+
+def storage():
+    home = os.path.expanduser("~")
+    storage_path = os.path.normpath(f"{home}/.patangoma_store/")
+    if not os.path.exists(storage_path):
+        os.makedirs(storage_path)
+    return storage_path
@@ -1,3 +1,4 @@
+from mediafile import MediaFile
 from typing import Optional
 from patangoma.base import BaseModel
 
@@ -5,8 +6,8 @@ from patangoma.base import BaseModel
 class TrackInfo(BaseModel):
     """ TrackInfo class for track metadata """
 
-    def __init__(self, file_path):
-        super().__init__(file_path)
+    def __init__(self, file_path, metadata: Optional[MediaFile] = None):
+        super().__init__(file_path, metadata)
         self.title: Optional[str] = None
         self.artist: Optional[str] = None
         self.album: Optional[str] = None
@@ -28,11 +29,12 @@ class TrackInfo(BaseModel):
             self.albumtype = self.metadata.albumtype
 
     def get_params(self):
-        metadata: dict = self.as_dict()
+        excluded = ("art", "title", "artist", "lyrics", "images")
+        metadata = self.view(field for field in MediaFile.fields()
+                             if field not in excluded)
 
         params = {}
         for key, value in metadata.items():
-            if value is not None and key not in ("art", "title", "artist",
-                                                 "lyrics", "images"):
+            if value is not None:
                 params[key] = value
         return params
@@ -0,0 +1,281 @@
+"""Record and replay provider traffic, for offline runs and benchmarks.
+
+In "record" mode, real provider responses are saved to a fixture store
+as they pass. In "replay" mode they are served from the store instead of
+the network, with optional latency and error injection. That makes the
+search, match and tag pipeline deterministic, repeatable and
+benchmarkable offline.
+
+Deezer, Spotify and cover art requests are recorded at the HTTP level,
+beneath the rate limiters and Retry-After handling of the shared session.
+MusicBrainz requests go through musicbrainzngs' own urllib opener, so
+they are recorded per API call in `MusicBrainzAPI._call` instead, after
+its rate limiter.
+
+The transport is chosen with `configure_transport`, or with the
+PATANGOMA_TRANSPORT environment variable, set to "record:<dir>" or
+"replay:<dir>".
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import musicbrainzngs
+import requests
+from dotenv import load_dotenv
+from requests.structures import CaseInsensitiveDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+MODES = ("record", "replay")
+
+# Query parameters left out of fixture keys, as they change between runs
+VOLATILE_PARAMS = ("access_token", )
+
+# Response fields replaced before a fixture is written
+SECRET_FIELDS = ("access_token", "refresh_token")
+
+# Response headers kept in fixtures
+KEPT_HEADERS = ("Content-Type", "Retry-After", "ETag", "Last-Modified")
+
+
+class FixtureMissing(Exception):
+    """A replayed request has no recorded response."""
+
+
+class FixtureStore:
+    """
+    Recorded responses, one JSON file per request under `path`.
+
+    Files are grouped in a directory per provider and named after a hash
+    of the request key, which is also stored in the file for reference.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _file(self, provider: str, key: str) -> str:
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.path, provider, f"{digest}.json")
+
+    def load(self, provider: str, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._file(provider, key), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, provider: str, key: str, fixture: Dict[str, Any]):
+        file = self._file(provider, key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with self._lock:
+            with open(file, "w", encoding="utf-8") as f:
+                json.dump(dict(fixture, key=key), f, indent=2, sort_keys=True)
+
+    def __len__(self) -> int:
+        return sum(
+            len([name for name in files if name.endswith(".json")])
+            for _, _, files in os.walk(self.path))
+
+
+def request_key(request: requests.PreparedRequest) -> str:
+    """A stable key for an HTTP request: method and normalised URL."""
+    parts = urlsplit(request.url or "")
+    query = sorted((name, value) for name, value in parse_qsl(parts.query)
+                   if name not in VOLATILE_PARAMS)
+    url = urlunsplit(parts._replace(query=urlencode(query)))
+    return f"{request.method} {url}"
+
+
+def call_key(name: str, args: tuple, kwargs: Dict[str, Any]) -> str:
+    """A stable key for a provider API call."""
+    return json.dumps([name, list(args), kwargs], sort_keys=True, default=str)
+
+
+def redact(body: bytes) -> bytes:
+    """Blank out credentials in a JSON response body."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(data, dict) or not any(field in data
+                                             for field in SECRET_FIELDS):
+        return body
+    for field in SECRET_FIELDS:
+        if field in data:
+            data[field] = "redacted"
+    return json.dumps(data).encode()
+
+
+class Transport:
+    """
+    Records provider responses, or replays them from a fixture store.
+
+    When replaying, each response is delayed by `latency` seconds plus up
+    to `jitter` more, and a share `error_rate` of requests fails with a
+    503 (HTTP) or a network error (MusicBrainz). Which requests fail, and
+    their jitter, depends only on `seed`, the request and how many times
+    it has been made, so runs are repeatable regardless of threading.
+    """
+
+    def __init__(self,
+                 mode: str,
+                 store: FixtureStore,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 seed: int = 0):
+        if mode not in MODES:
+            raise ValueError(f"Unsupported transport mode: {mode}")
+        self.mode = mode
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.requests = 0
+        self.injected = 0
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _draws(self, key: str) -> Tuple[float, float]:
+        """Two repeatable numbers in [0, 1) for this request's nth run."""
+        with self._lock:
+            count = self._seen.get(key, 0)
+            self._seen[key] = count + 1
+            self.requests += 1
+        digest = hashlib.sha256(f"{self.seed}:{count}:{key}".encode()).digest()
+        return (int.from_bytes(digest[:8], "big") / 2**64,
+                int.from_bytes(digest[8:16], "big") / 2**64)
+
+    def _simulate(self, key: str) -> bool:
+        """Sleep for the simulated latency; return whether to fail."""
+        jitter, failure = self._draws(key)
+        delay = self.latency + self.jitter * jitter
+        if delay:
+            time.sleep(delay)
+        if failure < self.error_rate:
+            with self._lock:
+                self.injected += 1
+            return True
+        return False
+
+    def http(self, provider: str, request: requests.PreparedRequest,
+             send: Callable[[], requests.Response]) -> requests.Response:
+        """Record or replay one HTTP request; `send` does the real one."""
+        key = request_key(request)
+        if self.mode == "record":
+            response = send()
+            self.store.save(provider, key, {
+                "status": response.status_code,
+                "headers": {
+                    name: response.headers[name]
+                    for name in KEPT_HEADERS if name in response.headers
+                },
+                **self._encode(redact(response.content)),
+            })
+            return response
+
+        fixture = self.store.load(provider, key)
+        if fixture is None:
+            raise FixtureMissing(key)
+        if self._simulate(key):
+            return self._response(request, 503, {}, b"Injected failure")
+        return self._response(request, fixture["status"], fixture["headers"],
+                              self._decode(fixture))
+
+    def call(self, provider: str, name: str, args: tuple,
+             kwargs: Dict[str, Any], invoke: Callable[[], Any]) -> Any:
+        """Record or replay one provider API call; `invoke` makes it."""
+        key = call_key(name, args, kwargs)
+        if self.mode == "record":
+            try:
+                result = invoke()
+            except musicbrainzngs.ResponseError as e:
+                code = getattr(e.cause, "code", None)
+                self.store.save(provider, key, {"error": code})
+                raise
+            self.store.save(provider, key, {"result": result})
+            return result
+
+        fixture = self.store.load(provider, key)
+        if fixture is None:
+            raise FixtureMissing(key)
+        if self._simulate(key):
+            raise musicbrainzngs.NetworkError(
+                cause=urllib.error.URLError("Injected failure"))
+        if "error" in fixture:
+            raise musicbrainzngs.ResponseError(cause=urllib.error.HTTPError(
+                name, fixture["error"], "Recorded error", None, None))
+        return fixture["result"]
+
+    @staticmethod
+    def _encode(body: bytes) -> Dict[str, str]:
+        try:
+            return {"text": body.decode("utf-8")}
+        except UnicodeDecodeError:
+            return {"base64": base64.b64encode(body).decode("ascii")}
+
+    @staticmethod
+    def _decode(fixture: Dict[str, Any]) -> bytes:
+        if "base64" in fixture:
+            return base64.b64decode(fixture["base64"])
+        return fixture.get("text", "").encode("utf-8")
+
+    @staticmethod
+    def _response(request: requests.PreparedRequest, status: int,
+                  headers: Dict[str, str], body: bytes) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response._content_consumed = True
+        response.raw = io.BytesIO(body)
+        response.encoding = "utf-8"
+        response.url = request.url or ""
+        response.request = request
+        return response
+
+
+_transport: Optional[Transport] = None
+_transport_configured = False
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Optional[Transport]:
+    """Return the configured transport, or None for live traffic."""
+    global _transport, _transport_configured
+    with _transport_lock:
+        if not _transport_configured:
+            load_dotenv()
+            setting = os.getenv("PATANGOMA_TRANSPORT")
+            if setting:
+                mode, _, path = setting.partition(":")
+                _transport = Transport(mode, FixtureStore(path))
+            _transport_configured = True
+        return _transport
+
+
+def configure_transport(mode: Optional[str],
+                        path: Optional[str] = None,
+                        **options) -> Optional[Transport]:
+    """
+    Record to or replay from the fixtures at `path`; a `mode` of None
+    goes back to live traffic.
+
+    Takes the latency, jitter, error_rate and seed options of Transport.
+    It applies to requests made from then on, including through sessions
+    and clients already created.
+    """
+    global _transport, _transport_configured
+    with _transport_lock:
+        _transport = Transport(mode, FixtureStore(path or "."), **
+                               options) if mode else None
+        _transport_configured = True
+        return _transport
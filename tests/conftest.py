@@ -0,0 +1,99 @@
+"""
+Provider traffic for the tests, replayed from tests/fixtures.
+
+The fixtures were recorded from the mock provider server. After a change
+to what the clients request, record them again with
+
+    PATANGOMA_RECORD_FIXTURES=1 python -m pytest
+"""
+
+import os
+import struct
+
+import musicbrainzngs
+import pytest
+from mediafile import MediaFile
+
+from patangoma import ratelimit, resilience
+from patangoma.art_cache import configure_art_cache
+from patangoma.benchmark import MEMOIZED
+from patangoma.cache import configure_response_cache
+from patangoma.endpoints import configure_endpoint
+from patangoma.mockserver import Catalogue, MockProviderServer
+from patangoma.sp import reset_spotify_client
+from patangoma.transport import configure_transport
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Recorded requests are keyed by URL, so the mock server's address is fixed
+MOCK_ADDRESS = ("127.0.0.1", 8765)
+MOCK_URL = "http://%s:%d" % MOCK_ADDRESS
+CATALOGUE_SIZE = 20
+
+PROVIDERS = ("deezer", "musicbrainz", "spotify")
+
+RECORDING = bool(os.getenv("PATANGOMA_RECORD_FIXTURES"))
+
+
+def write_flac(path, **tags) -> str:
+    """Write a FLAC file with no audio frames, tagged with `tags`."""
+    # STREAMINFO: 4096-sample blocks, 44.1 kHz, stereo, 16 bit, no samples
+    info = struct.pack(">HH", 4096, 4096) + bytes(6)
+    info += ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, "big")
+    info += bytes(16)
+    with open(path, "wb") as f:
+        f.write(b"fLaC" + b"\x80" + len(info).to_bytes(3, "big") + info)
+    if tags:
+        media = MediaFile(str(path))
+        media.update(tags)
+        media.save()
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def catalogue():
+    """The catalogue the fixtures were recorded from."""
+    return Catalogue(CATALOGUE_SIZE)
+
+
+@pytest.fixture(scope="session")
+def mock_server(catalogue):
+    """The mock provider server, running only while recording."""
+    if not RECORDING:
+        yield None
+        return
+    server = MockProviderServer(MOCK_ADDRESS, catalogue).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def transport(mock_server, tmp_path, monkeypatch):
+    """
+    Replay the fixtures (or record them) with empty caches, no rate
+    limits and no retry backoff. Returns the Transport.
+    """
+    monkeypatch.setenv("SPOTIPY_CLIENT_ID", "mock")
+    monkeypatch.setenv("SPOTIPY_CLIENT_SECRET", "mock")
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0.0)
+    monkeypatch.setattr(ratelimit, "_limiters",
+                        {provider: None for provider in PROVIDERS})
+
+    for provider in PROVIDERS:
+        configure_endpoint(provider, MOCK_URL)
+    configure_response_cache(path=str(tmp_path / "cache.db"))
+    configure_art_cache(path=str(tmp_path / "art"))
+    for memoized in MEMOIZED:
+        memoized.invalidate()  # pyright: ignore
+    reset_spotify_client()
+
+    yield configure_transport("record" if RECORDING else "replay", FIXTURES)
+
+    configure_transport(None)
+    for provider in PROVIDERS:
+        configure_endpoint(provider, None)
+    configure_response_cache()
+    configure_art_cache()
+    reset_spotify_client()
+    musicbrainzngs.set_hostname("musicbrainz.org", use_https=True)
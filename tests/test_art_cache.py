@@ -0,0 +1,191 @@
+"""The album art cache, against a scripted transport."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+import requests
+
+from patangoma import session
+from patangoma.art_cache import ArtCache
+from patangoma.transport import Transport
+
+URL = "https://cdn.example.com/cover/1.jpg"
+
+
+class ScriptedTransport:
+    """Serves each URL's current image, with validators, and records the
+    requests; `gate` holds every request back until it is set."""
+
+    def __init__(self):
+        self.images = {}
+        self.headers = {}
+        self.requests = []
+        self.failing = False
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def serve(self, url, body, **headers):
+        self.images[url] = body
+        self.headers[url] = headers
+
+    def http(self, provider, request, send):
+        self.requests.append((request.url, dict(request.headers)))
+        self.gate.wait(10)
+        if self.failing:
+            raise requests.ConnectionError("unreachable")
+        body = self.images[request.url]
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        headers = dict(self.headers[request.url], ETag=etag)
+        if request.headers.get("If-None-Match") == etag:
+            return Transport._response(request, 304, headers, b"")
+        return Transport._response(request, 200, headers, body)
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = ScriptedTransport()
+    monkeypatch.setattr(session, "get_transport", lambda: transport)
+    return transport
+
+
+@pytest.fixture
+def art(tmp_path):
+    return ArtCache(str(tmp_path / "art"))
+
+
+def blobs(art):
+    return sorted(name for _, _, files in os.walk(os.path.join(
+        art.path, "blobs")) for name in files)
+
+
+def test_fresh_images_are_served_without_a_request(transport, art):
+    transport.serve(URL, b"image", **{"Cache-Control": "max-age=60"})
+
+    assert art.fetch(URL) == b"image"
+    assert art.fetch(URL) == b"image"
+
+    assert len(transport.requests) == 1
+    assert art.downloads == 1
+    assert blobs(art) == [hashlib.sha256(b"image").hexdigest()]
+
+
+def test_stale_images_are_revalidated(transport, art):
+    transport.serve(URL,
+                    b"image",
+                    **{
+                        "Cache-Control": "no-cache",
+                        "Last-Modified": "Thu, 01 Jan 1970 00:00:00 GMT",
+                    })
+    art.fetch(URL)
+
+    assert art.fetch(URL) == b"image"
+
+    _, headers = transport.requests[-1]
+    assert headers["If-None-Match"] == '"%s"' % hashlib.sha1(
+        b"image").hexdigest()
+    assert headers["If-Modified-Since"] == "Thu, 01 Jan 1970 00:00:00 GMT"
+    assert (art.downloads, art.revalidations) == (1, 1)
+
+
+def test_a_replaced_image_drops_the_old_one(transport, art):
+    transport.serve(URL, b"old", **{"Cache-Control": "no-cache"})
+    art.fetch(URL)
+    transport.serve(URL, b"new", **{"Cache-Control": "no-cache"})
+
+    assert art.fetch(URL) == b"new"
+
+    assert art.downloads == 2
+    assert blobs(art) == [hashlib.sha256(b"new").hexdigest()]
+
+
+def test_a_stale_copy_outlives_a_failed_request(transport, art):
+    transport.serve(URL, b"image", **{"Cache-Control": "no-cache"})
+    art.fetch(URL)
+    transport.failing = True
+
+    assert art.fetch(URL) == b"image"
+    with pytest.raises(requests.ConnectionError):
+        art.fetch("https://cdn.example.com/cover/2.jpg")
+
+
+def test_concurrent_fetches_share_one_request(transport, art):
+    transport.serve(URL, b"image")
+    transport.gate.clear()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(art.fetch(URL)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    while not transport.requests:
+        time.sleep(0.01)
+    # Give the followers time to find the request in flight
+    time.sleep(0.1)
+
+    transport.gate.set()
+    for thread in threads:
+        thread.join(10)
+
+    assert results == [b"image"] * 5
+    assert len(transport.requests) == 1
+
+
+def test_eviction_keeps_the_most_recently_read(transport, tmp_path):
+    art = ArtCache(str(tmp_path / "art"), max_entries=2)
+    urls = [f"https://cdn.example.com/cover/{n}.jpg" for n in range(3)]
+    for n, url in enumerate(urls):
+        transport.serve(url, b"image %d" % n)
+        art.fetch(url)
+
+    assert art.evict() == 1
+
+    assert len(art) == 2
+    assert blobs(art) == sorted(
+        hashlib.sha256(b"image %d" % n).hexdigest() for n in (1, 2))
+
+
+def test_eviction_bounds_bytes_and_keeps_shared_images(transport, tmp_path):
+    art = ArtCache(str(tmp_path / "art"), max_bytes=10)
+    shared = [f"https://cdn.example.com/shared/{n}.jpg" for n in range(2)]
+    for url in shared:
+        transport.serve(url, b"same image")
+    transport.serve(URL, b"other")
+    art.fetch(shared[0])
+    art.fetch(URL)
+    art.fetch(shared[1])
+
+    # The shared image counts once, so only "other" does not fit
+    assert art.evict() == 1
+
+    assert len(art) == 2
+    assert blobs(art) == [hashlib.sha256(b"same image").hexdigest()]
+
+
+def test_an_index_from_before_the_size_bound_is_upgraded(transport, tmp_path):
+    path = tmp_path / "art"
+    old = ArtCache(str(path))
+    transport.serve(URL, b"image")
+    old.fetch(URL)
+    old.conn.close()
+    conn = sqlite3.connect(str(path / "index.db"))
+    with conn:
+        conn.execute('DROP INDEX art_accessed')
+        conn.execute('ALTER TABLE art DROP COLUMN accessed')
+        conn.execute('ALTER TABLE art DROP COLUMN size')
+        conn.execute(
+            "INSERT INTO art (url, digest, fresh_until) VALUES (?, ?, ?)",
+            ("https://cdn.example.com/gone.jpg", "0" * 64, 0))
+    conn.close()
+
+    art = ArtCache(str(path))
+
+    assert len(art) == 1
+    assert art.fetch(URL) == b"image"
+    size = art.conn.execute('SELECT size FROM art').fetchone()[0]
+    assert size == len(b"image")
+    assert len(transport.requests) == 1
@@ -0,0 +1,28 @@
+"""Batch tag updates across many files."""
+
+from patangoma.batch import invalid_fields, plan_updates, update_fields
+
+from tests.conftest import write_flac
+
+
+def test_values_may_contain_equals_signs(tmp_path):
+    paths = [
+        write_flac(tmp_path / f"{number}.flac", title=f"Track {number}")
+        for number in range(2)
+    ]
+    updates = ["comments=https://example.com/?a=b"]
+
+    assert invalid_fields(updates) == []
+    assert update_fields(updates) == ["comments"]
+    plan = plan_updates(paths, updates)
+
+    assert len(plan) == 2
+    for track, changes in plan:
+        assert changes["comments"] == (None, "https://example.com/?a=b")
+
+
+def test_invalid_fields():
+    updates = ["title=Song", "tilte=Song", "genre", "comments=a=b"]
+
+    assert invalid_fields(updates) == ["tilte", "genre"]
+    assert invalid_fields({"title": "Song", "tilte": "Song"}) == ["tilte"]
@@ -0,0 +1,155 @@
+"""The persistent response cache."""
+
+import datetime
+import multiprocessing
+
+import pytest
+
+from patangoma import cache
+from patangoma.cache import (
+    MISSING,
+    TOUCH_INTERVAL,
+    ResponseCache,
+    normalize_query,
+)
+
+
+class Clock:
+    """Stands in for the time module, at a time set by the test."""
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def responses(tmp_path, clock):
+    return ResponseCache(str(tmp_path / "responses.db"),
+                         ttl=100,
+                         negative_ttl=10,
+                         max_entries=3)
+
+
+def test_normalize_query_ignores_case_and_spacing():
+    assert normalize_query("Hello ", "ADELE") == normalize_query(
+        "hello", "  adele")
+    assert normalize_query("a", limit=5) != normalize_query("a", limit=6)
+
+
+def test_round_trip_keeps_dates(responses):
+    value = {"title": "Song", "date": datetime.date(2001, 2, 3), "n": [1]}
+
+    responses.set("deezer", "q", value)
+
+    assert responses.get("deezer", "q") == value
+    assert responses.get("spotify", "q") is MISSING
+    assert responses.stats() == {
+        "deezer": {"hits": 1, "misses": 0},
+        "spotify": {"hits": 0, "misses": 1},
+    }
+
+
+def test_unserialisable_values_are_refused(responses):
+    with pytest.raises(TypeError):
+        responses.set("deezer", "q", {"value": object()})
+    assert responses.get("deezer", "q") is MISSING
+
+
+def test_entries_expire_after_their_ttl(responses, clock):
+    responses.set("deezer", "default", ["match"])
+    responses.set("deezer", "custom", ["match"], ttl=1000)
+    responses.set("deezer", "forever", ["match"], ttl=None)
+
+    clock.now += 100
+    assert responses.get("deezer", "default") is MISSING
+    assert responses.get("deezer", "custom") == ["match"]
+
+    clock.now += 10**6
+    assert responses.get("deezer", "custom") is MISSING
+    assert responses.get("deezer", "forever") == ["match"]
+
+
+def test_empty_results_use_the_negative_ttl(responses, clock):
+    responses.set("deezer", "nothing", [], ttl=None)
+
+    clock.now += 9
+    assert responses.get("deezer", "nothing") == []
+    clock.now += 1
+    assert responses.get("deezer", "nothing") is MISSING
+
+
+def test_eviction_drops_expired_then_least_recently_read(responses, clock):
+    for query in ("a", "b", "c", "d"):
+        responses.set("deezer", query, [query], ttl=None)
+        clock.now += 1
+    # Reading "a" again makes "b" the least recently read entry
+    clock.now += TOUCH_INTERVAL
+    responses.set("deezer", "short", ["short"], ttl=1)
+    assert responses.get("deezer", "a") == ["a"]
+    clock.now += 1
+
+    assert responses.evict() == 2
+
+    assert len(responses) == 3
+    assert responses.get("deezer", "b") is MISSING
+    assert responses.get("deezer", "short") is MISSING
+    assert [responses.get("deezer", q) for q in ("a", "c", "d")] == [
+        ["a"], ["c"], ["d"]
+    ]
+
+
+def test_reads_within_the_touch_interval_do_not_write(responses, clock):
+    responses.set("deezer", "q", ["match"])
+    clock.now += TOUCH_INTERVAL - 1
+
+    responses.get("deezer", "q")
+
+    accessed = responses.conn.execute(
+        'SELECT accessed FROM responses').fetchone()[0]
+    assert accessed == clock.now - (TOUCH_INTERVAL - 1)
+
+
+def test_invalidate(responses):
+    responses.set("deezer", "a", ["a"])
+    responses.set("deezer", "b", ["b"])
+    responses.set("spotify", "a", ["a"])
+
+    assert responses.invalidate("deezer", "a") == 1
+    assert responses.invalidate("deezer") == 1
+    assert responses.invalidate() == 1
+    assert len(responses) == 0
+
+
+def _write_entries(path: str, worker: int, count: int):
+    responses = ResponseCache(path)
+    for n in range(count):
+        responses.set("deezer", f"{worker}:{n}", [worker, n])
+
+
+def test_processes_share_the_cache(tmp_path):
+    path = str(tmp_path / "shared.db")
+    responses = ResponseCache(path)
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_write_entries, args=(path, worker, 50))
+        for worker in range(3)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(timeout=60)
+        assert process.exitcode == 0
+
+    mode = responses.conn.execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == "wal"
+    assert len(responses) == 150
+    assert responses.get("deezer", "2:49") == [2, 49]
@@ -0,0 +1,210 @@
+"""Searching several providers at once and merging their candidates."""
+
+import threading
+import time
+
+import pytest
+
+from patangoma.fanout import (
+    FanOutSearch,
+    merge_candidates,
+    parse_duration,
+    same_recording,
+)
+
+
+def candidate(source, score, **fields):
+    return dict(fields,
+                score=score,
+                sources=[source],
+                matches={source: {"from": source, "score": score}})
+
+
+@pytest.mark.parametrize("a, b, same", [
+    # An ISRC on both sides decides on its own
+    ({"isrc": "X1", "title": "Song"}, {"isrc": "X1", "title": "Other"}, True),
+    ({"isrc": "X1", "title": "Song"}, {"isrc": "X2", "title": "Song"}, False),
+    # Otherwise title and artist, up to case and punctuation
+    ({"isrc": "X1", "title": "Song!", "artist": "A"},
+     {"title": "song", "artist": "a"}, True),
+    ({"title": "Song", "artist": "A"}, {"title": "Song", "artist": "B"},
+     False),
+    ({"title": "Song", "artist": "A"}, {"title": "Song 2", "artist": "A"},
+     False),
+    # And duration, within the tolerance, when both have one
+    ({"title": "Song", "artist": "A", "length": 200.0},
+     {"title": "Song", "artist": "A", "length": 202.5}, True),
+    ({"title": "Song", "artist": "A", "length": 200.0},
+     {"title": "Song", "artist": "A", "length": 240.0}, False),
+    ({"title": "Song", "artist": "A", "length": 200.0},
+     {"title": "Song", "artist": "A"}, True),
+])
+def test_same_recording(a, b, same):
+    assert same_recording(a, b) is same
+    assert same_recording(b, a) is same
+
+
+def test_duplicates_are_merged_by_isrc():
+    merged = merge_candidates([
+        candidate("deezer", 90, title="Song", isrc="X1", length=200.0),
+        candidate("musicbrainz", 95, title="Song (Remaster)", isrc="X1",
+                  album=None),
+        candidate("spotify", 80, title="Song", isrc="X1", album="Album"),
+    ])
+
+    assert len(merged) == 1
+    best = merged[0]
+    # The best-scored match's fields, with the gaps filled by the others
+    assert best["title"] == "Song (Remaster)"
+    assert best["score"] == 95
+    assert best["length"] == 200.0
+    assert best["album"] == "Album"
+    assert best["sources"] == ["musicbrainz", "deezer", "spotify"]
+    assert set(best["matches"]) == {"musicbrainz", "deezer", "spotify"}
+
+
+def test_merge_keeps_each_providers_best_match():
+    merged = merge_candidates([
+        candidate("deezer", 70, title="Song", artist="A"),
+        candidate("deezer", 90, title="Song", artist="A"),
+        candidate("spotify", 80, title="Song", artist="A"),
+    ])
+
+    assert len(merged) == 1
+    assert merged[0]["sources"] == ["deezer", "spotify"]
+    assert merged[0]["matches"]["deezer"]["score"] == 90
+
+
+def test_ranking_prefers_score_then_agreement():
+    merged = merge_candidates([
+        candidate("deezer", 80, title="Lone", artist="A"),
+        candidate("deezer", 80, title="Shared", artist="A"),
+        candidate("spotify", 75, title="Shared", artist="A"),
+        candidate("musicbrainz", 95, title="Best", artist="A"),
+        candidate("spotify", 60, title="Worst", artist="A"),
+    ])
+
+    assert [c["title"] for c in merged] == ["Best", "Shared", "Lone", "Worst"]
+
+
+def test_merge_does_not_modify_distinct_candidates():
+    first = candidate("deezer", 90, title="One", artist="A", isrc="X1")
+    second = candidate("spotify", 90, title="One", artist="A", isrc="X2")
+
+    merged = merge_candidates([first, second])
+
+    assert len(merged) == 2
+    assert first["sources"] == ["deezer"]
+    assert second["sources"] == ["spotify"]
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("800ms", 0.8),
+    ("2s", 2.0),
+    (" 1.5 ", 1.5),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == seconds
+
+
+def test_parse_duration_rejects_other_units():
+    with pytest.raises(ValueError):
+        parse_duration("2m")
+
+
+class StubSearch(FanOutSearch):
+    """Providers answer from `answers`; a stalled one waits for `release`."""
+
+    def __init__(self, answers, stalled=()):
+        super().__init__(query=None, providers=tuple(answers))
+        self.answers = answers
+        self.stalled = stalled
+        self.release = threading.Event()
+
+    def _search(self, provider, title, artist):
+        if provider in self.stalled:
+            self.release.wait(10)
+        answer = self.answers[provider]
+        if isinstance(answer, Exception):
+            raise answer
+        return [({"title": title, "artist": artist}, answer)]
+
+
+@pytest.fixture
+def stalled():
+    search = StubSearch(
+        {
+            "musicbrainz": {"id": "mb"},
+            "deezer": {"id": 1},
+            "spotify": {"id": "sp"},
+        },
+        stalled=("spotify", ))
+    yield search
+    search.release.set()
+
+
+def test_stream_stops_at_the_deadline(stalled):
+    stalled.start("Song", "Artist")
+
+    started = time.perf_counter()
+    answered = [provider for provider, _ in stalled.stream(0.5)]
+
+    assert time.perf_counter() - started < 5
+    assert sorted(answered) == ["deezer", "musicbrainz"]
+    assert stalled.pending == ["spotify"]
+    assert stalled.first_result is not None
+    # Both answers describe the same recording
+    [merged] = stalled.ranked()
+    assert sorted(merged["sources"]) == ["deezer", "musicbrainz"]
+
+
+def test_a_later_stream_backfills_pending_providers(stalled):
+    stalled.start("Song", "Artist")
+    list(stalled.stream(0.5))
+
+    stalled.release.set()
+    answered = [provider for provider, _ in stalled.stream(5)]
+
+    assert answered == ["spotify"]
+    assert stalled.pending == []
+    assert set(stalled.elapsed) == {"musicbrainz", "deezer", "spotify"}
+    best = stalled.ranked()[0]
+    assert best["score"] == 100
+    assert sorted(best["sources"]) == ["deezer", "musicbrainz", "spotify"]
+
+
+def test_zero_deadline_takes_only_answers_already_in(stalled):
+    stalled.start("Song", "Artist")
+    while stalled._results.qsize() < 2:
+        time.sleep(0.01)
+
+    answered = [provider for provider, _ in stalled.stream(0)]
+
+    assert sorted(answered) == ["deezer", "musicbrainz"]
+    assert list(stalled.stream(0)) == []
+    assert stalled.pending == ["spotify"]
+
+
+def test_failed_providers_are_left_out():
+    search = StubSearch({
+        "musicbrainz": RuntimeError("down"),
+        "deezer": {"id": 1},
+    })
+
+    results = search.search("Song", "Artist", deadline=5)
+
+    assert [c["sources"] for c in results] == [["deezer"]]
+    assert search.pending == []
+    assert set(search.elapsed) == {"musicbrainz", "deezer"}
+
+
+def test_a_new_search_ignores_late_answers(stalled):
+    stalled.start("Song", "Artist")
+    list(stalled.stream(0.5))
+
+    stalled.stalled = ()
+    stalled.start("Other", "Artist")
+    stalled.release.set()
+    list(stalled.stream(5))
+
+    assert {c["title"] for c in stalled.candidates} == {"Other"}
@@ -0,0 +1,118 @@
+"""Library scans: change detection, moves, removals and unreadable files."""
+
+import os
+
+import pytest
+
+from patangoma.database import FileStorage
+from patangoma.library import scan_library
+
+from tests.conftest import write_flac
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = tmp_path / "music"
+    (root / "album").mkdir(parents=True)
+    for number in range(1, 4):
+        write_flac(root / "album" / f"{number:02d}.flac",
+                   title=f"Track {number}",
+                   artist="Artist",
+                   track=number)
+    (root / "album" / "cover.jpg").write_bytes(b"not audio")
+    return root
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = FileStorage(str(tmp_path / "library.db"))
+    yield storage
+    storage.close()
+
+
+def index(storage):
+    """Return the index rows as {path: (title, unreadable)}."""
+    cursor = storage.conn.execute(
+        'SELECT path, title, unreadable FROM library')
+    return {row[0]: tuple(row[1:]) for row in cursor.fetchall()}
+
+
+def scan(library, storage, **options):
+    return scan_library(str(library), storage, workers=1, **options)
+
+
+def test_first_scan_indexes_audio_files(library, storage):
+    stats = scan(library, storage)
+
+    assert stats["files"] == 4
+    assert stats["indexed"] == 3
+    assert stats["skipped"] == 1
+    assert storage.count_index_rows() == 3
+    assert index(storage)[str(library / "album" / "02.flac")] == ("Track 2", 0)
+
+
+def test_rescan_skips_unchanged_files(library, storage):
+    scan(library, storage)
+
+    stats = scan(library, storage)
+
+    assert stats["unchanged"] == 3
+    assert stats["indexed"] == 0
+
+
+def test_rename_moves_the_index_row(library, storage):
+    scan(library, storage)
+    old = library / "album" / "01.flac"
+    new = library / "album" / "01 Renamed.flac"
+    os.rename(old, new)
+
+    stats = scan(library, storage)
+
+    assert stats["moved"] == 1
+    assert stats["removed"] == 0
+    assert stats["indexed"] == 0
+    rows = index(storage)
+    assert str(old) not in rows
+    assert rows[str(new)] == ("Track 1", 0)
+
+
+def test_full_scan_rereads_moved_files(library, storage):
+    scan(library, storage)
+    new = library / "album" / "01 Renamed.flac"
+    os.rename(library / "album" / "01.flac", new)
+
+    stats = scan(library, storage, full=True)
+
+    assert stats["moved"] == 1
+    assert stats["indexed"] == 3
+    assert index(storage)[str(new)] == ("Track 1", 0)
+
+
+def test_deleted_file_is_removed(library, storage):
+    scan(library, storage)
+    os.remove(library / "album" / "03.flac")
+
+    stats = scan(library, storage)
+
+    assert stats["removed"] == 1
+    assert stats["moved"] == 0
+    assert str(library / "album" / "03.flac") not in index(storage)
+    assert storage.count_index_rows() == 2
+
+
+def test_corrupt_file_is_marked_unreadable(library, storage):
+    scan(library, storage)
+    corrupt = library / "album" / "02.flac"
+    corrupt.write_bytes(b"fLaC" + bytes(10))
+
+    stats = scan(library, storage)
+
+    assert stats["indexed"] == 0
+    assert stats["skipped"] == 2
+    assert index(storage)[str(corrupt)] == (None, 1)
+    assert storage.count_index_rows() == 2
+
+    # Unreadable files are not opened again until they change
+    stats = scan(library, storage)
+    assert stats["unchanged"] == 3
+    assert stats["skipped"] == 1
@@ -0,0 +1,180 @@
+"""Scoring candidates and pairing files with release tracks."""
+
+import os
+
+import pytest
+
+from patangoma.autotag import AutoTagger
+from patangoma.data_store import DataStore
+from patangoma.matching import (
+    assign_tracks,
+    match_score,
+    normalize,
+    release_score,
+    track_score,
+)
+
+from tests.conftest import write_flac
+
+
+@pytest.mark.parametrize("text, expected", [
+    (None, ""),
+    ("  Hello,   World! ", "hello world"),
+    ("AC/DC", "ac dc"),
+])
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+@pytest.mark.parametrize("title, artist, expected", [
+    ("Song", "Artist", 100),
+    ("song!", "ARTIST", 100),
+    # The title weighs 60%, the artist 40%
+    ("Song", "Someone Else", 64),
+    ("Other", "Artist", 53),
+    (None, None, 0),
+])
+def test_match_score(title, artist, expected):
+    assert match_score("Song", "Artist", title, artist) == expected
+
+
+@pytest.mark.parametrize("files, tracks, expected", [
+    (10, 10, 100),
+    (10, None, 100),
+    (5, 10, 90),
+    (10, 5, 90),
+    (1, 100, 80),
+])
+def test_release_score_weighs_track_count(files, tracks, expected):
+    assert release_score("Album", "Artist", files, "Album", "Artist",
+                         tracks) == expected
+
+
+def release(*titles, lengths=None, discs=None):
+    """Release tracks as `track_score` candidates."""
+    lengths = lengths or [200.0 + 10 * n for n in range(len(titles))]
+    discs = discs or [1] * len(titles)
+    return [{
+        "title": title,
+        "track": number,
+        "disc": disc,
+        "length": length,
+    } for number, (title, length, disc) in enumerate(
+        zip(titles, lengths, discs), start=1)]
+
+
+def test_track_score_weighs_only_known_fields():
+    candidate = {"title": "Song", "track": 2, "disc": 1, "length": 180.0}
+
+    assert track_score({"title": "Song"}, candidate) == 1.0
+    assert track_score({"title": "Song", "track": 2, "length": 180.0},
+                       candidate) == 1.0
+    assert track_score({"title": "Song", "track": 3}, candidate) == 0.5 / 0.75
+    assert track_score({
+        "title": "Song",
+        "track": 2,
+        "disc": 2
+    }, candidate) == pytest.approx((0.5 + 0.125) / 0.75)
+    assert track_score({
+        "title": "Song",
+        "length": 185.0
+    }, candidate) == pytest.approx((0.5 + 0.125) / 0.75)
+    assert track_score({
+        "title": "Song",
+        "length": 400.0
+    }, candidate) == pytest.approx(0.5 / 0.75)
+
+
+@pytest.mark.parametrize("items, expected", [
+    # Tagged files in order
+    ([{"title": "One", "track": 1}, {"title": "Two", "track": 2},
+      {"title": "Three", "track": 3}], [(0, 0), (1, 1), (2, 2)]),
+    # Shuffled files, matched by title
+    ([{"title": "Three"}, {"title": "One"}, {"title": "Two"}],
+     [(0, 2), (1, 0), (2, 1)]),
+    # Untitled files, matched by position
+    ([{"track": 3}, {"track": 1}], [(0, 2), (1, 0)]),
+    # Untitled, unnumbered files, matched by duration
+    ([{"length": 221.0}, {"length": 199.0}], [(0, 2), (1, 0)]),
+    # Misnumbered files: the title outweighs the position
+    ([{"title": "Two", "track": 1}, {"title": "One", "track": 2}],
+     [(0, 1), (1, 0)]),
+])
+def test_assign_tracks(items, expected):
+    candidates = release("One", "Two", "Three")
+
+    assigned = assign_tracks(items, candidates)
+
+    assert [(i, j) for i, j, _ in assigned] == expected
+
+
+def test_assign_tracks_uses_each_track_once():
+    items = [{"title": "One"}, {"title": "One (Live)"}, {"title": "Bonus"}]
+
+    assigned = assign_tracks(items, release("One", "Two"))
+
+    # "One (Live)" is left over once "One" took the first track
+    assert assigned == [(0, 0, 100), (2, 1, 25)]
+
+
+def test_assign_tracks_across_discs():
+    candidates = release("Intro", "Intro", lengths=[60.0, 60.0], discs=[1, 2])
+    candidates[1]["track"] = 1
+    items = [{"title": "Intro", "track": 1, "disc": 2},
+             {"title": "Intro", "track": 1, "disc": 1}]
+
+    assigned = assign_tracks(items, candidates)
+
+    assert [(i, j) for i, j, _ in assigned] == [(0, 1), (1, 0)]
+
+
+@pytest.fixture
+def tagger(tmp_path, monkeypatch):
+    """An album-mode tagger that records the groups it is given."""
+    tagger = AutoTagger(album=True,
+                        review=DataStore(str(tmp_path / "review.yaml")),
+                        dry_run=True)
+    tagger.groups = []
+
+    def tag_album(tracks):
+        tagger.groups.append(sorted(os.path.basename(t.file) for t in tracks))
+        return iter(())
+
+    def tag_track(track):
+        tagger.groups.append(os.path.basename(track.file))
+        return "skipped", None
+
+    monkeypatch.setattr(tagger, "tag_album", tag_album)
+    monkeypatch.setattr(tagger, "tag_track", tag_track)
+    return tagger
+
+
+def test_albums_are_grouped_by_directory_artist_and_album(tmp_path, tagger):
+    files = {
+        "a/1.flac": dict(album="Album", albumartist="Band", artist="Band"),
+        "a/2.flac": dict(album="ALBUM!", albumartist="band", artist="Guest"),
+        "a/3.flac": dict(album="Other", albumartist="Band", artist="Band"),
+        "b/1.flac": dict(album="Album", albumartist="Band", artist="Band"),
+        # A compilation: no album artist, one track artist per file
+        "c/1.flac": dict(album="Hits", artist="One"),
+        "c/2.flac": dict(album="Hits", artist="Two"),
+        # Too few tags to look up as an album
+        "c/3.flac": dict(title="Loose"),
+    }
+    paths = []
+    for name, tags in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        paths.append(write_flac(path, **tags))
+
+    results = list(tagger._run_albums(paths))
+
+    assert results == [(paths[-1], "skipped", None)]
+    assert tagger.groups == [
+        ["1.flac", "2.flac"],
+        ["3.flac"],
+        ["1.flac"],
+        "3.flac",
+        ["1.flac", "2.flac"],
+    ]
+
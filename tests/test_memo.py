@@ -0,0 +1,157 @@
+"""In-process memoization of the provider searches."""
+
+import pickle
+
+import pytest
+
+from patangoma import memo
+from patangoma.memo import memoize
+
+
+class Clock:
+    """Stands in for the time module, at a time set by the test."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(memo, "time", clock)
+    return clock
+
+
+def counting(**options):
+    """A memoized search that records its calls."""
+    calls = []
+
+    @memoize(**options)
+    def search(title, artist=None, limit=10):
+        calls.append((title, artist, limit))
+        return [title] if title else []
+
+    return search, calls
+
+
+def test_calls_are_keyed_by_bound_arguments(clock):
+    search, calls = counting()
+
+    search("a", "b")
+    search("a", artist="b")
+    search(title="a", artist="b", limit=10)
+    search("a", "b", 5)
+
+    assert calls == [("a", "b", 10), ("a", "b", 5)]
+    assert search.cache_info()["hits"] == 2
+
+
+def test_unhashable_arguments_bypass_the_cache(clock):
+    search, calls = counting()
+
+    search(["a"])
+    search(["a"])
+
+    assert len(calls) == 2
+    assert search.cache_info()["size"] == 0
+
+
+def test_results_expire(clock):
+    search, calls = counting(ttl=100, negative_ttl=10)
+    search("match")
+    search("")
+
+    clock.now += 10
+    search("match")
+    search("")
+    assert len(calls) == 3
+
+    clock.now += 90
+    search("match")
+    assert len(calls) == 4
+
+
+def test_zero_negative_ttl_skips_empty_results(clock):
+    search, calls = counting(negative_ttl=0)
+
+    search("")
+    search("")
+
+    assert len(calls) == 2
+
+
+def test_entries_and_bytes_are_bounded(clock):
+    size = len(pickle.dumps(["x" * 100], protocol=pickle.HIGHEST_PROTOCOL))
+    search, calls = counting(maxsize=10, max_bytes=3 * size)
+
+    for title in "abcd":
+        search(title * 100)
+    info = search.cache_info()
+
+    assert info["size"] == 3
+    assert info["bytes"] == 3 * size
+    # The least recently used entry went first
+    search("a" * 100)
+    assert len(calls) == 5
+
+    search.invalidate()
+    assert search.cache_info()["bytes"] == 0
+
+
+def test_results_larger_than_the_bound_are_not_cached(clock):
+    search, calls = counting(max_bytes=50)
+
+    search("x" * 100)
+
+    assert search.cache_info()["size"] == 0
+
+
+def test_callers_get_their_own_copy(clock):
+    search, calls = counting()
+
+    first = search("a")
+    first.append("changed by caller")
+    second = search("a")
+    second.append("changed again")
+
+    assert search("a") == ["a"]
+    assert len(calls) == 1
+
+
+class Client:
+    def __init__(self):
+        self.calls = 0
+
+    @memoize(method=True)
+    def search(self, title, limit=10):
+        self.calls += 1
+        return [title]
+
+
+def test_methods_share_a_cache_across_instances(clock):
+    Client.search.invalidate()
+    first, second = Client(), Client()
+
+    first.search("a")
+    second.search("a", limit=10)
+
+    assert (first.calls, second.calls) == (1, 0)
+
+
+def test_method_invalidate_takes_arguments_without_the_instance(clock):
+    Client.search.invalidate()
+    client = Client()
+    client.search("a")
+    client.search("b")
+
+    Client.search.invalidate("a")
+    client.search("a")
+    client.search("b")
+
+    assert client.calls == 3
+    Client.search.invalidate(title="b", limit=10)
+    client.search("b")
+    assert client.calls == 4
@@ -0,0 +1,103 @@
+"""The provider clients against recorded mock server traffic."""
+
+import pytest
+
+from patangoma.dz import DeezerAPI
+from patangoma.mb import MusicBrainzAPI
+from patangoma.query import Query
+from patangoma.resilience import RETRY_ATTEMPTS, ProviderError
+from patangoma.sp import spotify_search
+from patangoma.transport import configure_transport
+
+from tests.conftest import FIXTURES
+
+
+@pytest.fixture
+def track(catalogue):
+    """A catalogue track on an album of several tracks."""
+    return catalogue.tracks[3]
+
+
+def test_deezer_search_track(transport, track):
+    results = DeezerAPI().search_track(track["title"],
+                                       track["artist"]["name"], None)
+
+    assert results
+    assert results[0]["title"] == track["title"]
+    assert results[0]["artist"]["name"] == track["artist"]["name"]
+
+
+def test_deezer_fetch_details(transport, track):
+    dz_api = DeezerAPI()
+    result = dz_api.search_track(track["title"], track["artist"]["name"],
+                                 None)[0]
+
+    details = dz_api.fetch_details(result)
+
+    assert details["title"] == track["title"]
+    assert details["album"] == track["album"]["title"]
+    assert details["isrc"] == track["isrc"]
+    assert details["track"] == track["position"]
+    assert details["art"]
+
+
+def test_musicbrainz_search_track(transport, track):
+    recordings = MusicBrainzAPI().search_track(track["title"],
+                                               track["artist"]["name"])
+
+    assert track["mbid"] in [recording["id"] for recording in recordings]
+
+
+def test_musicbrainz_get_release(transport, track):
+    album = track["album"]
+
+    release = MusicBrainzAPI().get_release(album["mbid"])
+
+    assert release["title"] == album["title"]
+    tracks = MusicBrainzAPI().release_tracks(release)
+    assert [t["title"] for t in tracks] == [t["title"] for t in album["tracks"]]
+
+
+def test_spotify_search(transport, track):
+    items, parsed = spotify_search(track["title"],
+                                   track["artist"]["name"],
+                                   verbose=False)
+
+    assert items[0]["id"] == track["spotify_id"]
+    assert parsed[0]["name"] == track["title"]
+    assert parsed[0]["artists"] == [track["artist"]["name"]]
+
+
+def test_query_search(transport, track):
+    query = Query()
+    title, artist = track["title"], track["artist"]["name"]
+
+    deezer = query.fetch_deezer_data(title, artist, None)
+    musicbrainz = query.fetch_musicbrainz_data(title, artist)
+
+    assert deezer[0]["title"] == title
+    assert musicbrainz[0]["title"] == title
+    assert musicbrainz[0]["artist"] == artist
+
+
+def test_query_search_is_cached(transport, track):
+    query = Query()
+    title, artist = track["title"], track["artist"]["name"]
+
+    query.fetch_deezer_data(title, artist, None)
+    requests = transport.requests
+    query.fetch_deezer_data(title, artist, None)
+
+    assert transport.requests == requests
+
+
+def test_injected_errors_raise_provider_error(transport, track):
+    if transport.mode == "record":
+        pytest.skip("errors are only injected into replayed traffic")
+    failing = configure_transport("replay", FIXTURES, error_rate=1.0)
+
+    with pytest.raises(ProviderError) as raised:
+        MusicBrainzAPI().search_track(track["title"], track["artist"]["name"])
+
+    assert raised.value.retryable
+    assert failing.injected == RETRY_ATTEMPTS
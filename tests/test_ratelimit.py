@@ -0,0 +1,182 @@
+"""Token buckets and Retry-After handling, on a simulated clock."""
+
+import email.utils
+
+import pytest
+
+from patangoma import endpoints, ratelimit, session
+from patangoma.ratelimit import (
+    MAX_RETRY_AFTER,
+    TokenBucket,
+    parse_retry_after,
+    provider_for_url,
+)
+from patangoma.session import RETRY_AFTER_ATTEMPTS, build_session
+from patangoma.transport import Transport
+
+
+class Clock:
+    """Stands in for the time module; sleeping does not advance it unless
+    `advance_on_sleep` is set, as if each caller were another thread."""
+
+    def __init__(self, advance_on_sleep: bool = False):
+        self.now = 1000.0
+        self.advance_on_sleep = advance_on_sleep
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return 1_700_000_000.0 + self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        if self.advance_on_sleep:
+            self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def test_concurrent_callers_are_spaced_evenly(clock):
+    bucket = TokenBucket(rate=4.0)
+
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits == [0.0, 0.25, 0.5, 0.75]
+    assert clock.sleeps == [0.25, 0.5, 0.75]
+
+
+def test_burst_is_served_at_once(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3.0)
+
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits == [0.0, 0.0, 0.0, 0.5]
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=2.0, capacity=3.0)
+    for _ in range(3):
+        bucket.acquire()
+
+    clock.now += 60
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits == [0.0, 0.0, 0.0, 0.5]
+
+
+def test_sequential_callers_wait_their_share(clock):
+    clock.advance_on_sleep = True
+    bucket = TokenBucket(rate=2.0)
+
+    for _ in range(5):
+        bucket.acquire()
+
+    assert clock.sleeps == [0.5] * 4
+    assert clock.now == 1002.0
+
+
+def test_try_acquire_does_not_wait(clock):
+    bucket = TokenBucket(rate=1.0)
+
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    clock.now += 1
+    assert bucket.try_acquire()
+    assert clock.sleeps == []
+
+
+def test_defer_holds_back_the_next_caller(clock):
+    bucket = TokenBucket(rate=1.0, capacity=5.0)
+
+    bucket.defer(3.0)
+
+    assert bucket.acquire() == 3.0
+    assert bucket.acquire() == 4.0
+
+
+def test_defer_does_not_shorten_a_longer_hold(clock):
+    bucket = TokenBucket(rate=1.0)
+    bucket.defer(10.0)
+
+    bucket.defer(2.0)
+
+    assert bucket.acquire() == 10.0
+
+
+def test_parse_retry_after(clock):
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-4") == 0.0
+    assert parse_retry_after("86400") == MAX_RETRY_AFTER
+
+    date = email.utils.formatdate(clock.time() + 30, usegmt=True)
+    assert parse_retry_after(date) == pytest.approx(30, abs=1)
+
+
+class ThrottlingTransport:
+    """Answers each request with the next of `statuses`."""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.sent = 0
+
+    def http(self, provider, request, send):
+        self.sent += 1
+        return Transport._response(request, self.statuses.pop(0),
+                                   {"Retry-After": "2"}, b"")
+
+
+def test_throttled_requests_hold_back_the_provider(clock, monkeypatch):
+    clock.advance_on_sleep = True
+    transport = ThrottlingTransport(429, 503, 200)
+    bucket = TokenBucket(rate=1.0)
+    monkeypatch.setattr(session, "get_transport", lambda: transport)
+    monkeypatch.setattr(ratelimit, "_limiters", {"deezer": bucket})
+
+    response = build_session().get("https://api.deezer.com/search")
+
+    assert response.status_code == 200
+    assert transport.sent == 3
+    # Each Retry-After of 2 seconds holds back the next request
+    assert clock.sleeps == [2.0, 2.0]
+
+
+def test_throttling_gives_up_after_the_last_attempt(clock, monkeypatch):
+    transport = ThrottlingTransport(*[429] * (RETRY_AFTER_ATTEMPTS + 1))
+    monkeypatch.setattr(session, "get_transport", lambda: transport)
+    monkeypatch.setattr(ratelimit, "_limiters",
+                        {"deezer": TokenBucket(rate=1.0)})
+
+    response = build_session().get("https://api.deezer.com/search")
+
+    assert response.status_code == 429
+    assert transport.sent == RETRY_AFTER_ATTEMPTS + 1
+
+
+@pytest.mark.parametrize("url, provider", [
+    ("https://api.deezer.com/search", "deezer"),
+    ("https://musicbrainz.org/ws/2/recording", "musicbrainz"),
+    ("https://cdn.example.com/cover.jpg", None),
+    # Providers sharing the mock server's base URL
+    ("http://127.0.0.1:8765/search", "deezer"),
+    ("http://127.0.0.1:8765/ws/2/recording", "musicbrainz"),
+    ("http://127.0.0.1:8765/v1/search", "spotify"),
+    ("http://127.0.0.1:8765/api/token", "spotify"),
+])
+def test_provider_for_url(url, provider, monkeypatch):
+    monkeypatch.setattr(endpoints, "_endpoints", {
+        "deezer": "http://127.0.0.1:8765",
+        "musicbrainz": "http://127.0.0.1:8765",
+        "spotify": "http://127.0.0.1:8765",
+        "discogs": None,
+    })
+
+    assert provider_for_url(url) == provider
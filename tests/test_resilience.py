@@ -0,0 +1,175 @@
+"""Retries and circuit breakers around provider requests."""
+
+import musicbrainzngs
+import pytest
+import requests
+
+from patangoma import resilience
+from patangoma.resilience import (
+    FAILURE_THRESHOLD,
+    RESET_TIMEOUT,
+    RETRY_ATTEMPTS,
+    CircuitOpenError,
+    ProviderError,
+    call,
+    get_breaker,
+)
+
+
+class Clock:
+    """Stands in for the time module; sleeping advances it."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", clock)
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 1.0)
+    return clock
+
+
+class Request:
+    """A request that raises each of `outcomes` in turn, then returns."""
+
+    def __init__(self, *outcomes, result="answer"):
+        self.outcomes = list(outcomes)
+        self.result = result
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.outcomes:
+            raise self.outcomes.pop(0)
+        return self.result
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def test_transient_failures_are_retried(clock):
+    request = Request(requests.ConnectionError("reset"), http_error(503))
+
+    assert call("deezer", request) == "answer"
+
+    assert request.calls == 3
+    assert clock.sleeps == [1.0, 1.0]
+    assert get_breaker("deezer").failures == 0
+
+
+def test_retries_are_bounded(clock):
+    request = Request(*[requests.Timeout("slow")] * 10)
+
+    with pytest.raises(ProviderError) as raised:
+        call("deezer", request)
+
+    assert raised.value.retryable
+    assert request.calls == RETRY_ATTEMPTS
+    assert len(clock.sleeps) == RETRY_ATTEMPTS - 1
+    assert get_breaker("deezer").failures == 1
+
+
+def test_client_errors_are_not_retried():
+    request = Request(http_error(400))
+
+    with pytest.raises(ProviderError) as raised:
+        call("deezer", request)
+
+    assert not raised.value.retryable
+    assert request.calls == 1
+    assert get_breaker("deezer").failures == 0
+
+
+@pytest.mark.parametrize("error", [
+    http_error(404),
+    musicbrainzngs.ResponseError(cause=type("Cause", (), {"code": 404})()),
+])
+def test_not_found_returns_the_not_found_value(error):
+    request = Request(error)
+
+    assert call("musicbrainz", request, not_found={}) == {}
+    assert request.calls == 1
+
+
+def test_bugs_propagate_unwrapped():
+    request = Request(KeyError("album"))
+
+    with pytest.raises(KeyError):
+        call("deezer", request)
+
+    assert request.calls == 1
+    assert get_breaker("deezer").failures == 0
+
+
+def fail(provider: str):
+    with pytest.raises(ProviderError):
+        call(provider, Request(*[requests.ConnectionError()] * RETRY_ATTEMPTS))
+
+
+def test_breaker_opens_then_half_opens_then_closes(clock):
+    breaker = get_breaker("spotify")
+    for _ in range(FAILURE_THRESHOLD):
+        assert breaker.state == "closed"
+        fail("spotify")
+    assert breaker.state == "open"
+
+    request = Request()
+    with pytest.raises(CircuitOpenError):
+        call("spotify", request)
+    assert request.calls == 0
+
+    clock.now += RESET_TIMEOUT
+    assert breaker.state == "half-open"
+    assert call("spotify", request) == "answer"
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = get_breaker("spotify")
+    for _ in range(FAILURE_THRESHOLD):
+        fail("spotify")
+    clock.now += RESET_TIMEOUT
+
+    fail("spotify")
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call("spotify", Request())
+
+
+def test_only_one_trial_at_a_time(clock):
+    breaker = get_breaker("spotify")
+    for _ in range(FAILURE_THRESHOLD):
+        fail("spotify")
+    clock.now += RESET_TIMEOUT
+
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_a_bug_during_the_trial_frees_it(clock):
+    breaker = get_breaker("spotify")
+    for _ in range(FAILURE_THRESHOLD):
+        fail("spotify")
+    clock.now += RESET_TIMEOUT
+
+    with pytest.raises(KeyError):
+        call("spotify", Request(KeyError("name")))
+
+    assert call("spotify", Request()) == "answer"
+    assert breaker.state == "closed"
@@ -0,0 +1,128 @@
+"""Saving tags: atomic writes and padding."""
+
+import glob
+import os
+
+import pytest
+from mediafile import MediaFile
+
+from patangoma import base
+from patangoma.base import BaseModel, save_stats
+
+from tests.conftest import write_flac
+
+
+@pytest.fixture
+def audio(tmp_path):
+    path = write_flac(tmp_path / "track.flac", title="Before")
+    os.chmod(path, 0o640)
+    os.utime(path, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+    return path
+
+
+def snapshot(path):
+    stat = os.stat(path)
+    with open(path, "rb") as f:
+        return f.read(), stat.st_mode, stat.st_mtime_ns
+
+
+def temporary_files(path):
+    return glob.glob(os.path.join(os.path.dirname(path), ".*.patangoma.tmp"))
+
+
+def test_atomic_save_keeps_the_file_mode(audio):
+    model = BaseModel(audio)
+    model.single_update_metadata("title", "After")
+
+    assert model.save(atomic=True, verify=True)
+
+    assert BaseModel(audio).metadata.title == "After"
+    assert os.stat(audio).st_mode & 0o777 == 0o640
+    assert temporary_files(audio) == []
+
+
+def test_failed_atomic_save_leaves_the_original(audio, monkeypatch):
+    before = snapshot(audio)
+    model = BaseModel(audio)
+    model.single_update_metadata("title", "After")
+
+    def crash(filename, **kwargs):
+        with open(filename, "r+b") as f:
+            f.write(b"half-written")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(model.metadata.mgfile, "save", crash)
+
+    assert not model.save(atomic=True)
+    assert snapshot(audio) == before
+    assert temporary_files(audio) == []
+
+
+def test_failed_verify_leaves_the_original(audio, monkeypatch):
+    before = snapshot(audio)
+    model = BaseModel(audio)
+    model.single_update_metadata("title", "After")
+
+    def unreadable(path):
+        raise ValueError(f"cannot parse {path}")
+
+    monkeypatch.setattr(base, "MediaFile", unreadable)
+
+    assert not model.save(atomic=True, verify=True)
+    assert snapshot(audio) == before
+    assert temporary_files(audio) == []
+
+
+@pytest.fixture
+def unpadded(tmp_path):
+    path = write_flac(tmp_path / "unpadded.flac", title="Short")
+    MediaFile(path).save(padding=lambda info: 0)
+    return path
+
+
+@pytest.fixture
+def stats():
+    save_stats.reset()
+    yield save_stats
+    save_stats.reset()
+
+
+def test_growing_unpadded_tags_reserves_padding(unpadded, stats):
+    size = os.path.getsize(unpadded)
+    model = BaseModel(unpadded)
+    model.single_update_metadata("title", "A much longer title")
+
+    assert model.save()
+
+    assert model.last_save == "rewrite"
+    assert os.path.getsize(unpadded) >= size + BaseModel.TAG_PADDING
+    assert stats.as_dict() == {"in_place": 0, "rewrites": 1, "avoided": 0}
+
+    size = os.path.getsize(unpadded)
+    model.single_update_metadata("title", "An even longer title than before")
+    # Mutagen would have shrunk the large reserve with a rewrite
+    assert model.save()
+
+    assert model.last_save == "in-place"
+    assert os.path.getsize(unpadded) == size
+    assert stats.as_dict() == {"in_place": 1, "rewrites": 1, "avoided": 1}
+
+
+def test_tags_filling_the_padding_exactly_are_rewritten(unpadded, stats):
+    model = BaseModel(unpadded)
+    # The same length as before leaves exactly no padding
+    model.single_update_metadata("title", "Shor7")
+
+    assert model.save(padding=4096)
+
+    assert model.last_save == "rewrite"
+    assert stats.as_dict()["rewrites"] == 1
+
+
+def test_unchanged_tags_are_not_saved(unpadded, stats):
+    model = BaseModel(unpadded)
+
+    assert model.save()
+
+    assert model.last_save is None
+    assert stats.as_dict() == {"in_place": 0, "rewrites": 0, "avoided": 0}